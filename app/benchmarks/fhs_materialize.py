@@ -0,0 +1,123 @@
+# benchmarks/fhs_materialize.py
+"""
+Benchmark: FHS-Materialisierung über ein großes, generiertes Layout.
+
+Vergleicht den bisherigen Ablauf (ein Path-Aufruf pro Eintrag, read_text/
+write_text für Quelldateien) mit FHSRootFSBuilder.
+
+    cd app && python -m benchmarks.fhs_materialize --dirs 5000 --files 20000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from modules.create_fhs_rootfs import FHSRootFSBuilder
+from modules.fhs_layout import FHSLayout
+
+
+def generate_layout(base: Path, dirs: int, files: int, sourced: int, symlinks: int, fanout: int = 8) -> FHSLayout:
+    """Erzeugt ein synthetisches Layout (Baum mit ``fanout`` Kindern pro Ebene)."""
+    directories = ["/usr"]
+    for i in range(1, dirs):
+        parent = directories[(i - 1) // fanout]
+        directories.append(f"{parent}/d{i}")
+
+    sources = base / "sources"
+    sources.mkdir(parents=True, exist_ok=True)
+    source_files = []
+    for i in range(max(sourced, 1)):
+        path = sources / f"blob{i}"
+        path.write_bytes(os.urandom(4096) * 4)
+        source_files.append(str(path))
+
+    entries = []
+    for i in range(files):
+        path = f"{directories[i % len(directories)]}/f{i}"
+        if i < sourced:
+            entries.append({"path": path, "source": source_files[i % len(source_files)]})
+        else:
+            entries.append({"path": path, "content": f"datei {i}\n"})
+
+    links = [{"link": f"{directories[i % len(directories)]}/l{i}", "target": f"f{i}"} for i in range(symlinks)]
+
+    layout = FHSLayout.from_data({"directories": directories, "files": entries, "symlinks": links})
+    # Rohdaten für legacy_build (unnormalisiert, wie aus der YAML)
+    layout.raw = {"directories": directories, "files": entries, "symlinks": links}
+    return layout
+
+
+def legacy_build(rootfs: Path, layout: FHSLayout):
+    """Bisheriger Ablauf, nachgebaut als Vergleichsbasis."""
+    raw = layout.raw
+    for d in raw["directories"]:
+        (rootfs / d.lstrip("/")).mkdir(parents=True, exist_ok=True)
+    (rootfs / "var/lib/pacman/sync").mkdir(parents=True, exist_ok=True)
+    for f in raw["files"]:
+        target = rootfs / f["path"].lstrip("/")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if "content" in f:
+            target.write_text(f["content"])
+        elif "source" in f:
+            target.write_text(Path(f["source"]).read_text(errors="surrogateescape"), errors="surrogateescape")
+        else:
+            target.touch()
+    for s in raw["symlinks"]:
+        link_path = rootfs / s["link"].lstrip("/")
+        if link_path.exists():
+            link_path.unlink()
+        link_path.parent.mkdir(parents=True, exist_ok=True)
+        os.symlink(s["target"], link_path)
+
+
+def engine_build(rootfs: Path, layout: FHSLayout, jobs: int | None = None):
+    FHSRootFSBuilder(rootfs, layout, jobs=jobs).build()
+
+
+def measure(func, rootfs: Path, layout: FHSLayout, repeat: int) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        shutil.rmtree(rootfs, ignore_errors=True)
+        rootfs.mkdir(parents=True)
+        start = time.perf_counter()
+        func(rootfs, layout)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main(argv: list[str] | None = None) -> dict[str, list[float]]:
+    parser = argparse.ArgumentParser(description="FHS-Materialisierung Benchmark")
+    parser.add_argument("--dirs", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--sourced", type=int, default=1000)
+    parser.add_argument("--symlinks", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--workdir", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    base = Path(tempfile.mkdtemp(prefix="fhs-bench-", dir=args.workdir))
+    try:
+        layout = generate_layout(base, args.dirs, args.files, args.sourced, args.symlinks)
+        rootfs = base / "rootfs"
+        results = {
+            "legacy": measure(legacy_build, rootfs, layout, args.repeat),
+            "engine": measure(lambda r, l: engine_build(r, l, args.jobs), rootfs, layout, args.repeat),
+        }
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    print(f"\nLayout: {args.dirs} Verzeichnisse, {args.files} Dateien ({args.sourced} mit Quelle), "
+          f"{args.symlinks} Symlinks")
+    for name, times in results.items():
+        print(f"  {name:<8} median {statistics.median(times):.3f}s  min {min(times):.3f}s")
+    speedup = statistics.median(results["legacy"]) / statistics.median(results["engine"])
+    print(f"  Faktor  {speedup:.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# benchmarks/suite.py
+"""
+Benchmark-Suite: FHS-Aufbau, Paket-Extraktion, extract_archive und
+.config-Patchen über synthetische Eingaben (offline).
+
+Für jedes Subsystem werden Latenz-Perzentile und Durchsatz gemessen, als
+JSON gespeichert und optional mit einer Baseline verglichen; langsamere
+Mediane über der Toleranz gelten als Regression (Exit-Code 1).
+
+    cd app && python -m benchmarks.suite --scale small --output bench.json
+    cd app && python -m benchmarks.suite --baseline bench.json --tolerance 0.10
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from benchmarks import workloads
+from core.kconfig import KConfig
+from manager.extractor import PackageExtractor
+from modules.create_fhs_rootfs import FHSRootFSBuilder
+from utils.download import extract_archive
+from utils.logger import configure_logging
+from utils.zstd import HAVE_ZSTD
+
+SCALES = {
+    "small": {
+        "fhs_entries": 10_000, "packages": 20, "pkg_files": 50, "pkg_file_size": 16 * 1024,
+        "tarball_files": 2_000, "tarball_file_size": 8 * 1024, "config_options": 5_000, "repeat": 3,
+    },
+    "medium": {
+        "fhs_entries": 100_000, "packages": 100, "pkg_files": 100, "pkg_file_size": 32 * 1024,
+        "tarball_files": 10_000, "tarball_file_size": 16 * 1024, "config_options": 20_000, "repeat": 5,
+    },
+    "large": {
+        "fhs_entries": 1_000_000, "packages": 300, "pkg_files": 200, "pkg_file_size": 32 * 1024,
+        "tarball_files": 50_000, "tarball_file_size": 16 * 1024, "config_options": 100_000, "repeat": 3,
+    },
+}
+SUBSYSTEMS = ("fhs", "packages", "archive", "kconfig")
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """Perzentil nach Nearest-Rank (stabil auch für wenige Messungen)."""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+@dataclass
+class BenchResult:
+    name: str
+    # Einheit der Arbeit pro Messung (z.B. "Einträge", "Bytes")
+    unit: str
+    # Arbeit pro Messung; Durchsatz = work / Latenz
+    work: float
+    samples: list[float] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        median = statistics.median(self.samples)
+        return {
+            "unit": self.unit,
+            "work": self.work,
+            "runs": len(self.samples),
+            **{f"p{p}": percentile(self.samples, p) for p in PERCENTILES},
+            "min": min(self.samples),
+            "max": max(self.samples),
+            "mean": statistics.fmean(self.samples),
+            "throughput": self.work / median if median else 0.0,
+        }
+
+
+def _timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _fresh(path: Path) -> Path:
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+    return path
+
+
+# -------------------------------------------------------------
+# Subsysteme
+# -------------------------------------------------------------
+def bench_fhs(base: Path, params: dict, jobs: int | None) -> list[BenchResult]:
+    entries = params["fhs_entries"]
+    layout = workloads.fhs_layout(base / "fhs-src", entries)
+    result = BenchResult("fhs.build", "Einträge", entries)
+    for _ in range(params["repeat"]):
+        rootfs = _fresh(base / "fhs-rootfs")
+        result.samples.append(_timed(lambda: FHSRootFSBuilder(rootfs, layout, jobs=jobs).build()))
+    shutil.rmtree(base / "fhs-rootfs", ignore_errors=True)
+    return [result]
+
+
+def bench_packages(base: Path, params: dict, jobs: int | None) -> list[BenchResult]:
+    """
+    Disjunkte Pakete messen den parallelen Durchsatz (jedes Paket eine eigene
+    Gruppe); ``overlap`` teilt Pfade zwischen allen Paketen und landet damit
+    in einer seriellen Gruppe samt Konfliktbehandlung.
+    """
+    size = params["packages"] * params["pkg_files"] * params["pkg_file_size"]
+    results = []
+    for case, shared in (("", 0), (".overlap", 2)):
+        pkgs = workloads.make_packages(base / f"pkgs{case}", params["packages"], params["pkg_files"],
+                                       params["pkg_file_size"], shared=shared)
+        for backend in ("python", "bsdtar") if HAVE_ZSTD else ("bsdtar",):
+            if backend == "bsdtar" and not shutil.which("bsdtar"):
+                continue
+            name = f"packages.extract.{backend}{case}"
+            wall = BenchResult(name, "Bytes", size)
+            per_package = BenchResult(f"{name}.per_package", "Bytes", size / len(pkgs))
+            for _ in range(params["repeat"]):
+                rootfs = _fresh(base / "pkg-rootfs")
+                extractor = PackageExtractor(rootfs, jobs=jobs, backend=backend)
+                start = time.perf_counter()
+                extracted = extractor.extract_all(pkgs)
+                wall.samples.append(time.perf_counter() - start)
+                per_package.samples.extend(r.seconds for r in extracted)
+            results += [wall, per_package]
+    shutil.rmtree(base / "pkg-rootfs", ignore_errors=True)
+    return results
+
+
+def bench_archive(base: Path, params: dict, jobs: int | None) -> list[BenchResult]:
+    size = params["tarball_files"] * params["tarball_file_size"]
+    results = []
+    for compression in ("gz", "zst") if HAVE_ZSTD else ("gz",):
+        tarball = workloads.make_tarball(base / "tarballs", compression, params["tarball_files"],
+                                         params["tarball_file_size"])
+        result = BenchResult(f"archive.extract.{compression}", "Bytes", size)
+        for _ in range(params["repeat"]):
+            target = _fresh(base / "archive-out")
+            result.samples.append(_timed(lambda: extract_archive(tarball, target)))
+        results.append(result)
+    shutil.rmtree(base / "archive-out", ignore_errors=True)
+    return results
+
+
+def bench_kconfig(base: Path, params: dict, jobs: int | None) -> list[BenchResult]:
+    """Gleicher Ablauf wie BusyBoxBuilder._patch_config: laden, patchen, Diff, schreiben."""
+    options = params["config_options"]
+    source, patches = workloads.make_config(base / "config.orig", options)
+    target = base / ".config"
+    result = BenchResult("kconfig.patch", "Optionen", options)
+
+    def patch():
+        cfg = KConfig.load(target)
+        cfg.apply(patches)
+        if cfg.diff():
+            cfg.write(target)
+
+    for _ in range(params["repeat"] * 10):
+        shutil.copyfile(source, target)
+        result.samples.append(_timed(patch))
+    return [result]
+
+
+BENCHMARKS = {"fhs": bench_fhs, "packages": bench_packages, "archive": bench_archive, "kconfig": bench_kconfig}
+
+
+# -------------------------------------------------------------
+# Ausgabe & Baseline
+# -------------------------------------------------------------
+def _rate(value: float, unit: str) -> str:
+    if unit == "Bytes":
+        return f"{value / 2**20:10.1f} MiB/s"
+    return f"{value:10.0f} {unit}/s"
+
+
+def print_results(results: dict[str, dict]):
+    print(f"\n{'Benchmark':<46} {'p50':>9} {'p90':>9} {'p99':>9} {'Durchsatz':>18}")
+    for name, summary in results.items():
+        print(f"{name:<46} {summary['p50']:8.4f}s {summary['p90']:8.4f}s {summary['p99']:8.4f}s "
+              f"{_rate(summary['throughput'], summary['unit'])}")
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """Vergleicht Mediane mit der Baseline; liefert die Namen der Regressionen."""
+    regressions = []
+    print(f"\n{'Benchmark':<46} {'Baseline':>10} {'Aktuell':>10} {'Änderung':>9}")
+    for name, summary in results.items():
+        old = baseline.get(name)
+        if not old or not old.get("p50"):
+            print(f"{name:<46} {'-':>10} {summary['p50']:9.4f}s {'neu':>9}")
+            continue
+        change = summary["p50"] / old["p50"] - 1
+        mark = ""
+        if change > tolerance:
+            regressions.append(name)
+            mark = "  REGRESSION"
+        print(f"{name:<46} {old['p50']:9.4f}s {summary['p50']:9.4f}s {change:+8.1%}{mark}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="NexuzCore Benchmark-Suite")
+    parser.add_argument("--scale", choices=SCALES.keys(), default="small")
+    parser.add_argument("--only", type=str, default=",".join(SUBSYSTEMS),
+                        help=f"Kommagetrennte Auswahl aus {', '.join(SUBSYSTEMS)}")
+    parser.add_argument("--fhs-entries", type=int, default=None, help="Überschreibt die Layout-Größe (10k–1M)")
+    parser.add_argument("--packages", type=int, default=None, help="Anzahl synthetischer Pakete")
+    parser.add_argument("--pkg-size", type=int, default=None, help="Dateigröße in Paketen (Bytes)")
+    parser.add_argument("--repeat", type=int, default=None)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--workdir", type=str, default=None)
+    parser.add_argument("--output", type=str, default=None, help="Ergebnisse als JSON speichern")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON einer früheren Messung zum Vergleich")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Erlaubte Verlangsamung des Medians (0.10 = 10%%)")
+    parser.add_argument("--verbose", action="store_true", help="Log-Ausgaben der Subsysteme zeigen")
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unbekannte Subsysteme: {', '.join(unknown)}")
+    params = dict(SCALES[args.scale])
+    for key, value in (("fhs_entries", args.fhs_entries), ("packages", args.packages),
+                       ("pkg_file_size", args.pkg_size), ("repeat", args.repeat)):
+        if value is not None:
+            params[key] = value
+    if not args.verbose:
+        configure_logging(level="WARNING")
+
+    base = Path(tempfile.mkdtemp(prefix="nexuz-bench-", dir=args.workdir))
+    results: dict[str, dict] = {}
+    try:
+        for name in selected:
+            print(f"[bench] {name} ...", flush=True)
+            for result in BENCHMARKS[name](base, params, args.jobs):
+                results[result.name] = result.summary()
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    print_results(results)
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "params": params,
+            "jobs": args.jobs or os.cpu_count(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nErgebnisse gespeichert: {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("meta", {}).get("params") != params:
+            print("Warnung: Baseline wurde mit anderen Parametern gemessen")
+        regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} Regression(en): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
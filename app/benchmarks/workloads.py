@@ -0,0 +1,146 @@
+# benchmarks/workloads.py
+"""
+Synthetische, reproduzierbare Eingaben für die Benchmarks (offline).
+
+Alle Generatoren sind über ``seed`` deterministisch, damit Läufe gegen eine
+gespeicherte Baseline vergleichbar bleiben.
+"""
+import gzip
+import io
+import random
+import tarfile
+from pathlib import Path
+
+from benchmarks.fhs_materialize import generate_layout
+from modules.fhs_layout import FHSLayout
+from utils.zstd import open_zstd_writer
+
+# Feste mtime, damit generierte Archive bitgleich sind
+EPOCH = 1_700_000_000
+
+
+def fhs_layout(base: Path, entries: int) -> FHSLayout:
+    """Layout mit ``entries`` Einträgen: 10% Verzeichnisse, 80% Dateien, 10% Symlinks."""
+    dirs = max(entries // 10, 1)
+    symlinks = entries // 10
+    files = max(entries - dirs - symlinks, 0)
+    return generate_layout(base, dirs, files, sourced=min(files // 100, 1000), symlinks=symlinks)
+
+
+def _payload(rng: random.Random, size: int) -> bytes:
+    # Halb zufällig, halb wiederholt – grob wie echte Binaries/Textdateien komprimierbar
+    half = size // 2
+    return rng.randbytes(half) + b"nexuzcore " * ((size - half) // 10 + 1)
+
+
+def _add(tar: tarfile.TarFile, name: str, data: bytes, mode: int = 0o644):
+    member = tarfile.TarInfo(name)
+    member.size, member.mode, member.mtime = len(data), mode, EPOCH
+    tar.addfile(member, io.BytesIO(data))
+
+
+def _add_dir(tar: tarfile.TarFile, name: str):
+    member = tarfile.TarInfo(name)
+    member.type, member.mode, member.mtime = tarfile.DIRTYPE, 0o755, EPOCH
+    tar.addfile(member)
+
+
+def _mtree(dirs: list[str], files: dict[str, bytes]) -> bytes:
+    lines = ["#mtree", "/set type=file uid=0 gid=0 mode=644"]
+    lines += [f"./{d} time={EPOCH}.0 mode=755 type=dir" for d in dirs]
+    lines += [f"./{name} time={EPOCH}.0 size={len(data)}" for name, data in files.items()]
+    return gzip.compress(("\n".join(lines) + "\n").encode(), mtime=0)
+
+
+def make_package(dest: Path, name: str, files: int, file_size: int, seed: int = 0,
+                 shared: int = 0) -> Path:
+    """
+    Schreibt ``name-1.0-1-x86_64.pkg.tar.zst`` mit .PKGINFO, .MTREE und
+    ``files`` Dateien à ``file_size`` Bytes. ``shared`` Dateien liegen unter
+    gemeinsamen Pfaden und erzeugen Überschneidungen mit anderen Paketen.
+    """
+    rng = random.Random(f"{seed}:{name}")
+    dirs = ["usr", "usr/bin", "usr/lib", f"usr/share/{name}", "usr/share"]
+    contents = {}
+    for i in range(files):
+        if i < shared:
+            path = f"usr/share/common/file{i}"
+        elif i % 3 == 0:
+            path = f"usr/bin/{name}-{i}"
+        elif i % 3 == 1:
+            path = f"usr/lib/lib{name}-{i}.so"
+        else:
+            path = f"usr/share/{name}/data{i}"
+        contents[path] = _payload(rng, file_size)
+    if shared:
+        dirs.append("usr/share/common")
+
+    pkginfo = f"pkgname = {name}\npkgver = 1.0-1\narch = x86_64\nsize = {files * file_size}\n".encode()
+    path = dest / f"{name}-1.0-1-x86_64.pkg.tar.zst"
+    with open(path, "wb") as raw:
+        writer = open_zstd_writer(raw, level=3, threads=1)
+        with tarfile.open(fileobj=writer, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+            _add(tar, ".PKGINFO", pkginfo)
+            _add(tar, ".MTREE", _mtree(sorted(set(dirs)), contents))
+            for d in sorted(set(dirs)):
+                _add_dir(tar, d)
+            for member, data in contents.items():
+                _add(tar, member, data, 0o755 if member.startswith("usr/bin/") else 0o644)
+        writer.close()
+    return path
+
+
+def make_packages(dest: Path, count: int, files: int, file_size: int, shared: int = 0,
+                  seed: int = 0) -> list[Path]:
+    dest.mkdir(parents=True, exist_ok=True)
+    return [make_package(dest, f"bench{i:04d}", files, file_size, seed, shared) for i in range(count)]
+
+
+def make_tarball(dest: Path, compression: str, files: int, file_size: int, seed: int = 0) -> Path:
+    """Quell-Tarball wie ein Upstream-Release (``src-1.0/...``) für extract_archive."""
+    rng = random.Random(f"{seed}:tarball")
+    suffix = {"gz": ".tar.gz", "xz": ".tar.xz", "zst": ".tar.zst", "": ".tar"}[compression]
+    path = dest / f"src-1.0{suffix}"
+    dest.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as raw:
+        writer = open_zstd_writer(raw, level=3, threads=1) if compression == "zst" else raw
+        mode = f"w|{compression}" if compression in ("gz", "xz") else "w|"
+        with tarfile.open(fileobj=writer, mode=mode, format=tarfile.GNU_FORMAT) as tar:
+            _add_dir(tar, "src-1.0")
+            for d in range(max(files // 50, 1)):
+                _add_dir(tar, f"src-1.0/dir{d}")
+            for i in range(files):
+                _add(tar, f"src-1.0/dir{i % max(files // 50, 1)}/file{i}.c", _payload(rng, file_size))
+        if writer is not raw:
+            writer.close()
+    return path
+
+
+def make_config(path: Path, options: int, seed: int = 0) -> tuple[Path, dict[str, str]]:
+    """
+    Große fake ``.config`` (Kconfig-Format) plus ein Patch-Satz, der jeden
+    zehnten Schlüssel ändert und einige neue hinzufügt.
+    """
+    rng = random.Random(f"{seed}:config")
+    lines = ["#", "# Automatically generated file; DO NOT EDIT.", "# Benchmark Configuration", "#"]
+    patches = {}
+    for i in range(options):
+        key = f"CONFIG_BENCH_OPTION_{i}"
+        kind = rng.random()
+        if kind < 0.4:
+            lines.append(f"{key}=y")
+        elif kind < 0.7:
+            lines.append(f"# {key} is not set")
+        elif kind < 0.85:
+            lines.append(f'{key}="value{i}"')
+        else:
+            lines.append(f"{key}={rng.randint(0, 1 << 16)}")
+        if i % 10 == 0:
+            patches[key] = rng.choice(["y", "n", f'"patched{i}"'])
+        if i % 500 == 0:
+            lines.append("")
+            lines.append(f"# Section {i // 500}")
+    for i in range(max(options // 100, 1)):
+        patches[f"CONFIG_BENCH_NEW_{i}"] = "y"
+    path.write_text("\n".join(lines) + "\n")
+    return path, patches
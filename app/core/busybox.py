@@ -4,16 +4,21 @@
 
 import os
 import json
+import hashlib
+import shutil
 import multiprocessing
 from pathlib import Path
 from utils.download import download_file, extract_archive
-from utils.execute import run_command_live
+from utils.execute import get_executor, run_command_live
+from utils.fscopy import copy_tree
+from utils.reproducible import ROOT_OWNER, normalize_tree
+from core.kconfig import KConfig
 from utils.logger import *
 
 DEFAULT_PATCH = {"CONFIG_TC": "n", "CONFIG_STATIC": "y"}
 
 class BusyBoxBuilder:
-    def __init__(self, json_path: Path, paths: dict, arch: str | None = None):
+    def __init__(self, json_path: Path, paths: dict, arch: str | None = None, epoch: int | None = None):
         self.json_path = Path(json_path)
         if not self.json_path.exists():
             raise FileNotFoundError(f"BusyBox JSON nicht gefunden: {self.json_path}")
@@ -35,6 +40,15 @@ class BusyBoxBuilder:
         self.downloads_dir = Path(self.downloads_path)
         self.rootfs_dir = Path(self.rootfs_path)
         self.src_dir_template = self.work_path / f"busybox-{self.version}"
+        # Build-Artefakt-Cache: <cache>/busybox/<key>/{busybox,install/,config}
+        self.artifact_cache = Path(paths.cache) / "busybox"
+        # Out-of-Tree Builddirs (O=) pro Arch/Konfiguration und gemeinsamer ccache
+        self.build_root = Path(paths.build)
+        self.ccache_dir = Path(paths.cache) / "ccache"
+        # Cache-Eintrag des letzten compile()
+        self.artifact: Path | None = None
+        # Reproduzierbarer Modus: installierte Einträge mit mtime ≤ epoch, Besitzer root
+        self.epoch = epoch
 
         if self.arch != "x86_64":
             self.cross_compile.setdefault("compiler_prefix", "aarch64-linux-gnu-")
@@ -53,32 +67,77 @@ class BusyBoxBuilder:
                 patch_dict[key.strip()] = val.strip()
         return patch_dict
 
+    def _patch_config(self, build_dir: Path) -> list[str]:
+        """Patcht .config in einem Durchlauf und schreibt den Diff nach .config.diff."""
+        cfg_file = build_dir / ".config"
+        if not cfg_file.exists():
+            raise FileNotFoundError(f".config nicht gefunden in {build_dir}")
+        patches = {**DEFAULT_PATCH, **self.config_patches, **self.extra_cfg}
+        cfg = KConfig.load(cfg_file)
+        cfg.apply(patches)
+        diff = cfg.diff()
+        if diff:
+            cfg.write(cfg_file)
+        (build_dir / ".config.diff").write_text("\n".join(diff) + "\n" if diff else "")
+        for line in diff:
+            debug("[.config] %s", line)
+        success(f"BusyBox .config gepatcht: {list(patches.keys())} ({len(cfg.changes)} Änderungen)")
+        return diff
+
+    # -------------------------------------------------------------
+    # Build-Artefakt-Cache
+    # -------------------------------------------------------------
     @staticmethod
-    def _set_config_option(cfg_file: Path, key: str, value: str):
-        lines = cfg_file.read_text().splitlines()
-        for i, line in enumerate(lines):
-            if line.startswith(f"{key}="):
-                lines[i] = f"{key}={value}"
-                break
-        else:
-            lines.append(f"{key}={value}")
-        cfg_file.write_text("\n".join(lines) + "\n")
+    def _compiler_version(env: dict) -> str:
+        compiler = f"{env.get('CROSS_COMPILE', '')}gcc"
+        result = get_executor().run([compiler, "--version"], env=env, capture=True, log=False,
+                                    desc=f"{compiler} --version")
+        lines = result.stdout.decode(errors="replace").splitlines() if result.ok else []
+        return lines[0] if lines else "unknown"
 
-    def _patch_config(self, busybox_src_dir: Path):
-        cfg_file = busybox_src_dir / ".config"
-        if not cfg_file.exists():
-            raise FileNotFoundError(f".config nicht gefunden in {busybox_src_dir}")
-        for key, val in {**DEFAULT_PATCH, **self.config_patches, **self.extra_cfg}.items():
-            self._set_config_option(cfg_file, key, val)
-        success(f"BusyBox .config gepatcht: {list({**DEFAULT_PATCH, **self.config_patches, **self.extra_cfg}.keys())}")
+    def cache_key(self, cfg_file: Path, env: dict) -> str:
+        """Hash über Version, finale .config, Toolchain-Variablen und Compiler-Version."""
+        digest = hashlib.sha256()
+        for part in (
+            self.version,
+            self.arch,
+            cfg_file.read_text(),
+            env.get("CROSS_COMPILE", ""),
+            env.get("CFLAGS", ""),
+            env.get("LDFLAGS", ""),
+            self._compiler_version(env),
+            # Build-Zeitstempel im Banner folgt SOURCE_DATE_EPOCH (nur wenn gesetzt)
+            *([env["SOURCE_DATE_EPOCH"]] if "SOURCE_DATE_EPOCH" in env else []),
+        ):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _install_from_cache(self, entry: Path, target: Path):
+        count = copy_tree(entry / "install", target, method="reflink")
+        success(f"BusyBox aus Cache übernommen ({entry.name[:12]}, {count} Einträge)")
+
+    def _store_in_cache(self, build_dir: Path, cfg_file: Path, staging: Path, key: str) -> Path:
+        entry = self.artifact_cache / key
+        shutil.copy2(build_dir / "busybox", staging / "busybox")
+        shutil.copy2(cfg_file, staging / "config")
+        if (build_dir / ".config.diff").exists():
+            shutil.copy2(build_dir / ".config.diff", staging / "config.diff")
+        (staging / "meta.json").write_text(json.dumps({"version": self.version, "arch": self.arch}))
+        if entry.exists():
+            shutil.rmtree(staging)
+        else:
+            os.replace(staging, entry)
+        return entry
 
-    def create_symlinks(self):
-        busybox_path = self.rootfs_dir / "bin/busybox"
+    def create_symlinks(self, target: Path | None = None):
+        target = Path(target or self.rootfs_dir)
+        busybox_path = target / "bin/busybox"
         if not busybox_path.exists():
             warning(f"BusyBox Binary nicht gefunden in {busybox_path}, Symlinks übersprungen")
             return
-        sbin_init = self.rootfs_dir / "sbin/init"
-        sh_link = self.rootfs_dir / "bin/sh"
+        sbin_init = target / "sbin/init"
+        sh_link = target / "bin/sh"
         sbin_init.parent.mkdir(parents=True, exist_ok=True)
         if not sbin_init.exists():
             sbin_init.symlink_to("../bin/busybox")
@@ -86,32 +145,144 @@ class BusyBoxBuilder:
             sh_link.symlink_to("busybox")
         success("[SUCCESS] BusyBox Symlinks erstellt")
 
-    def build(self):
+    # -------------------------------------------------------------
+    # Quellbaum & Out-of-Tree Builddir
+    # -------------------------------------------------------------
+    def prepare_source(self) -> Path:
+        """Lädt und entpackt den Quellbaum einmal; alle Builds teilen ihn (read-only)."""
         self.downloads_dir.mkdir(parents=True, exist_ok=True)
         self.work_dir.mkdir(parents=True, exist_ok=True)
-        self.rootfs_dir.mkdir(parents=True, exist_ok=True)
-
-        tarball = download_file(self.urls, self.downloads_path)
-        extracted_dir = extract_archive(tarball, self.work_path)
         busybox_src_dir = Path(self.src_dir_template).with_name(f"busybox-{self.version}")
 
-        scripts_dir = busybox_src_dir / "scripts"
-        if scripts_dir.exists():
-            for root, dirs, files in os.walk(scripts_dir):
-                for f in files:
-                    file_path = Path(root) / f
-                    file_path.chmod(file_path.stat().st_mode | 0o111)
+        if not (busybox_src_dir / "Makefile").exists():
+            tarball = download_file(self.urls, self.downloads_path)
+            extract_archive(tarball, self.work_path)
+
+            scripts_dir = busybox_src_dir / "scripts"
+            if scripts_dir.exists():
+                for root, dirs, files in os.walk(scripts_dir):
+                    for f in files:
+                        file_path = Path(root) / f
+                        file_path.chmod(file_path.stat().st_mode | 0o111)
+        else:
+            debug(f"BusyBox Quellbaum vorhanden: {busybox_src_dir}")
+
+        # Alte In-Tree-Builds blockieren O= ("source tree is not clean")
+        if (busybox_src_dir / ".config").exists():
+            run_command_live(["make", "mrproper"], cwd=busybox_src_dir, desc="BusyBox Quellbaum bereinigen")
+        return busybox_src_dir
+
+    def variant_hash(self) -> str:
+        """Hash der Konfigurations-Eingaben; bestimmt das Builddir pro Variante."""
+        data = json.dumps({
+            "arch": self.arch,
+            "cross_compile": self.cross_compile,
+            "patches": {**DEFAULT_PATCH, **self.config_patches, **self.extra_cfg},
+        }, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()[:12]
+
+    def build_dir(self) -> Path:
+        return self.build_root / f"busybox-{self.version}-{self.arch}-{self.variant_hash()}"
+
+    # -------------------------------------------------------------
+    # Compiler-Cache (ccache)
+    # -------------------------------------------------------------
+    def _ccache_env(self, env: dict) -> list[str]:
+        """Aktiviert ccache, falls gewünscht und vorhanden; liefert zusätzliche make-Argumente."""
+        wanted = self.cross_compile.get("ccache", True)
+        launcher = shutil.which("ccache") if wanted else None
+        if not launcher:
+            return []
+        env["CCACHE_DIR"] = str(self.ccache_dir)
+        # Builddirs verschiedener Varianten teilen sich die Cache-Einträge
+        env["CCACHE_BASEDIR"] = str(self.work_dir.parent)
+        env["CCACHE_NOHASHDIR"] = "1"
+        self.ccache_dir.mkdir(parents=True, exist_ok=True)
+        # Nur den Compiler wrappen – $(CROSS_COMPILE) gilt auch für ar/strip/ld
+        return [f"CC={launcher} {env['CROSS_COMPILE']}gcc"]
+
+    @staticmethod
+    def _ccache_stats(env: dict) -> dict[str, int]:
+        result = get_executor().run(["ccache", "--print-stats"], env=env, capture=True, log=False)
+        if result.returncode == 127:
+            return {}
+        stats = {}
+        for line in result.stdout.decode(errors="replace").splitlines():
+            key, _, value = line.partition("\t")
+            if value.strip().isdigit():
+                stats[key] = int(value)
+        return stats
+
+    def _log_ccache(self, before: dict[str, int], after: dict[str, int]):
+        delta = lambda k: after.get(k, 0) - before.get(k, 0)
+        hits = delta("direct_cache_hit") + delta("preprocessed_cache_hit")
+        misses = delta("cache_miss")
+        if hits + misses:
+            info(f"ccache: {hits} Treffer, {misses} Fehlschläge ({100 * hits / (hits + misses):.1f}% Trefferquote)")
+        else:
+            info("ccache: keine Compiler-Aufrufe (Build war aktuell)")
+
+    def compile(self) -> Path:
+        """
+        Konfiguriert und kompiliert BusyBox out-of-tree (bzw. nimmt den Cache)
+        und liefert den Cache-Eintrag. Schreibt nicht ins RootFS.
+        """
+        busybox_src_dir = self.prepare_source()
+        build_dir = self.build_dir()
+        build_dir.mkdir(parents=True, exist_ok=True)
+        info(f"BusyBox Out-of-Tree Build: {build_dir}")
 
         env = os.environ.copy()
         env["ARCH"] = self.arch
         env["CROSS_COMPILE"] = self.cross_compile.get("compiler_prefix", "")
         env["CFLAGS"] = self.cross_compile.get("cflags", "")
         env["LDFLAGS"] = self.cross_compile.get("ldflags", "")
+        make = ["make", f"O={build_dir}"]
 
-        run_command_live(["make", "defconfig"], cwd=busybox_src_dir, env=env, desc="BusyBox defconfig")
-        self._patch_config(busybox_src_dir)
-        run_command_live(["make", "oldconfig", "KCONFIG_ALLCONFIG=/dev/null"], cwd=busybox_src_dir, env=env, desc="BusyBox oldconfig")
-        run_command_live(["make", f"-j{multiprocessing.cpu_count()}"], cwd=busybox_src_dir, env=env, desc="BusyBox kompilieren")
-        run_command_live(["make", f"CONFIG_PREFIX={self.rootfs_path}", "install"], cwd=busybox_src_dir, env=env, desc="BusyBox installieren")
-        self.create_symlinks()
-        success(f"✅ BusyBox {self.version} erfolgreich installiert in {self.rootfs_path}")
+        run_command_live(make + ["defconfig"], cwd=busybox_src_dir, env=env, desc="BusyBox defconfig")
+        self._patch_config(build_dir)
+        run_command_live(make + ["oldconfig", "KCONFIG_ALLCONFIG=/dev/null"], cwd=busybox_src_dir, env=env, desc="BusyBox oldconfig")
+
+        cfg_file = build_dir / ".config"
+        key = self.cache_key(cfg_file, env)
+        entry = self.artifact_cache / key
+        if (entry / "install").is_dir() and (entry / "busybox").is_file():
+            info(f"BusyBox Cache-Treffer: {key[:12]}")
+            self.artifact = entry
+            return entry
+
+        info(f"BusyBox Cache-Fehlschlag: {key[:12]}, kompiliere ...")
+        staging = self.artifact_cache / f".{key}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+
+        ccache_args = self._ccache_env(env)
+        make += ccache_args
+        stats_before = self._ccache_stats(env) if ccache_args else {}
+        built = run_command_live(make + [f"-j{multiprocessing.cpu_count()}"], cwd=busybox_src_dir, env=env, desc="BusyBox kompilieren")
+        installed = built and run_command_live(make + [f"CONFIG_PREFIX={staging / 'install'}", "install"], cwd=busybox_src_dir, env=env, desc="BusyBox installieren")
+        if ccache_args:
+            self._log_ccache(stats_before, self._ccache_stats(env))
+        if not installed:
+            # Unvollständige Builds nie in den Cache übernehmen
+            shutil.rmtree(staging, ignore_errors=True)
+            raise RuntimeError(f"BusyBox {self.version} Build fehlgeschlagen")
+        self.artifact = self._store_in_cache(build_dir, cfg_file, staging, key)
+        return self.artifact
+
+    def install(self, target: Path | None = None):
+        """Installiert das kompilierte BusyBox ins RootFS bzw. nach ``target`` (kompiliert bei Bedarf)."""
+        entry = self.artifact or self.compile()
+        target = Path(target or self.rootfs_dir)
+        target.mkdir(parents=True, exist_ok=True)
+        self._install_from_cache(entry, target)
+        self.create_symlinks(target)
+        if self.epoch is not None:
+            installed = entry / "install"
+            entries = [str(path.relative_to(installed)) for path in installed.rglob("*")]
+            normalize_tree(target, self.epoch, ROOT_OWNER, entries + ["sbin/init", "bin/sh"])
+        success(f"✅ BusyBox {self.version} installiert in {target}")
+
+    def build(self):
+        self.compile()
+        self.install()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# core/kconfig.py
+
+import os
+import re
+from pathlib import Path
+
+_SET_RE = re.compile(r"^(CONFIG_[A-Za-z0-9_]+)=(.*)$")
+_UNSET_RE = re.compile(r"^# (CONFIG_[A-Za-z0-9_]+) is not set$")
+
+
+class KConfig:
+    """
+    Kconfig-``.config`` als indizierte Struktur.
+
+    Die Datei wird einmal gelesen, alle Änderungen laufen im Speicher über
+    einen Index Schlüssel → Zeile, geschrieben wird einmal atomar.
+    ``CONFIG_X=n`` wird wie von Kconfig erwartet als
+    ``# CONFIG_X is not set`` abgelegt.
+    """
+
+    def __init__(self, lines: list[str]):
+        self.lines = lines
+        self.index: dict[str, int] = {}
+        self.changes: list[tuple[str, str | None, str]] = []
+        for i, line in enumerate(lines):
+            key = self._key(line)
+            if key:
+                self.index[key] = i
+
+    @classmethod
+    def load(cls, path: Path | str) -> "KConfig":
+        return cls(Path(path).read_text().splitlines())
+
+    @staticmethod
+    def _key(line: str) -> str | None:
+        match = _SET_RE.match(line) or _UNSET_RE.match(line)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def _render(key: str, value: str) -> str:
+        return f"# {key} is not set" if value == "n" else f"{key}={value}"
+
+    def get(self, key: str) -> str | None:
+        """Wert eines Schlüssels; ``"n"`` für 'is not set', None wenn unbekannt."""
+        idx = self.index.get(key)
+        if idx is None:
+            return None
+        match = _SET_RE.match(self.lines[idx])
+        return match.group(2) if match else "n"
+
+    def set(self, key: str, value: str) -> bool:
+        """Setzt einen Wert; liefert True, wenn sich etwas geändert hat."""
+        old = self.get(key)
+        if old == value:
+            return False
+        line = self._render(key, value)
+        idx = self.index.get(key)
+        if idx is None:
+            self.index[key] = len(self.lines)
+            self.lines.append(line)
+        else:
+            self.lines[idx] = line
+        self.changes.append((key, old, value))
+        return True
+
+    def apply(self, patches: dict[str, str]) -> list[tuple[str, str | None, str]]:
+        """Wendet alle Patches im Speicher an und liefert die tatsächlichen Änderungen."""
+        start = len(self.changes)
+        for key, value in patches.items():
+            self.set(key, value)
+        return self.changes[start:]
+
+    def diff(self) -> list[str]:
+        """Unified-artige Zeilen aller Änderungen (``-alt`` / ``+neu``)."""
+        out = []
+        for key, old, new in self.changes:
+            if old is not None:
+                out.append(f"-{self._render(key, old)}")
+            out.append(f"+{self._render(key, new)}")
+        return out
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+    def write(self, path: Path | str):
+        """Schreibt atomar (tmp + rename)."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.text())
+        os.replace(tmp, path)
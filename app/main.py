@@ -4,6 +4,9 @@ import argparse
 from pathlib import Path
 from typing import Union, Dict
 import shutil
+import subprocess
+import time
+from functools import partial
 
 from core.busybox import BusyBoxBuilder
 
@@ -13,10 +16,22 @@ from modules.fhs_layout import FHSLayout
 from modules.create_fhs_rootfs import FHSRootFSBuilder
 from modules.arch import ARCHES
 from modules.install_to_rootfs import PackageInstaller
-from manager.paccy import PacmanRootFSInstaller
+from modules.build_state import BuildState, hash_inputs
+from modules.stages import StageGraph
+from modules.image import IMAGE_FORMATS, ImagePacker, default_epoch
+from modules.direct_image import DirectImageBuilder
+from modules.layers import COMPOSE_MODES, LayerStore, hash_tree
+from modules.treehash import TreeHasher
+from manager.paccy import PACMAN_CONFIG_SOURCES, PacmanRootFSInstaller
+from manager.extractor import PackageExtractor
+from manager.filedb import FileOwnershipDB
+from manager.pkgcache import PackageCache, sha256_file
+from manager.repodb import DEFAULT_REPOS, open_repo
 
 from utils.load import ConfigLoader
-from utils.logger import info, debug, warning, error, success, running
+from utils.execute import configure_executor
+from utils.reproducible import normalize_tree
+from utils.logger import configure_logging, log_floods, info, debug, warning, error, success, running, tracer
 
 
 def setup_development_enviroment(config_file_path: Union[str, Path]) -> Union[Dict[str, Path], None]:
@@ -34,7 +49,7 @@ def setup_development_enviroment(config_file_path: Union[str, Path]) -> Union[Di
                         "rootfs_dir": "/mnt/nexuzfs/work/rootfs",
                         "cache_dir": "/mnt/nexuzfs/work/cache",
                         "download_dir": "/mnt/nexuzfs/work/downloads",
-                        "pacman_cache": "/mnt/nexuzfs/work/rootfs/var/cache/pacman",
+                        "pacman_cache": "/mnt/nexuzfs/work/cache/pacman",
                         "image_dir": "/mnt/nexuzfs/work/images",
                         "logs_dir": "/mnt/nexuzfs/work/logs",
                         "tmp_dir": "/mnt/nexuzfs/work/tmp"
@@ -75,7 +90,52 @@ def main():
     parser.add_argument("--config", type=str, required=False, default="default.yaml")
     parser.add_argument("--fhs", type=str, required=False, default="default_fhs.yaml")
     parser.add_argument("--arch", type=str, default="x86_64", choices=ARCHES.keys())
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Parallele Worker für die Paket-Extraktion (1 = seriell)")
+    parser.add_argument("--log-level", type=str, default="debug", choices=["debug", "info", "warning", "error"],
+                        help="Niedrigste Stufe für Konsole und Logdatei (darunter fallen keine Kosten an)")
+    parser.add_argument("--extract-backend", type=str, default="auto", choices=["auto", "python", "bsdtar"],
+                        help="Paket-Extraktion im Prozess (python) oder per bsdtar")
+    parser.add_argument("--pkg-cache-max", type=int, default=None,
+                        help="Maximale Größe des Paket-Caches in MiB (LRU-Verdrängung)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="RootFS behalten und nur Stages mit geänderten Eingaben neu bauen")
+    parser.add_argument("--image", action="append", default=[], choices=list(IMAGE_FORMATS),
+                        help="Fertiges RootFS zusätzlich als Image packen (mehrfach möglich)")
+    parser.add_argument("--direct-image", action="store_true",
+                        help="Images direkt aus Layout, BusyBox und Paketen bauen, ohne RootFS auf Platte")
+    parser.add_argument("--reproducible", type=int, nargs="?", const=-1, default=None, metavar="EPOCH",
+                        help="Reproduzierbarer Build: mtimes ≤ EPOCH (Standard: SOURCE_DATE_EPOCH bzw. 0), "
+                             "Besitz root für FHS/BusyBox; prüft das Ergebnis per Merkle-Hash")
+    parser.add_argument("--hash", action="store_true",
+                        help="Merkle-Hash über das fertige RootFS berechnen (gecacht nach Inode/mtime/Größe)")
+    parser.add_argument("--layers", type=str, nargs="?", const="auto", default=None, choices=list(COMPOSE_MODES),
+                        help="RootFS aus gecachten Ebenen (FHS, BusyBox, Pakete) per overlayfs oder Hardlinks zusammensetzen")
+    parser.add_argument("--mirror", type=str, default=None,
+                        help="Pakete ohne Host-pacman aus diesem Mirror (URL oder Verzeichnis, $repo/$arch erlaubt)")
+    parser.add_argument("--repos", type=str, default=",".join(DEFAULT_REPOS),
+                        help="Repos für --mirror in Prioritätsreihenfolge (kommagetrennt)")
+    parser.add_argument("--refresh-db", action="store_true",
+                        help="Sync-Datenbanken des Mirrors neu laden")
+    parser.add_argument("--uninstall", action="append", default=[], metavar="PAKET",
+                        help="Paket aus dem bestehenden RootFS entfernen (ohne Neubau, mehrfach möglich)")
+    parser.add_argument("--replace", action="append", default=[], metavar="DATEI",
+                        help="Paketdatei im bestehenden RootFS ersetzen/aktualisieren (ohne Neubau)")
     args = parser.parse_args()
+    configure_logging(level=args.log_level)
+    epoch = None
+    if args.reproducible is not None:
+        epoch = default_epoch() if args.reproducible < 0 else args.reproducible
+        # Auch für make (BusyBox-Banner) und die Image-Writer
+        os.environ["SOURCE_DATE_EPOCH"] = str(epoch)
+        info(f"Reproduzierbarer Build mit SOURCE_DATE_EPOCH={epoch}")
+    # Reproduzierbare Eingaben gehören in Stage- und Ebenen-Schlüssel
+    repro = [f"epoch={epoch}"] if epoch is not None else []
+    maintenance = bool(args.uninstall or args.replace)
+    if args.layers and (args.incremental or args.direct_image):
+        parser.error("--layers lässt sich nicht mit --incremental oder --direct-image kombinieren")
+    if args.direct_image and (not args.image or "ext4" in args.image):
+        parser.error("--direct-image braucht --image (cpio.zst, tar.zst, squashfs oder erofs)")
 
     config_yaml = Path("configs") / "system" / args.config
     geladene_pfade = setup_development_enviroment(config_yaml)
@@ -101,6 +161,9 @@ def main():
     paths = Paths(DEV_ENV_DIR)
     ws = Workspace(paths.root)
     ws.ensure()
+    configure_logging(paths.logs, level=args.log_level)
+    # Alle externen Befehle teilen sich ein Job-Limit; Ausgaben unter logs/commands
+    configure_executor(jobs=args.jobs, log_dir=paths.logs / "commands")
 
     # FHS Layout
     fhs_yaml = Path("configs") / "rootfs" / args.fhs
@@ -108,12 +171,14 @@ def main():
         error(f"[!] FHS Layout nicht gefunden: {fhs_yaml}")
         return
 
-    layout = FHSLayout(fhs_yaml)
+    layout = FHSLayout(fhs_yaml, cache_dir=paths.cache / "fhs")
     layout.load()
 
     # RootFS Pfad vorbereiten
     rootfs_path = paths.rootfs
-    if rootfs_path.exists():
+    fresh_rootfs = not (args.incremental or args.direct_image or args.layers or maintenance)
+    if rootfs_path.exists() and fresh_rootfs:
+        LayerStore.release(rootfs_path)
         shutil.rmtree(rootfs_path)
     rootfs_path.mkdir(parents=True, exist_ok=True)
 
@@ -121,22 +186,41 @@ def main():
     pacman_cache_path = paths.pacman_cache
     pacman_cache_path.mkdir(parents=True, exist_ok=True)
 
-    # RootFS erstellen
-    builder = FHSRootFSBuilder(rootfs_path, layout)
-    builder.build()
-    success(f"[✓] RootFS erstellt für Architektur {args.arch} in {rootfs_path}")
+    builder = FHSRootFSBuilder(rootfs_path, layout, epoch=epoch)
 
     busybox_json = Path("configs/busybox/busybox.json")
-    bb_builder = BusyBoxBuilder(busybox_json, paths=paths, arch="x86_64")
-    bb_builder.build()
-    bb_builder.create_symlinks()
-    success("BusyBox gebaut und direkt ins OverlayFS installiert")
+    bb_builder = BusyBoxBuilder(busybox_json, paths=paths, arch="x86_64", epoch=epoch)
+
     # Pakete installieren – Variante B (Cache → RootFS)
     # info("Installing packages into RootFS using cache variant...")
     # installer = PackageInstaller(paths, use_cache_variant=True)
     # installer.install_pkgs()
     
-    installer = PacmanRootFSInstaller(rootfs_path, pacman_cache_path)
+    max_bytes = args.pkg_cache_max * 2**20 if args.pkg_cache_max else None
+    store = PackageCache(paths.package_store, max_bytes=max_bytes)
+    index = mirror = None
+    if args.mirror:
+        index, mirror = open_repo(args.mirror, paths.cache / "repodb" / args.arch, args.repos.split(","),
+                                  arch=args.arch, cache_dir=paths.cache / "repodb", refresh=args.refresh_db)
+    filedb = FileOwnershipDB(paths.build / "rootfs-files.sqlite", rootfs_path)
+    if fresh_rootfs:
+        # Neu angelegtes RootFS: alte Besitzdaten gelten nicht mehr, die Paket-Stage trägt neu ein
+        filedb.reset()
+    installer = PacmanRootFSInstaller(rootfs_path, pacman_cache_path, jobs=args.jobs,
+                                      backend=args.extract_backend, store=store, index=index, mirror=mirror,
+                                      filedb=filedb, epoch=epoch)
+
+    if maintenance:
+        # Bestehendes RootFS gezielt ändern, ohne Stages auszuführen
+        if not filedb.packages():
+            error("Keine Dateibesitz-Daten für dieses RootFS (z.B. nach --layers oder abgebrochenem Build) – "
+                  "erst ohne --layers/--direct-image neu bauen")
+            return
+        for name in args.uninstall:
+            installer.remove_package(name)
+        for pkg_file in args.replace:
+            installer.replace_package(Path(pkg_file))
+        return
 
     packages = [
         "bash", "coreutils", "util-linux", "nano",
@@ -144,7 +228,182 @@ def main():
         "autoconf", "automake"
     ]
 
-    installer.install_to_rootfs(packages)
+    def build_fhs():
+        builder.build()
+        success(f"[✓] RootFS erstellt für Architektur {args.arch} in {rootfs_path}")
+
+    def install_busybox():
+        bb_builder.install()
+        success("BusyBox gebaut und direkt ins OverlayFS installiert")
+
+    def install_packages():
+        installer.copy_pacman_configs()
+        if installer.downloaded != packages:
+            installer.download_packages(packages)
+        # Alle Pakete werden neu extrahiert; das FHS-Gerüst bleibt beim Entfernen erhalten
+        filedb.reset()
+        filedb.claim_dirs("fhs", builder.plan_directories())
+        installer.extract_all_packages()
+
+    rootfs_stages = [("fhs", build_fhs), ("busybox", install_busybox), ("packages", install_packages)]
+    # Dateien, die das Layout per ``source:`` ins RootFS kopiert
+    fhs_sources = [Path(f["source"]) for f in layout.files() if "source" in f]
+    state = None
+    if args.incremental:
+        # Paketversionen gehören zu den Eingaben, damit Updates erkannt werden
+        try:
+            targets = installer.resolve_targets(packages)
+        except (OSError, subprocess.CalledProcessError) as e:
+            warning(f"Paketversionen nicht auflösbar, nutze nur die Paketliste: {e}")
+            targets = packages
+        stage_inputs = {
+            # Übersetztes Layout samt include:-Fragmenten statt nur der Haupt-YAML
+            "fhs": hash_inputs(layout.layout, args.arch, *map(Path, layout.sources), *fhs_sources, *repro),
+            "busybox": hash_inputs(busybox_json, bb_builder.arch, *repro),
+            "packages": hash_inputs(targets, args.arch, Path("/etc/pacman.conf"), *repro),
+        }
+        state = BuildState(paths.build / "rootfs-state.json", rootfs_path, jobs=args.jobs)
+        state.plan([(name, stage_inputs[name]) for name, _ in rootfs_stages])
+
+    def needed(name):
+        return state is None or name in state.dirty
+
+    # Stage-Graph: Kompilieren und Downloads schreiben nicht ins RootFS und
+    # laufen parallel zum FHS-Aufbau; RootFS-Stages bleiben in fester Reihenfolge
+    graph = StageGraph()
+    graph.add("busybox-compile", lambda: needed("busybox") and bb_builder.compile(),
+              outputs=[paths.build, bb_builder.artifact_cache])
+    graph.add("pacman-download", lambda: needed("packages") and installer.download_packages(packages),
+              outputs=[pacman_cache_path])
+    stage_deps = {
+        "fhs": [],
+        "busybox": ["fhs", "busybox-compile"],
+        "packages": ["busybox", "pacman-download"],
+    }
+    if args.direct_image:
+        # Gleiche Reihenfolge wie die RootFS-Stages, aber als Baum im Speicher
+        packer = ImagePacker(paths.images, jobs=args.jobs, name=f"rootfs-{args.arch}")
+
+        def build_direct_images():
+            direct = DirectImageBuilder(packer, jobs=args.jobs)
+            direct.add_layout(layout)
+            direct.add_busybox((bb_builder.artifact or bb_builder.compile()) / "install")
+            for source, target in PACMAN_CONFIG_SOURCES:
+                if Path(source).exists():
+                    direct.add_tree("pacman-config", source, target, plain_files=True)
+            pkg_files, _ = installer.collect_packages()
+            direct.add_packages(pkg_files)
+            for fmt in args.image:
+                direct.build(fmt)
+
+        graph.add("image", build_direct_images, deps=["busybox-compile", "pacman-download"],
+                  outputs=[paths.images])
+        rootfs_stages = []
+
+    if args.layers:
+        # Ebenen werden isoliert gebaut und teilen sich nichts außer dem Speicher
+        layer_store = LayerStore(paths.layers, jobs=args.jobs)
+        layers = {}
+
+        def layer(name, inputs, func):
+            """Ebenen-Spezifikation; reproduzierbar mit eigenem Schlüssel und normalisiertem Baum."""
+            if epoch is None:
+                return name, inputs, func
+
+            def build(tree):
+                func(tree)
+                # Auch implizit angelegte Elternverzeichnisse, die beim Zusammensetzen zählen
+                normalize_tree(tree, epoch)
+            return name, ":".join([inputs, *repro]), build
+
+        def build_fhs_layer():
+            layers["fhs"] = [layer_store.build(*layer(
+                "fhs", hash_inputs(layout.layout, args.arch, *fhs_sources),
+                lambda tree: FHSRootFSBuilder(tree, layout, epoch=epoch).build()))]
+
+        def build_busybox_layer():
+            artifact = bb_builder.artifact or bb_builder.compile()
+            layers["busybox"] = [layer_store.build(*layer("busybox", artifact.name, bb_builder.install))]
+
+        def build_package_layers():
+            config = layer_store.build(*layer(
+                "pacman-config", hash_tree(*(source for source, _ in PACMAN_CONFIG_SOURCES)),
+                installer.copy_pacman_configs))
+            pkg_files, entries = installer.collect_packages()
+            digests = [entry.sha256 for entry in entries] or [sha256_file(pkg) for pkg in pkg_files]
+            # Gleiche Reihenfolge wie extract_all: nach Dateiname, spätere gewinnen
+            ordered = sorted(zip(pkg_files, digests), key=lambda item: item[0].name)
+            specs = [
+                layer(f"pkg:{pkg.name}", digest,
+                      lambda tree, pkg=pkg: PackageExtractor(tree, jobs=1, backend=args.extract_backend).extract_one(pkg))
+                for pkg, digest in ordered
+            ]
+            if entries:
+                specs.append(layer("pacman-cache", hash_inputs(sorted(digests)),
+                                   lambda tree: store.link_into(entries, tree / "var/cache/pacman/pkg")))
+            layers["packages"] = [config, *layer_store.build_many(specs)]
+
+        def compose_rootfs():
+            stack = layers["fhs"] + layers["busybox"] + layers["packages"]
+            layer_store.compose(stack, rootfs_path, mode=args.layers, upper=paths.build / "rootfs-upper")
+            # Zusammengesetzt ohne Registrierung: Besitzdaten des alten RootFS verwerfen
+            filedb.reset()
+            layer_store.summary()
+
+        graph.add("fhs", build_fhs_layer)
+        graph.add("busybox", build_busybox_layer, deps=["busybox-compile"])
+        graph.add("packages", build_package_layers, deps=["pacman-download"])
+        graph.add("rootfs", compose_rootfs, deps=["fhs", "busybox", "packages"], outputs=[rootfs_path])
+        rootfs_stages = []
+
+    for name, func in rootfs_stages:
+        if state:
+            func = partial(state.step, name, stage_inputs[name], func)
+        graph.add(name, func, deps=stage_deps[name], outputs=[rootfs_path])
+
+    if (args.hash or epoch is not None) and args.direct_image:
+        warning("Merkle-Hash braucht ein RootFS auf Platte, bei --direct-image übersprungen")
+    elif args.hash or epoch is not None:
+        def hash_rootfs():
+            # Ohne Rootrechte gehören die Dateien dem Bauenden – Besitz dann nicht hashen
+            hasher = TreeHasher(paths.cache / "treehash" / "rootfs.marshal", jobs=args.jobs,
+                                owner=os.geteuid() == 0)
+            root_file = paths.build / "rootfs.merkle.root"
+            previous = root_file.read_text().strip() if root_file.exists() else None
+            manifest = paths.build / "rootfs.merkle"
+            if manifest.exists():
+                manifest.replace(manifest.with_suffix(".merkle.prev"))
+            root = hasher.hash(rootfs_path, manifest=manifest)
+            root_file.write_text(root + "\n")
+            success(f"RootFS Merkle-Hash: {root}")
+            if previous:
+                info("Identisch zum letzten Build" if previous == root
+                     else f"Abweichend vom letzten Build ({previous[:16]}), vgl. rootfs.merkle und rootfs.merkle.prev")
+
+        graph.add("hash", hash_rootfs, deps=["rootfs" if args.layers else "packages"])
+
+    if args.image and not args.direct_image:
+        packer = ImagePacker(paths.images, jobs=args.jobs, name=f"rootfs-{args.arch}")
+
+        def pack_images():
+            for fmt in args.image:
+                packer.pack(rootfs_path, fmt)
+
+        graph.add("image", pack_images, deps=["rootfs" if args.layers else "packages"], outputs=[paths.images])
+
+    start = time.perf_counter()
+    try:
+        graph.run()
+    finally:
+        # Zeitleiste auch bei Fehlern schreiben – gerade dann ist sie interessant
+        trace_file = tracer.write(paths.logs / f"trace-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        tracer.summary()
+        log_floods()
+        info(f"[trace] Chrome-Trace: {trace_file} (chrome://tracing oder ui.perfetto.dev)")
+    if state:
+        state.summary(start)
+
+    store.evict()
     
     
     
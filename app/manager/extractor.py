@@ -0,0 +1,395 @@
+# manager/extractor.py
+import gzip
+import os
+import re
+import shutil
+import stat
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from manager.filedb import FileOwnershipDB
+from utils.execute import get_executor
+from utils.reproducible import normalize_tree
+from utils.logger import debug, info, warning, success
+from utils.zstd import HAVE_ZSTD, open_zstd_reader
+
+# Paket-Metadaten, die nicht ins RootFS gehören
+PKG_METADATA = (".PKGINFO", ".MTREE", ".BUILDINFO", ".INSTALL", ".CHANGELOG")
+_MTREE_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+# Schreibpuffer für Dateiinhalte im Python-Backend
+WRITE_BUFFER = 1024 * 1024
+BACKENDS = ("auto", "python", "bsdtar")
+
+
+@dataclass
+class ExtractResult:
+    package: Path
+    seconds: float
+    group: int = 0
+    files: list[str] = field(default_factory=list)
+
+
+class PackageExtractor:
+    """
+    Extrahiert .pkg.tar.zst Pakete ins RootFS, seriell oder parallel.
+
+    Im parallelen Modus werden die Dateilisten aller Pakete gelesen und Pakete
+    mit überlappenden Pfaden zu Gruppen zusammengefasst. Jede Gruppe läuft
+    seriell in Eingabereihenfolge, unabhängige Gruppen laufen parallel –
+    das Ergebnis ist identisch zum seriellen Pfad.
+
+    Backends:
+        - python: streamt zstd → tar im Prozess (benötigt utils.zstd)
+        - bsdtar: ein bsdtar-Prozess pro Paket (Fallback)
+        - auto:   python, falls ein zstd-Modul verfügbar ist
+    """
+
+    def __init__(self, rootfs: Path | str, jobs: int | None = None, backend: str = "auto",
+                 filedb: FileOwnershipDB | None = None, epoch: int | None = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unbekanntes Extraktions-Backend: {backend}")
+        if backend == "python" and not HAVE_ZSTD:
+            raise RuntimeError("Python-Backend benötigt compression.zstd oder zstandard")
+
+        self.rootfs = Path(rootfs)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.backend = backend if backend != "auto" else ("python" if HAVE_ZSTD else "bsdtar")
+        self._root = os.geteuid() == 0
+        # Dateibesitz; jedes Paket wird direkt nach seiner Extraktion registriert
+        self.filedb = filedb
+        self._file_lists: dict[Path, list[str]] = {}
+        # Reproduzierbarer Modus: mtimes nach der Extraktion auf epoch begrenzen
+        # (auch implizit angelegte und durch Pakete veränderte Verzeichnisse)
+        self.epoch = epoch
+
+    # -------------------------------------------------------------
+    # Dateilisten
+    # -------------------------------------------------------------
+    @staticmethod
+    def _parse_mtree(data: bytes) -> list[str]:
+        files = []
+        for line in data.decode("utf-8", "surrogateescape").splitlines():
+            if not line.startswith("./"):
+                continue
+            fields = line.split()
+            if "type=dir" in fields:
+                continue
+            # mtree kodiert Sonderzeichen oktal (z.B. \040 für Leerzeichen)
+            name = fields[0][2:]
+            if "\\" in name:
+                raw = _MTREE_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), name)
+                name = raw.encode("latin-1", "surrogateescape").decode("utf-8", "surrogateescape")
+            if name not in PKG_METADATA:
+                files.append(name)
+        return files
+
+    @staticmethod
+    def _read_mtree(pkg: Path) -> bytes | None:
+        """Liest .MTREE im Prozess; es liegt am Archivanfang, danach wird abgebrochen."""
+        with open(pkg, "rb") as raw, open_zstd_reader(raw) as stream, \
+                tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                name = PackageExtractor._member_name(member.name)
+                if name == ".MTREE":
+                    return tar.extractfile(member).read()
+                if name not in PKG_METADATA:
+                    return None
+        return None
+
+    def list_files(self, pkg: Path) -> list[str]:
+        """Liefert alle Nicht-Verzeichnis-Pfade eines Pakets (bevorzugt aus .MTREE)."""
+        if self.backend == "python":
+            data = self._read_mtree(pkg)
+        else:
+            mtree = get_executor().run(["bsdtar", "-xOqf", str(pkg), ".MTREE"], desc=f"bsdtar .MTREE {pkg.name}",
+                                       capture=True, log=False)
+            data = mtree.stdout if mtree.ok else None
+        if data:
+            try:
+                return self._parse_mtree(gzip.decompress(data))
+            except (OSError, EOFError):
+                debug(f"Ungültiges .MTREE in {pkg.name}, lese Archivliste")
+
+        listing = get_executor().run(["bsdtar", "-tf", str(pkg)], desc=f"bsdtar -tf {pkg.name}",
+                                     capture=True, log=False).check()
+        return [
+            name for name in listing.stdout.decode("utf-8", "surrogateescape").splitlines()
+            if name and not name.endswith("/") and name not in PKG_METADATA
+        ]
+
+    # -------------------------------------------------------------
+    # Planung: überlappende Pakete gruppieren
+    # -------------------------------------------------------------
+    def plan(self, pkgs: list[Path]) -> tuple[list[list[Path]], dict[Path, list[str]]]:
+        """Gruppiert Pakete, deren Dateilisten sich überschneiden (Union-Find)."""
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            file_lists = dict(zip(pkgs, pool.map(self.list_files, pkgs)))
+        self._file_lists = file_lists
+
+        parent = list(range(len(pkgs)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i: int, j: int):
+            a, b = find(i), find(j)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+        owner: dict[str, int] = {}
+        # Elternverzeichnis → Pakete mit Einträgen darunter; eine Datei bzw. ein
+        # Symlink an diesem Pfad in einem anderen Paket ist ebenfalls ein Konflikt
+        users: dict[str, list[int]] = {}
+        for idx, pkg in enumerate(pkgs):
+            ancestors: set[str] = set()
+            for name in file_lists[pkg]:
+                other = owner.setdefault(name, idx)
+                if other != idx:
+                    union(other, idx)
+                head = name.rpartition("/")[0]
+                while head and head not in ancestors:
+                    ancestors.add(head)
+                    head = head.rpartition("/")[0]
+            for head in ancestors:
+                users.setdefault(head, []).append(idx)
+        for name, idx in owner.items():
+            for other in users.get(name, ()):
+                if other != idx:
+                    union(other, idx)
+
+        groups: dict[int, list[Path]] = {}
+        for idx, pkg in enumerate(pkgs):
+            groups.setdefault(find(idx), []).append(pkg)
+
+        # Größte Gruppen zuerst starten, damit sie nicht am Ende allein laufen
+        return sorted(groups.values(), key=len, reverse=True), file_lists
+
+    # -------------------------------------------------------------
+    # Extraktion
+    # -------------------------------------------------------------
+    def extract_one(self, pkg: Path) -> tuple[float, list[str]]:
+        """Extrahiert ein Paket und liefert Dauer und Dateiliste (nur Python-Backend)."""
+        start = time.perf_counter()
+        if self.backend == "python":
+            files = self._extract_python(pkg)
+        else:
+            files = []
+            cmd = ["bsdtar", "-xpf", str(pkg), "-C", str(self.rootfs)]
+            for name in PKG_METADATA:
+                cmd += ["--exclude", name]
+            get_executor().run(cmd, desc=f"bsdtar {pkg.name}", log=False).check()
+        return time.perf_counter() - start, files
+
+    def _extract_group(self, group_id: int, group: list[Path]) -> list[ExtractResult]:
+        results = []
+        for pkg in group:
+            seconds, files = self.extract_one(pkg)
+            debug("[EXTRACT] %s (%.2fs, Gruppe %d)", pkg.name, seconds, group_id)
+            if self.filedb is not None:
+                # Überlappende Pakete laufen in einer Gruppe in Reihenfolge –
+                # Konflikte werden so in derselben Reihenfolge erkannt
+                self.filedb.register(pkg, files or self._file_lists.get(pkg) or self.list_files(pkg))
+            results.append(ExtractResult(pkg, seconds, group_id, files))
+        return results
+
+    # -------------------------------------------------------------
+    # Python-Backend: zstd → tar im Prozess
+    # -------------------------------------------------------------
+    @staticmethod
+    def _member_name(name: str) -> str | None:
+        while name.startswith("./"):
+            name = name[2:]
+        name = name.rstrip("/")
+        if not name or name.startswith("/") or ".." in name.split("/"):
+            return None
+        return name
+
+    @staticmethod
+    def _mkdir(target: str):
+        """mkdir, das ein gleichzeitig von einer anderen Gruppe angelegtes Verzeichnis toleriert."""
+        try:
+            os.mkdir(target)
+        except FileExistsError:
+            if not stat.S_ISDIR(os.lstat(target).st_mode):
+                raise
+
+    @staticmethod
+    def _clear(target: str):
+        """Entfernt einen vorhandenen Nicht-Verzeichnis-Eintrag (wie bsdtar -x)."""
+        try:
+            if not stat.S_ISDIR(os.lstat(target).st_mode):
+                os.unlink(target)
+        except FileNotFoundError:
+            pass
+
+    def _resolve(self, name: str) -> str | None:
+        """
+        Löst ``name`` wie in einem chroot unter dem RootFS auf: Symlinks werden
+        verfolgt, absolute Linkziele beginnen am RootFS. Ein ``..`` über die
+        Wurzel hinaus (oder eine Symlink-Schleife) liefert None.
+        """
+        pending = name.split("/")
+        resolved: list[str] = []
+        hops = 0
+        while pending:
+            part = pending.pop(0)
+            if part in ("", "."):
+                continue
+            if part == "..":
+                if not resolved:
+                    return None
+                resolved.pop()
+                continue
+            path = os.path.join(self.rootfs, *resolved, part)
+            if os.path.islink(path):
+                hops += 1
+                if hops > 40:
+                    return None
+                link = os.readlink(path)
+                if link.startswith("/"):
+                    resolved = []
+                pending = link.split("/") + pending
+                continue
+            resolved.append(part)
+        return os.path.join(self.rootfs, *resolved)
+
+    def _extract_python(self, pkg: Path) -> list[str]:
+        root = str(self.rootfs)
+        files: list[str] = []
+        # Elternverzeichnis im Paket → aufgelöster Pfad unter dem RootFS; Symlinks
+        # aus früheren Paketen/FHS werden nie in Richtung Host verfolgt
+        parents: dict[str, str] = {"": root}
+        # (Pfad, TarInfo) – Metadaten werden gesammelt nach dem Schreiben gesetzt
+        meta: list[tuple[str, tarfile.TarInfo]] = []
+        dir_meta: list[tuple[str, tarfile.TarInfo]] = []
+
+        with open(pkg, "rb") as raw, open_zstd_reader(raw) as stream, \
+                tarfile.open(fileobj=stream, mode="r|", bufsize=WRITE_BUFFER) as tar:
+            for member in tar:
+                name = self._member_name(member.name)
+                if name is None or name in PKG_METADATA:
+                    continue
+                parent_name, _, base = name.rpartition("/")
+                parent = parents.get(parent_name)
+                if parent is None:
+                    parent = self._resolve(parent_name)
+                    if parent is None:
+                        warning(f"{pkg.name}: {name} liegt außerhalb des RootFS, übersprungen")
+                        continue
+                    os.makedirs(parent, exist_ok=True)
+                    parents[parent_name] = parent
+                target = os.path.join(parent, base)
+
+                if member.isdir():
+                    if os.path.islink(target):
+                        # Symlink auf ein Verzeichnis bleibt erhalten, sofern es im RootFS liegt
+                        resolved = self._resolve(name)
+                        if resolved is not None and os.path.isdir(resolved):
+                            target = resolved
+                        else:
+                            self._clear(target)
+                            self._mkdir(target)
+                    elif not os.path.isdir(target):
+                        self._clear(target)
+                        self._mkdir(target)
+                    parents[name] = target
+                    dir_meta.append((target, member))
+                    continue
+
+                if os.path.isdir(target) and not os.path.islink(target):
+                    warning(f"{pkg.name}: {name} ist ein Verzeichnis im RootFS, übersprungen")
+                    continue
+
+                self._clear(target)
+                if member.isreg():
+                    src = tar.extractfile(member)
+                    # O_EXCL: nie durch einen (inzwischen angelegten) Symlink schreiben
+                    fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o600)
+                    with os.fdopen(fd, "wb", buffering=WRITE_BUFFER) as dst:
+                        shutil.copyfileobj(src, dst, WRITE_BUFFER)
+                elif member.issym():
+                    os.symlink(member.linkname, target)
+                elif member.islnk():
+                    source = self._member_name(member.linkname)
+                    source_dir, _, source_base = (source or "").rpartition("/")
+                    source_parent = parents.get(source_dir) or self._resolve(source_dir)
+                    if source is None or source_parent is None:
+                        warning(f"{pkg.name}: ungültiger Hardlink {name} -> {member.linkname}")
+                        continue
+                    os.link(os.path.join(source_parent, source_base), target, follow_symlinks=False)
+                    files.append(name)
+                    continue
+                elif member.ischr() or member.isblk() or member.isfifo():
+                    if not self._root and not member.isfifo():
+                        debug("Gerätedatei ohne Rootrechte übersprungen: %s (%s)", name, pkg.name)
+                        continue
+                    kind = stat.S_IFCHR if member.ischr() else stat.S_IFBLK if member.isblk() else stat.S_IFIFO
+                    os.mknod(target, kind | 0o600, os.makedev(member.devmajor, member.devminor))
+                else:
+                    continue
+
+                files.append(name)
+                meta.append((target, member))
+
+        self._apply_metadata(meta)
+        # Verzeichnisse zuletzt und tiefste zuerst, sonst überschreiben
+        # spätere Schreibzugriffe die mtime wieder
+        self._apply_metadata(reversed(dir_meta))
+        return files
+
+    def _apply_metadata(self, entries):
+        for target, member in entries:
+            link = member.issym()
+            if self._root:
+                os.lchown(target, member.uid, member.gid)
+            if not link:
+                os.chmod(target, member.mode)
+            os.utime(target, (member.mtime, member.mtime), follow_symlinks=not link)
+
+    def extract_all(self, pkgs: list[Path]) -> list[ExtractResult]:
+        if not pkgs:
+            return []
+
+        self.rootfs.mkdir(parents=True, exist_ok=True)
+        pkgs = sorted(pkgs, key=lambda p: p.name)
+        start = time.perf_counter()
+
+        if self.jobs <= 1 or len(pkgs) == 1:
+            info(f"Extrahiere {len(pkgs)} Pakete seriell ({self.backend}) ...")
+            results = self._extract_group(0, pkgs)
+        else:
+            groups, file_lists = self.plan(pkgs)
+            serial = sum(len(g) for g in groups if len(g) > 1)
+            info(f"Extrahiere {len(pkgs)} Pakete mit {self.jobs} Workern ({self.backend}, "
+                 f"{len(groups)} Gruppen, {serial} Pakete mit Überschneidungen)")
+            results = []
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                futures = [pool.submit(self._extract_group, gid, group) for gid, group in enumerate(groups)]
+                for future in as_completed(futures):
+                    results.extend(future.result())
+            for result in results:
+                result.files = result.files or file_lists[result.package]
+            order = {pkg: idx for idx, pkg in enumerate(pkgs)}
+            results.sort(key=lambda r: order[r.package])
+
+        if self.epoch is not None:
+            normalize_tree(self.rootfs, self.epoch)
+        self.report(results, time.perf_counter() - start)
+        return results
+
+    @staticmethod
+    def report(results: list[ExtractResult], wall: float):
+        for result in sorted(results, key=lambda r: r.seconds, reverse=True):
+            info(f"  {result.seconds:8.2f}s  {result.package.name}")
+        busy = sum(r.seconds for r in results)
+        if wall > 0 and busy > 0:
+            success(f"{len(results)} Pakete in {wall:.2f}s extrahiert "
+                    f"(Summe {busy:.2f}s, Faktor {busy / wall:.1f}x)")
+        else:
+            warning("Keine Pakete extrahiert.")
@@ -0,0 +1,269 @@
+# manager/filedb.py
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from manager.pkgcache import parse_pkg_filename
+from utils.logger import debug, info, success, warning
+
+# Maximale Anzahl SQL-Parameter pro Abfrage
+QUERY_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    id        INTEGER PRIMARY KEY,
+    name      TEXT NOT NULL UNIQUE,
+    version   TEXT NOT NULL,
+    arch      TEXT NOT NULL,
+    filename  TEXT NOT NULL,
+    installed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path    TEXT PRIMARY KEY,
+    package INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_package ON files (package);
+CREATE TABLE IF NOT EXISTS dirs (
+    path    TEXT NOT NULL,
+    package INTEGER NOT NULL,
+    PRIMARY KEY (path, package)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS dirs_package ON dirs (package);
+CREATE TABLE IF NOT EXISTS conflicts (
+    path     TEXT NOT NULL,
+    previous TEXT NOT NULL,
+    package  TEXT NOT NULL
+);
+"""
+
+
+def _parents(rel: str):
+    rel = os.path.dirname(rel)
+    while rel:
+        yield rel
+        rel = os.path.dirname(rel)
+
+
+@dataclass
+class RegisterResult:
+    package: str
+    files: int = 0
+    # Pfad → bisheriger Besitzer
+    conflicts: dict[str, str] = field(default_factory=dict)
+    # Dateien der Vorversion, die das neue Paket nicht mehr enthält
+    stale: list[str] = field(default_factory=list)
+
+
+class FileOwnershipDB:
+    """
+    Dateibesitz im RootFS: welches Paket hat welche Datei installiert.
+
+    Jede extrahierte Paketdatei wird mit ihrer Dateiliste (aus .MTREE bzw.
+    der Extraktion) registriert. Überschreibt ein Paket Dateien eines
+    anderen, wird der Konflikt sofort gemeldet und protokolliert; der letzte
+    Schreiber besitzt die Datei (wie bei der Extraktion). Pakete lassen sich
+    damit gezielt entfernen oder durch eine neue Version ersetzen.
+    Verzeichnisse gehören allen Paketen mit Dateien darunter und werden erst
+    entfernt, wenn kein Besitzer mehr übrig ist (``claim_dirs`` schützt z.B.
+    das FHS-Gerüst).
+    """
+
+    def __init__(self, db_file: Path | str, rootfs: Path | str):
+        self.db_file = Path(db_file)
+        self.rootfs = Path(rootfs)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def reset(self):
+        """Vergisst alle Besitzverhältnisse (z.B. nach dem Löschen des RootFS)."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            for table in ("files", "dirs", "conflicts", "packages"):
+                self._db.execute(f"DELETE FROM {table}")
+            self._db.execute("COMMIT")
+
+    # -------------------------------------------------------------
+    # Abfragen
+    # -------------------------------------------------------------
+    def packages(self) -> list[tuple[str, str]]:
+        with self._lock:
+            return self._db.execute("SELECT name, version FROM packages WHERE filename != '' ORDER BY name").fetchall()
+
+    def owner(self, path: str) -> str | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT p.name FROM files f JOIN packages p ON p.id = f.package WHERE f.path = ?", (path,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def files(self, name: str) -> list[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT f.path FROM files f JOIN packages p ON p.id = f.package WHERE p.name = ? ORDER BY f.path",
+                (name,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def conflicts(self, name: str | None = None) -> list[tuple[str, str, str]]:
+        """(Pfad, bisheriger Besitzer, neuer Besitzer), optional nur für ``name``."""
+        query = "SELECT path, previous, package FROM conflicts"
+        with self._lock:
+            if name is None:
+                return self._db.execute(query).fetchall()
+            return self._db.execute(query + " WHERE package = ? OR previous = ?", (name, name)).fetchall()
+
+    # -------------------------------------------------------------
+    # Registrieren
+    # -------------------------------------------------------------
+    def _owners(self, paths: list[str]) -> dict[str, str]:
+        owners = {}
+        for i in range(0, len(paths), QUERY_CHUNK):
+            chunk = paths[i:i + QUERY_CHUNK]
+            rows = self._db.execute(
+                "SELECT f.path, p.name FROM files f JOIN packages p ON p.id = f.package "
+                f"WHERE f.path IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            owners.update(rows)
+        return owners
+
+    def register(self, pkg: Path | str, files: list[str]) -> RegisterResult:
+        """
+        Registriert die Dateien eines (gerade extrahierten) Pakets. Eine
+        bereits installierte Version desselben Pakets wird ersetzt; deren
+        Dateien, die die neue Version nicht mehr enthält, werden gelöscht.
+        """
+        pkg = Path(pkg)
+        parsed = parse_pkg_filename(pkg.name)
+        name, version, arch = parsed if parsed else (pkg.name, "", "")
+        files = sorted(set(files))
+        dirs = {parent for rel in files for parent in _parents(rel)}
+        result = RegisterResult(name, len(files))
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                row = self._db.execute("SELECT id FROM packages WHERE name = ?", (name,)).fetchone()
+                if row is not None:
+                    old_files = [r[0] for r in self._db.execute("SELECT path FROM files WHERE package = ?", row)]
+                    result.stale = sorted(set(old_files).difference(files))
+                    for table, column in (("files", "package"), ("dirs", "package"), ("packages", "id")):
+                        self._db.execute(f"DELETE FROM {table} WHERE {column} = ?", row)
+                new_id = self._db.execute(
+                    "INSERT INTO packages (name, version, arch, filename, installed) VALUES (?, ?, ?, ?, ?)",
+                    (name, version, arch, pkg.name, time.time()),
+                ).lastrowid
+
+                result.conflicts = {path: owner for path, owner in self._owners(files).items() if owner != name}
+                self._db.executemany("INSERT OR REPLACE INTO files (path, package) VALUES (?, ?)",
+                                     [(path, new_id) for path in files])
+                self._db.executemany("INSERT OR IGNORE INTO dirs (path, package) VALUES (?, ?)",
+                                     [(path, new_id) for path in dirs])
+                self._db.executemany("INSERT INTO conflicts (path, previous, package) VALUES (?, ?, ?)",
+                                     [(path, owner, name) for path, owner in result.conflicts.items()])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+        self._report_conflicts(result)
+        if result.stale:
+            removed = self._unlink(result.stale)
+            self._remove_empty_dirs({parent for rel in result.stale for parent in _parents(rel)})
+            info(f"{name}: {removed} Dateien der Vorversion entfernt")
+        return result
+
+    def claim_dirs(self, owner: str, dirs: list[str]):
+        """Markiert Verzeichnisse als Besitz von ``owner`` (z.B. ``fhs``), damit sie bleiben."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            row = self._db.execute("SELECT id FROM packages WHERE name = ?", (owner,)).fetchone()
+            owner_id = row[0] if row else self._db.execute(
+                "INSERT INTO packages (name, version, arch, filename, installed) VALUES (?, '', '', '', ?)",
+                (owner, time.time()),
+            ).lastrowid
+            self._db.executemany("INSERT OR IGNORE INTO dirs (path, package) VALUES (?, ?)",
+                                 [(d, owner_id) for d in dirs])
+            self._db.execute("COMMIT")
+
+    @staticmethod
+    def _report_conflicts(result: RegisterResult):
+        if not result.conflicts:
+            return
+        by_owner: dict[str, list[str]] = {}
+        for path, owner in result.conflicts.items():
+            by_owner.setdefault(owner, []).append(path)
+        for owner, paths in by_owner.items():
+            warning(f"Dateikonflikt: {result.package} überschreibt {len(paths)} Dateien von {owner} "
+                    f"(z.B. {paths[0]})")
+            for path in paths:
+                debug("[conflict] %s: %s → %s", path, owner, result.package)
+
+    # -------------------------------------------------------------
+    # Entfernen
+    # -------------------------------------------------------------
+    def _unlink(self, paths: list[str]) -> int:
+        removed = 0
+        for rel in paths:
+            try:
+                os.unlink(self.rootfs / rel)
+                removed += 1
+            except (FileNotFoundError, IsADirectoryError):
+                pass
+        return removed
+
+    def _remove_empty_dirs(self, candidates: set[str]) -> int:
+        """Entfernt leere Verzeichnisse ohne verbleibenden Besitzer, tiefste zuerst."""
+        with self._lock:
+            owned = set()
+            items = sorted(candidates)
+            for i in range(0, len(items), QUERY_CHUNK):
+                chunk = items[i:i + QUERY_CHUNK]
+                owned.update(row[0] for row in self._db.execute(
+                    f"SELECT DISTINCT path FROM dirs WHERE path IN ({','.join('?' * len(chunk))})", chunk))
+        removed = 0
+        for rel in sorted(candidates - owned, key=lambda d: d.count("/"), reverse=True):
+            try:
+                os.rmdir(self.rootfs / rel)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def remove(self, name: str) -> int:
+        """Deinstalliert ein Paket: löscht seine Dateien und verwaiste Verzeichnisse."""
+        with self._lock:
+            row = self._db.execute("SELECT id FROM packages WHERE name = ? AND filename != ''", (name,)).fetchone()
+            if row is None:
+                raise KeyError(f"Paket nicht installiert: {name}")
+            pkg_id = row[0]
+            files = [r[0] for r in self._db.execute("SELECT path FROM files WHERE package = ?", (pkg_id,))]
+            dirs = {r[0] for r in self._db.execute("SELECT path FROM dirs WHERE package = ?", (pkg_id,))}
+            # Überschriebene Dateien anderer Pakete verschwinden mit (sofern noch in unserem Besitz)
+            shadowed = self._db.execute(
+                "SELECT c.previous, COUNT(DISTINCT c.path) FROM conflicts c JOIN files f ON f.path = c.path "
+                "WHERE c.package = ? AND f.package = ? GROUP BY c.previous", (name, pkg_id)
+            ).fetchall()
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM files WHERE package = ?", (pkg_id,))
+            self._db.execute("DELETE FROM dirs WHERE package = ?", (pkg_id,))
+            self._db.execute("DELETE FROM conflicts WHERE package = ? OR previous = ?", (name, name))
+            self._db.execute("DELETE FROM packages WHERE id = ?", (pkg_id,))
+            self._db.execute("COMMIT")
+
+        removed = self._unlink(files)
+        dirs_removed = self._remove_empty_dirs(dirs)
+        for previous, count in shadowed:
+            warning(f"{name} hatte {count} Dateien von {previous} überschrieben – {previous} neu installieren")
+        success(f"{name} entfernt ({removed} Dateien, {dirs_removed} Verzeichnisse)")
+        return removed
+
@@ -1,14 +1,46 @@
 import shutil
-import subprocess
 import os
 import stat
 from pathlib import Path
 
+from manager.extractor import PackageExtractor
+from manager.filedb import FileOwnershipDB
+from manager.pkgcache import CacheEntry, PackageCache, parse_pkg_filename, select_latest
+from manager.repodb import RepoIndex, RepoMirror, isolated_dbpath
+from utils.execute import get_executor
+from utils.reproducible import ROOT_OWNER, normalize_tree
+
+# Host-Konfiguration von pacman → Ziel im RootFS
+PACMAN_CONFIG_SOURCES = (
+    ("/etc/pacman.conf", "etc/pacman.conf"),
+    ("/etc/pacman.d", "etc/pacman.d"),
+    ("/usr/share/pacman", "usr/share/pacman"),
+)
+
 
 class PacmanRootFSInstaller:
-    def __init__(self, rootfs: Path, cache_dir: Path):
+    def __init__(self, rootfs: Path, cache_dir: Path, jobs: int = 1, backend: str = "auto",
+                 store: PackageCache | None = None, index: RepoIndex | None = None,
+                 mirror: RepoMirror | None = None, filedb: FileOwnershipDB | None = None,
+                 epoch: int | None = None, dbpath: Path | None = None):
         self.rootfs = Path(rootfs)
         self.cache_dir = Path(cache_dir)
+        # Leere lokale DB für Host-pacman, damit Abhängigkeiten nicht am Host-Stand hängen
+        self.dbpath = Path(dbpath) if dbpath else self.cache_dir.parent / "pacman-db"
+        self.jobs = jobs
+        self.backend = backend
+        self.store = store
+        # Eigener Resolver + Mirror statt Host-pacman (optional)
+        self.index = index
+        self.mirror = mirror
+        # Dateibesitz im RootFS (für Konflikte, Entfernen und Ersetzen)
+        self.filedb = filedb
+        # SOURCE_DATE_EPOCH für reproduzierbare Extraktion (None = aus)
+        self.epoch = epoch
+        # Zuletzt per download_packages geladene Paketliste und ihre Auflösung
+        # (name, version, arch, dateiname) – genau eine Version pro Paket
+        self.downloaded: list[str] | None = None
+        self.targets: list[tuple[str, str, str, str]] | None = None
 
     # -------------------------------------------------------------
     # STATIC: UNIX Sonderdateien erkennen
@@ -52,65 +84,153 @@ class PacmanRootFSInstaller:
     # -------------------------------------------------------------
     # PACMAN CONFIGS INS ROOTFS
     # -------------------------------------------------------------
-    def copy_pacman_configs(self):
+    def copy_pacman_configs(self, rootfs: Path | None = None):
         print("[INFO] Copying pacman config...")
 
-        (self.rootfs / "etc/pacman.d").mkdir(parents=True, exist_ok=True)
-        (self.rootfs / "usr/share/pacman").mkdir(parents=True, exist_ok=True)
-
-        # pacman.conf kopieren
-        shutil.copy2("/etc/pacman.conf", self.rootfs / "etc/pacman.conf")
-
-        # pacman.d (mit Skip für sockets)
-        self.safe_copytree(
-            Path("/etc/pacman.d"),
-            self.rootfs / "etc/pacman.d"
-        )
-
-        # /usr/share/pacman
-        self.safe_copytree(
-            Path("/usr/share/pacman"),
-            self.rootfs / "usr/share/pacman"
-        )
+        for source, target in PACMAN_CONFIG_SOURCES:
+            source, target = Path(source), Path(rootfs or self.rootfs) / target
+            if source.is_dir():
+                # mit Skip für sockets
+                target.mkdir(parents=True, exist_ok=True)
+                self.safe_copytree(source, target)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(source, target)
+            if self.epoch is not None:
+                if target.is_dir():
+                    normalize_tree(target, self.epoch, ROOT_OWNER)
+                else:
+                    normalize_tree(target.parent, self.epoch, ROOT_OWNER, [target.name])
 
         print("✓ pacman config copied safely.")
 
     # -------------------------------------------------------------
-    # PACMAN PAKETE HERUNTERLADEN
+    # AUFGELÖSTE ZIELE (inkl. Abhängigkeiten) OHNE DOWNLOAD
     # -------------------------------------------------------------
-    def download_packages(self, pkgs: list[str]):
+    def resolve_targets(self, pkgs: list[str]) -> list[tuple[str, str, str, str]]:
+        """
+        (name, version, arch, dateiname) aller Pakete, die pacman -Sw laden würde –
+        aufgelöst gegen eine leere lokale DB, also inkl. aller Abhängigkeiten.
+        """
+        if self.index:
+            return [(pkg.name, pkg.version, pkg.arch, pkg.filename) for pkg in self.index.resolve(pkgs)]
+
         cmd = [
             "pacman",
-            "-Sw",
+            "-Sp",
             "--noconfirm",
+            "--print-format", "%n %v %a %f",
             "--cachedir", str(self.cache_dir),
+            "--dbpath", str(isolated_dbpath(self.dbpath)),
         ] + pkgs
 
-        print(f"[INFO] Downloading via pacman: {pkgs}")
-        subprocess.run(cmd, check=True)
+        result = get_executor().run(cmd, desc="pacman -Sp", capture=True).check()
+        return [tuple(line.split()) for line in result.stdout.decode().splitlines() if line.count(" ") == 3]
+
+    # -------------------------------------------------------------
+    # PACMAN PAKETE HERUNTERLADEN
+    # -------------------------------------------------------------
+    def download_packages(self, pkgs: list[str]):
+        # Erst auflösen, dann nur die benötigten gecachten Pakete zurücklegen,
+        # damit pacman bzw. der Mirror sie nicht erneut lädt
+        if self.index:
+            resolved = self.index.resolve(pkgs)
+            self.targets = [(pkg.name, pkg.version, pkg.arch, pkg.filename) for pkg in resolved]
+        else:
+            self.targets = self.resolve_targets(pkgs)
+        if self.store:
+            self.store.restore_dir(self.cache_dir, {target[3] for target in self.targets})
+
+        if self.index and self.mirror:
+            print(f"[INFO] Downloading from mirror: {pkgs}")
+            self.mirror.fetch_packages(resolved, self.cache_dir, jobs=self.jobs)
+        else:
+            cmd = [
+                "pacman",
+                "-Sw",
+                "--noconfirm",
+                "--cachedir", str(self.cache_dir),
+                "--dbpath", str(isolated_dbpath(self.dbpath)),
+            ] + pkgs
+
+            print(f"[INFO] Downloading via pacman: {pkgs}")
+            get_executor().run(cmd, desc="pacman -Sw", echo=True, interactive=True).check()
+        self.downloaded = list(pkgs)
         print("✓ Pakete in Cache heruntergeladen.")
 
     # -------------------------------------------------------------
     # PAKETE INS ROOTFS EXTRAHIEREN
     # -------------------------------------------------------------
-    def extract_all_packages(self):
+    def collect_packages(self) -> tuple[list[Path], list[CacheEntry]]:
+        """
+        Zu installierende Paketdateien (bei Paket-Cache: dessen Objekte) und
+        Cache-Einträge: genau die aufgelösten Versionen des letzten Downloads,
+        per Schlüssel (Name, Version, Arch) bzw. Dateiname nachgeschlagen.
+        Ohne Auflösung gilt pro Paketname die neueste Version im Cache.
+        """
         self.cache_dir.mkdir(parents=True, exist_ok=True)
 
-        pkg_files = list(self.cache_dir.glob("*.pkg.tar.zst"))
+        if self.targets is None:
+            pkg_files = select_latest(list(self.cache_dir.glob("*.pkg.tar.zst")))
+            print(f"[INFO] Keine Auflösung vorhanden, nutze neueste Version pro Paket ({len(pkg_files)})")
+            targets = [(*parse_pkg_filename(p.name), p.name) for p in pkg_files]
+        else:
+            targets = self.targets
+
+        pkg_files: list[Path] = []
+        entries: list[CacheEntry] = []
+        missing: list[str] = []
+        for name, version, arch, filename in targets:
+            entry = self.store.get(name, version, arch) if self.store else None
+            if entry and self.store.object_path(entry).exists():
+                entries.append(entry)
+                pkg_files.append(self.store.object_path(entry))
+                continue
+            path = self.cache_dir / filename
+            if not path.exists():
+                missing.append(filename)
+            elif self.store and (entry := self.store.add(path)):
+                entries.append(entry)
+                pkg_files.append(self.store.object_path(entry))
+            else:
+                pkg_files.append(path)
+        if missing:
+            raise FileNotFoundError(f"Aufgelöste Pakete fehlen im Cache: {', '.join(missing)}")
+        return pkg_files, entries
+
+    def extract_all_packages(self, jobs: int | None = None):
+        pkg_files, entries = self.collect_packages()
 
         if not pkg_files:
             print("⚠ Keine .pkg.tar.zst Dateien im Cache gefunden.")
             return
 
-        for pkg in pkg_files:
-            print(f"[EXTRACT] {pkg.name}")
-            subprocess.run(
-                ["bsdtar", "-xpf", str(pkg), "-C", str(self.rootfs)],
-                check=True
-            )
+        if entries:
+            # Paket-Cache des Zielsystems per Reflink/Hardlink statt Kopie
+            self.store.link_into(entries, self.rootfs / "var/cache/pacman/pkg")
+
+        extractor = PackageExtractor(self.rootfs, jobs=jobs or self.jobs, backend=self.backend, filedb=self.filedb,
+                                     epoch=self.epoch)
+        extractor.extract_all(pkg_files)
 
         print("✓ Alle Pakete erfolgreich extrahiert.")
 
+    # -------------------------------------------------------------
+    # EINZELNE PAKETE ENTFERNEN / ERSETZEN
+    # -------------------------------------------------------------
+    def remove_package(self, name: str) -> int:
+        """Entfernt ein installiertes Paket anhand der Dateibesitz-Datenbank."""
+        if self.filedb is None:
+            raise RuntimeError("Entfernen braucht die Dateibesitz-Datenbank (filedb)")
+        return self.filedb.remove(name)
+
+    def replace_package(self, pkg_file: Path):
+        """Installiert eine neue Paketversion an Ort und Stelle; veraltete Dateien werden entfernt."""
+        if self.filedb is None:
+            raise RuntimeError("Ersetzen braucht die Dateibesitz-Datenbank (filedb)")
+        extractor = PackageExtractor(self.rootfs, jobs=1, backend=self.backend, filedb=self.filedb, epoch=self.epoch)
+        extractor.extract_all([Path(pkg_file)])
+
     # -------------------------------------------------------------
     # KOMBINIERTE INSTALLATION
     # -------------------------------------------------------------
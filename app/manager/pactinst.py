@@ -1,7 +1,12 @@
 import subprocess
 from pathlib import Path
 from utils.logger import debug, info, warning, error, success
-from utils.execute import run_command, run_command_live
+from utils.execute import get_executor, run_command, run_command_live
+from manager.extractor import PackageExtractor
+from manager.filedb import FileOwnershipDB
+from manager.pkgcache import PackageCache, select_latest
+from manager.repodb import RepoIndex, RepoMirror, isolated_dbpath
+
 class Pacman:
     """
     Pacman Wrapper für RootFS-Buildsystem.
@@ -11,12 +16,22 @@ class Pacman:
         - Download in Cache (Variante B)
     """
 
-    def __init__(self, rootfs_dir: Path | str = None, pacman_cache: Path | str = None, update_cache: bool = False):
+    def __init__(self, rootfs_dir: Path | str = None, pacman_cache: Path | str = None, update_cache: bool = False, jobs: int = 1, backend: str = "auto",
+                 store: PackageCache | None = None, index: RepoIndex | None = None, mirror: RepoMirror | None = None,
+                 filedb: FileOwnershipDB | None = None):
         self.rootfs = Path(rootfs_dir) if rootfs_dir else None
         self.pacman_cache = Path(pacman_cache) if pacman_cache else None
+        self.jobs = jobs
+        self.backend = backend
+        self.store = store
+        self.index = index
+        self.mirror = mirror
+        self.filedb = filedb
 
         if self.pacman_cache:
             self.pacman_cache.mkdir(parents=True, exist_ok=True)
+        # Leere lokale DB für -Sp/-Sw: Abhängigkeiten unabhängig vom Host-Stand
+        self.dbpath = self.pacman_cache.parent / "pacman-db" if self.pacman_cache else None
 
         if update_cache:
             self._update_db()
@@ -24,7 +39,7 @@ class Pacman:
     def _run(self, cmd: list):
         debug(f"Running: {' '.join(cmd)}")
         try:
-            subprocess.run(cmd, check=True)
+            get_executor().run(cmd, desc=" ".join(cmd[:3]), echo=True, interactive=True).check()
         except subprocess.CalledProcessError as e:
             error(f"Command failed: {e}")
             raise
@@ -60,26 +75,68 @@ class Pacman:
         if not packages:
             return
 
-        cmd = ["pacman", "-Sw", "--noconfirm"] + packages
-        if self.pacman_cache:
-            cmd += [f"--cachedir={self.pacman_cache}"]
+        if self.store and self.pacman_cache:
+            self.store.restore_dir(self.pacman_cache)
 
-        info(f"Downloading packages into cache: {packages}")
-        self._run(cmd)
+        if self.index and self.mirror and self.pacman_cache:
+            # Eigener Resolver: keine Host-pacman-DB nötig, auch offline
+            info(f"Downloading packages from mirror: {packages}")
+            self.mirror.fetch_packages(self.index.resolve(packages), self.pacman_cache, jobs=self.jobs)
+        else:
+            cmd = ["pacman", "-Sw", "--noconfirm"] + packages
+            if self.pacman_cache:
+                cmd += [f"--cachedir={self.pacman_cache}", f"--dbpath={isolated_dbpath(self.dbpath)}"]
+
+            info(f"Downloading packages into cache: {packages}")
+            self._run(cmd)
+
+        if self.store and self.pacman_cache:
+            self.store.ingest_dir(self.pacman_cache)
 
-    def extract_packages_to_rootfs(self):
-        """Extrahiert alle Pakete aus Cache ins RootFS"""
+    def resolve_files(self, packages: list[str]) -> list[Path]:
+        """
+        Paketdateien im Cache für ``packages`` inkl. Abhängigkeiten – genau eine
+        aufgelöste Version pro Paket, per Dateiname statt Glob nachgeschlagen.
+        """
+        if self.index:
+            filenames = [pkg.filename for pkg in self.index.resolve(packages)]
+        else:
+            cmd = ["pacman", "-Sp", "--noconfirm", "--print-format", "%f"] + packages
+            if self.dbpath:
+                cmd += [f"--dbpath={isolated_dbpath(self.dbpath)}"]
+            result = get_executor().run(cmd, desc="pacman -Sp", capture=True).check()
+            filenames = [line for line in result.stdout.decode().splitlines() if line and "/" not in line]
+
+        files = [self.pacman_cache / filename for filename in filenames]
+        missing = [f.name for f in files if not f.exists()]
+        if missing:
+            raise FileNotFoundError(f"Aufgelöste Pakete fehlen im Cache: {', '.join(missing)}")
+        return files
+
+    def select_files(self, packages: list[str] | None) -> list[Path]:
+        """Aufgelöste Dateien für ``packages``; ohne Liste die neueste Version pro Paket im Cache."""
+        if packages:
+            return self.resolve_files(packages)
+        return select_latest(list(self.pacman_cache.glob("*.pkg.tar.zst")))
+
+    def extract_packages_to_rootfs(self, packages: list[str] | None = None, jobs: int | None = None):
+        """Extrahiert die aufgelösten Pakete aus dem Cache ins RootFS (optional parallel)"""
         if not self.rootfs or not self.pacman_cache:
             raise ValueError("RootFS und Pacman-Cache müssen angegeben sein!")
 
-        pkg_files = list(self.pacman_cache.glob("*.pkg.tar.*.zst"))
+        pkg_files = self.select_files(packages)
         if not pkg_files:
             warning("Keine Pakete im Cache gefunden zum Extrahieren!")
             return
 
-        for pkg_file in pkg_files:
-            info(f"Extracting {pkg_file.name} into RootFS...")
-            self._run(["bsdtar", "-xpf", str(pkg_file), "-C", str(self.rootfs)])
+        if self.store:
+            entries = [e for e in map(self.store.add, pkg_files) if e]
+            pkg_files = [self.store.object_path(e) for e in entries]
+            self.store.link_into(entries, self.rootfs / "var/cache/pacman/pkg")
+
+        info(f"Extracting {len(pkg_files)} packages into RootFS...")
+        PackageExtractor(self.rootfs, jobs=jobs or self.jobs, backend=self.backend,
+                         filedb=self.filedb).extract_all(pkg_files)
     
     def install_local_packages(self, packages: list[str], rootfs: Path) -> bool:
         """
@@ -97,16 +154,12 @@ class Pacman:
             error(f"Cache-Verzeichnis existiert nicht: {cache_dir}")
             return False
 
-        # Liste der tatsächlichen .zst-Dateien erstellen
-        zst_files = []
-        for pkg in packages:
-            matches = list(f"{pkg}-*.zst")
-            if not matches:
-                error(f"❌ Paket {pkg} nicht im Cache gefunden (fehlendes .zst)")
-                return False
-            # Nimm das neueste Paket (falls mehrere Versionen existieren)
-            matches.sort()
-            zst_files.append(matches[-1])
+        # Aufgelöste .zst-Dateien (eine Version pro Paket, inkl. Abhängigkeiten)
+        try:
+            zst_files = self.resolve_files(packages)
+        except (FileNotFoundError, ValueError, subprocess.CalledProcessError) as e:
+            error(f"❌ Pakete nicht im Cache gefunden: {e}")
+            return False
 
         info(f"📦 Zu installierende Dateien: {zst_files}")
 
@@ -121,15 +174,14 @@ class Pacman:
 
         return run_command(cmd, desc="Installiere lokal gecachte Pakete ins RootFS")
 
-    def install(self):
+    def install(self, packages: list[str] | None = None):
         if not self.rootfs or not self.pacman_cache:
             raise ValueError("RootFS und Pacman-Cache müssen angegeben sein!")
 
-        pkg_files = list(self.pacman_cache.glob("*.pkg.tar.*"))
+        pkg_files = self.select_files(packages)
         if not pkg_files:
             warning("Keine Pakete im Cache gefunden zum Extrahieren!")
             return
 
-        for pkg_file in pkg_files:
-            info(f"Extracting {pkg_file.name} into RootFS...")
-            self._run(["sudo", "pacman", "-U", str(pkg_file), "--root", "/mnt/nexuzfs/work/rootfs"])
\ No newline at end of file
+        info(f"Installing {len(pkg_files)} packages into RootFS...")
+        self._run(["sudo", "pacman", "-U", "--noconfirm", "--root", str(self.rootfs)] + [str(f) for f in pkg_files])
\ No newline at end of file
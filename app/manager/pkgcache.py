@@ -0,0 +1,280 @@
+# manager/pkgcache.py
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from utils.fscopy import link_or_copy
+from utils.logger import debug, info, success
+
+PKG_SUFFIXES = (".pkg.tar.zst", ".pkg.tar.xz", ".pkg.tar.gz", ".pkg.tar")
+HASH_CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    name      TEXT NOT NULL,
+    version   TEXT NOT NULL,
+    arch      TEXT NOT NULL,
+    sha256    TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    filename  TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (name, version, arch)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS packages_sha256 ON packages (sha256);
+CREATE INDEX IF NOT EXISTS packages_lru ON packages (last_used);
+CREATE TABLE IF NOT EXISTS sources (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256   TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    name: str
+    version: str
+    arch: str
+    sha256: str
+    size: int
+    filename: str
+
+
+def parse_pkg_filename(filename: str) -> tuple[str, str, str] | None:
+    """``name-pkgver-pkgrel-arch.pkg.tar.zst`` → (name, pkgver-pkgrel, arch)"""
+    for suffix in PKG_SUFFIXES:
+        if filename.endswith(suffix):
+            stem = filename[: -len(suffix)]
+            break
+    else:
+        return None
+    parts = stem.rsplit("-", 3)
+    if len(parts) != 4:
+        return None
+    name, pkgver, pkgrel, arch = parts
+    return name, f"{pkgver}-{pkgrel}", arch
+
+
+def select_latest(paths: list[Path]) -> list[Path]:
+    """Pro Paketname nur die neueste Version (vercmp); Nicht-Paketdateien fallen heraus."""
+    from manager.repodb import vercmp
+
+    latest: dict[str, tuple[str, Path]] = {}
+    for path in paths:
+        parsed = parse_pkg_filename(Path(path).name)
+        if parsed is None:
+            continue
+        name, version, _ = parsed
+        current = latest.get(name)
+        if current is None or vercmp(version, current[0]) > 0:
+            latest[name] = (version, Path(path))
+    return [path for _, path in sorted(latest.values(), key=lambda item: item[1].name)]
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PackageCache:
+    """
+    Persistenter, inhaltsadressierter Paket-Cache außerhalb des RootFS.
+
+    Objekte liegen unter ``objects/<sha[:2]>/<sha256>/<dateiname>``, der Index
+    (SQLite) bildet (name, version, arch) → sha256 ab. Bereits gehashte
+    Quelldateien werden über (Pfad, Größe, mtime) wiedererkannt, damit ein
+    erneuter Lauf nichts neu hashen muss.
+    """
+
+    def __init__(self, root: Path | str, max_bytes: int | None = None):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.root / "index.sqlite", check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    # -------------------------------------------------------------
+    # Lookup
+    # -------------------------------------------------------------
+    def object_path(self, entry: CacheEntry) -> Path:
+        return self.objects / entry.sha256[:2] / entry.sha256 / entry.filename
+
+    def lookup(self, name: str, version: str | None = None, arch: str | None = None) -> list[CacheEntry]:
+        """Alle Einträge zu ``name`` (optional auf Version/Arch eingeschränkt)."""
+        query = "SELECT name, version, arch, sha256, size, filename FROM packages WHERE name = ?"
+        params: list = [name]
+        if version is not None:
+            query += " AND version = ?"
+            params.append(version)
+        if arch is not None:
+            query += " AND arch = ?"
+            params.append(arch)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [CacheEntry(*row) for row in rows]
+
+    def get(self, name: str, version: str, arch: str) -> CacheEntry | None:
+        entries = self.lookup(name, version, arch)
+        return entries[0] if entries else None
+
+    def touch(self, entries: list[CacheEntry]):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE packages SET last_used = ? WHERE name = ? AND version = ? AND arch = ?",
+                [(now, e.name, e.version, e.arch) for e in entries],
+            )
+
+    # -------------------------------------------------------------
+    # Aufnahme
+    # -------------------------------------------------------------
+    def add(self, path: Path) -> CacheEntry | None:
+        """Nimmt eine Paketdatei auf (Hardlink/Reflink ins Objektverzeichnis)."""
+        path = Path(path)
+        parsed = parse_pkg_filename(path.name)
+        if parsed is None:
+            debug(f"Kein Paketdateiname, übersprungen: {path.name}")
+            return None
+
+        st = path.stat()
+        key = str(path.resolve())
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256 FROM sources WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (key, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        sha = row[0] if row else sha256_file(path)
+
+        entry = CacheEntry(*parsed, sha, st.st_size, path.name)
+        obj = self.object_path(entry)
+        if not obj.exists():
+            # Gleicher Inhalt unter anderem Namen: vorhandenes Objekt verlinken
+            existing = next(obj.parent.iterdir(), None) if obj.parent.exists() else None
+            link_or_copy(existing or path, obj)
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT OR REPLACE INTO sources (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (key, st.st_size, st.st_mtime_ns, sha),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO packages (name, version, arch, sha256, size, filename, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry.name, entry.version, entry.arch, sha, entry.size, entry.filename, time.time()),
+            )
+            self._db.execute("COMMIT")
+        return entry
+
+    def ingest_dir(self, directory: Path) -> list[CacheEntry]:
+        """Nimmt alle Paketdateien eines Download-Verzeichnisses auf."""
+        entries = []
+        for path in sorted(Path(directory).iterdir()):
+            if path.is_file() and path.name.endswith(PKG_SUFFIXES):
+                entry = self.add(path)
+                if entry:
+                    entries.append(entry)
+        info(f"Paket-Cache: {len(entries)} Pakete indiziert ({self.root})")
+        return entries
+
+    def restore_dir(self, directory: Path, filenames: set[str] | None = None) -> int:
+        """
+        Legt fehlende, bereits gecachte Pakete wieder im Download-Verzeichnis ab
+        (mit ``filenames`` nur diese).
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            rows = self._db.execute("SELECT name, version, arch, sha256, size, filename FROM packages").fetchall()
+        restored = 0
+        for entry in map(lambda row: CacheEntry(*row), rows):
+            if filenames is not None and entry.filename not in filenames:
+                continue
+            target = directory / entry.filename
+            obj = self.object_path(entry)
+            if not target.exists() and obj.exists():
+                link_or_copy(obj, target)
+                restored += 1
+        if restored:
+            debug(f"Paket-Cache: {restored} Pakete nach {directory} verlinkt")
+        return restored
+
+    def link_into(self, entries: list[CacheEntry], directory: Path) -> dict[str, int]:
+        """Verlinkt Pakete (Reflink/Hardlink, sonst Kopie) in ein Zielverzeichnis."""
+        methods: dict[str, int] = {}
+        for entry in entries:
+            target = Path(directory) / entry.filename
+            if target.exists() and target.stat().st_size == entry.size:
+                continue
+            method = link_or_copy(self.object_path(entry), target)
+            methods[method] = methods.get(method, 0) + 1
+        self.touch(entries)
+        if methods:
+            debug(f"Pakete nach {directory} übernommen: {methods}")
+        return methods
+
+    # -------------------------------------------------------------
+    # Verdrängung (LRU)
+    # -------------------------------------------------------------
+    def total_size(self) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM packages)").fetchone()
+        return row[0]
+
+    def evict(self, max_bytes: int | None = None) -> int:
+        """Entfernt die am längsten ungenutzten Pakete, bis der Cache unter ``max_bytes`` liegt."""
+        limit = max_bytes if max_bytes is not None else self.max_bytes
+        if limit is None:
+            return 0
+
+        total = self.total_size()
+        freed = 0
+        if total <= limit:
+            return 0
+
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, version, arch, sha256, size, filename FROM packages ORDER BY last_used"
+            ).fetchall()
+        for entry in map(lambda row: CacheEntry(*row), rows):
+            if total - freed <= limit:
+                break
+            with self._lock:
+                self._db.execute(
+                    "DELETE FROM packages WHERE name = ? AND version = ? AND arch = ?",
+                    (entry.name, entry.version, entry.arch),
+                )
+                shared = self._db.execute("SELECT 1 FROM packages WHERE sha256 = ?", (entry.sha256,)).fetchone()
+                sources = []
+                if not shared:
+                    sources = [row[0] for row in self._db.execute(
+                        "SELECT path FROM sources WHERE sha256 = ?", (entry.sha256,))]
+                    self._db.execute("DELETE FROM sources WHERE sha256 = ?", (entry.sha256,))
+            if shared:
+                continue
+            # Auch die Download-Kopien entfernen, sonst bleibt der Inode belegt
+            for path in [str(self.object_path(entry)), *sources]:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            shutil.rmtree(self.object_path(entry).parent, ignore_errors=True)
+            freed += entry.size
+
+        success(f"Paket-Cache verkleinert: {freed / 2**20:.1f} MiB freigegeben")
+        return freed
@@ -0,0 +1,476 @@
+# manager/repodb.py
+import hashlib
+import marshal
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlsplit
+from manager.pkgcache import sha256_file
+from utils.fscopy import link_or_copy
+from utils.logger import debug, info, success, warning
+from utils.zstd import HAVE_ZSTD, open_zstd_reader
+
+CACHE_VERSION = 1
+DEFAULT_REPOS = ("core", "extra")
+HOST_DBPATH = Path("/var/lib/pacman")
+_DEP_RE = re.compile(r"^([^<>=]+)(<=|>=|<|>|=)?(.*)$")
+_ALPHA = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+_DIGITS = frozenset("0123456789")
+_ALNUM = _ALPHA | _DIGITS
+
+
+# -------------------------------------------------------------
+# Versionsvergleich (wie alpm_pkg_vercmp)
+# -------------------------------------------------------------
+def _rpmvercmp(a: str, b: str) -> int:
+    if a == b:
+        return 0
+    one = two = 0
+    ptr1 = ptr2 = 0
+    la, lb = len(a), len(b)
+    while one < la and two < lb:
+        while one < la and a[one] not in _ALNUM:
+            one += 1
+        while two < lb and b[two] not in _ALNUM:
+            two += 1
+        if one >= la or two >= lb:
+            break
+        # Unterschiedlich lange Trenner entscheiden sofort
+        if one - ptr1 != two - ptr2:
+            return -1 if one - ptr1 < two - ptr2 else 1
+        ptr1, ptr2 = one, two
+        chars = _DIGITS if a[ptr1] in _DIGITS else _ALPHA
+        isnum = chars is _DIGITS
+        while ptr1 < la and a[ptr1] in chars:
+            ptr1 += 1
+        while ptr2 < lb and b[ptr2] in chars:
+            ptr2 += 1
+        seg1, seg2 = a[one:ptr1], b[two:ptr2]
+        if not seg1:
+            return -1
+        if not seg2:
+            return 1 if isnum else -1
+        if isnum:
+            seg1, seg2 = seg1.lstrip("0"), seg2.lstrip("0")
+            if len(seg1) != len(seg2):
+                return 1 if len(seg1) > len(seg2) else -1
+        if seg1 != seg2:
+            return 1 if seg1 > seg2 else -1
+        one, two = ptr1, ptr2
+
+    if one >= la and two >= lb:
+        return 0
+    # Ein übrig gebliebener Alpha-Teil ist nie neuer als nichts
+    if (one >= la and b[two] not in _ALPHA) or (one < la and a[one] in _ALPHA):
+        return -1
+    return 1
+
+
+def _parse_evr(version: str) -> tuple[str, str, str | None]:
+    digits = len(version) - len(version.lstrip("0123456789"))
+    if version[digits:digits + 1] == ":":
+        epoch, rest = version[:digits] or "0", version[digits + 1:]
+    else:
+        epoch, rest = "0", version
+    ver, sep, rel = rest.rpartition("-")
+    return (epoch, ver, rel) if sep else (epoch, rest, None)
+
+
+def vercmp(a: str, b: str) -> int:
+    """Vergleicht zwei pacman-Versionen (``[epoch:]pkgver[-pkgrel]``): -1, 0 oder 1."""
+    if a == b:
+        return 0
+    e1, v1, r1 = _parse_evr(a)
+    e2, v2, r2 = _parse_evr(b)
+    ret = _rpmvercmp(e1, e2)
+    if ret == 0:
+        ret = _rpmvercmp(v1, v2)
+        if ret == 0 and r1 and r2:
+            ret = _rpmvercmp(r1, r2)
+    return ret
+
+
+def parse_dep(dep: str) -> tuple[str, str, str]:
+    """``glibc>=2.38`` → (``glibc``, ``>=``, ``2.38``); ohne Version sind op/ver leer."""
+    match = _DEP_RE.match(dep.strip())
+    name, op, ver = match.groups() if match else (dep, None, "")
+    return name, op or "", ver if op else ""
+
+
+def _version_matches(version: str, op: str, wanted: str) -> bool:
+    if not op:
+        return True
+    cmp = vercmp(version, wanted)
+    return {"=": cmp == 0, ">=": cmp >= 0, "<=": cmp <= 0, ">": cmp > 0, "<": cmp < 0}[op]
+
+
+# -------------------------------------------------------------
+# Sync-Datenbanken
+# -------------------------------------------------------------
+@dataclass(frozen=True, slots=True)
+class RepoPackage:
+    repo: str
+    name: str
+    version: str
+    arch: str
+    filename: str
+    csize: int
+    sha256: str
+    depends: tuple[str, ...] = ()
+    provides: tuple[str, ...] = ()
+    groups: tuple[str, ...] = ()
+
+    def satisfies(self, name: str, op: str, wanted: str) -> bool:
+        if self.name == name and _version_matches(self.version, op, wanted):
+            return True
+        for provide in self.provides:
+            pname, _, pver = parse_dep(provide)
+            if pname != name:
+                continue
+            # Unversionierte Provides erfüllen keine versionierten Abhängigkeiten
+            if not op or (pver and _version_matches(pver, op, wanted)):
+                return True
+        return False
+
+
+def parse_desc(text: str) -> dict[str, list[str]]:
+    """``%FELD%``-Blöcke einer desc-Datei → {FELD: [Zeilen]}."""
+    fields: dict[str, list[str]] = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith("%") and line.endswith("%") and len(line) > 2:
+            current = fields.setdefault(line[1:-1], [])
+        elif line and current is not None:
+            current.append(line)
+        else:
+            current = None
+    return fields
+
+
+def _record(repo: str, desc: dict[str, list[str]]) -> tuple:
+    first = lambda key, default="": desc.get(key, [default])[0]
+    return (
+        repo, first("NAME"), first("VERSION"), first("ARCH", "any"), first("FILENAME"),
+        int(first("CSIZE", "0")), first("SHA256SUM"),
+        tuple(desc.get("DEPENDS", ())), tuple(desc.get("PROVIDES", ())), tuple(desc.get("GROUPS", ())),
+    )
+
+
+@contextmanager
+def _open_db(path: Path):
+    """Öffnet eine Sync-DB (tar, gz/xz/bz2 oder zstd) als Tar-Stream."""
+    with open(path, "rb") as raw:
+        zstd = raw.read(4) == b"\x28\xb5\x2f\xfd"
+        raw.seek(0)
+        if not zstd:
+            with tarfile.open(fileobj=raw, mode="r|*") as tar:
+                yield tar
+        elif HAVE_ZSTD:
+            with open_zstd_reader(raw) as stream, tarfile.open(fileobj=stream, mode="r|") as tar:
+                yield tar
+        else:
+            proc = subprocess.Popen(["zstd", "-dcq", str(path)], stdout=subprocess.PIPE)
+            try:
+                with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+                    yield tar
+            finally:
+                proc.stdout.close()
+                proc.wait()
+
+
+def read_db(repo: str, path: Path | str) -> list[tuple]:
+    """Liest alle ``*/desc``-Einträge einer Sync-DB als kompakte Records."""
+    records = []
+    with _open_db(Path(path)) as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith("/desc"):
+                text = tar.extractfile(member).read().decode("utf-8", "replace")
+                records.append(_record(repo, parse_desc(text)))
+    return records
+
+
+class RepoIndex:
+    """
+    Index über pacman-Sync-Datenbanken (``<repo>.db``) ohne Host-pacman.
+
+    Die desc-Einträge werden einmal gelesen und als marshal-Datei unter
+    ``cache_dir`` abgelegt; solange Größe und mtime der Datenbanken gleich
+    bleiben, wird nur der Cache geladen. Der Index löst Namen, Provides und
+    Gruppen auf und berechnet die transitive Hülle der Abhängigkeiten wie
+    pacman: Repo-Reihenfolge entscheidet, exakte Namen vor Provides, bereits
+    gewählte Pakete erfüllen weitere Abhängigkeiten.
+    """
+
+    def __init__(self, databases: list[tuple[str, Path | str]], cache_dir: Path | str | None = None):
+        self.databases = [(repo, Path(path)) for repo, path in databases]
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.packages: list[RepoPackage] = []
+        self.by_name: dict[str, RepoPackage] = {}
+        self.providers: dict[str, list[RepoPackage]] = {}
+        self.groups: dict[str, list[RepoPackage]] = {}
+
+    # -------------------------------------------------------------
+    # Laden & Cache
+    # -------------------------------------------------------------
+    def _cache_file(self) -> Path:
+        key = hashlib.sha256("\0".join(f"{repo}={path.resolve()}" for repo, path in self.databases).encode())
+        return self.cache_dir / f"repodb-{key.hexdigest()[:16]}.marshal"
+
+    def _stamps(self) -> list[tuple[int, int]]:
+        return [(st.st_size, st.st_mtime_ns) for st in (os.stat(path) for _, path in self.databases)]
+
+    def _load_cached(self, stamps) -> list[tuple] | None:
+        try:
+            with open(self._cache_file(), "rb") as f:
+                cached = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION:
+            return None
+        if [tuple(s) for s in cached["stamps"]] != stamps:
+            return None
+        return cached["records"]
+
+    def _write_cache(self, stamps, records):
+        cache_file = self._cache_file()
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                marshal.dump({"version": CACHE_VERSION, "stamps": stamps, "records": records}, f)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            warning(f"Repo-Index-Cache nicht schreibbar: {e}")
+
+    def load(self) -> "RepoIndex":
+        start = time.perf_counter()
+        missing = [str(path) for _, path in self.databases if not path.exists()]
+        if missing:
+            raise FileNotFoundError(f"Sync-Datenbanken fehlen: {', '.join(missing)}")
+
+        stamps = self._stamps()
+        records = self._load_cached(stamps) if self.cache_dir else None
+        source = "Cache"
+        if records is None:
+            records = [record for repo, path in self.databases for record in read_db(repo, path)]
+            source = "Datenbanken"
+            if self.cache_dir:
+                self._write_cache(stamps, records)
+
+        self._build([RepoPackage(*record) for record in records])
+        debug(f"Repo-Index aus {source}: {len(self.packages)} Pakete "
+              f"({time.perf_counter() - start:.3f}s)")
+        return self
+
+    def _build(self, packages: list[RepoPackage]):
+        self.packages = packages
+        self.by_name, self.providers, self.groups = {}, {}, {}
+        for pkg in packages:
+            # Erstes Repo gewinnt (wie die Reihenfolge in pacman.conf)
+            self.by_name.setdefault(pkg.name, pkg)
+            for provide in pkg.provides:
+                self.providers.setdefault(parse_dep(provide)[0], []).append(pkg)
+            for group in pkg.groups:
+                self.groups.setdefault(group, []).append(pkg)
+
+    # -------------------------------------------------------------
+    # Auflösung
+    # -------------------------------------------------------------
+    def find_satisfier(self, dep: str, selected: dict[str, RepoPackage] | None = None) -> RepoPackage | None:
+        name, op, wanted = parse_dep(dep)
+        if selected:
+            # Bereits gewählte Pakete zuerst – per Name bzw. Provides-Index
+            pkg = selected.get(name)
+            if pkg and pkg.satisfies(name, op, wanted):
+                return pkg
+            for pkg in self.providers.get(name, ()):
+                if selected.get(pkg.name) is pkg and pkg.satisfies(name, op, wanted):
+                    return pkg
+        pkg = self.by_name.get(name)
+        if pkg and pkg.satisfies(name, op, wanted):
+            return pkg
+        return next((p for p in self.providers.get(name, ()) if p.satisfies(name, op, wanted)), None)
+
+    def _targets(self, targets: list[str]) -> tuple[list[RepoPackage], list[str]]:
+        found, missing = [], []
+        for target in targets:
+            repo, _, name = target.rpartition("/")
+            if repo:
+                pkg = next((p for p in self.packages if p.repo == repo and p.name == name), None)
+                if pkg:
+                    found.append(pkg)
+                else:
+                    missing.append(target)
+            elif (pkg := self.find_satisfier(name)) is not None:
+                found.append(pkg)
+            elif name in self.groups:
+                found.extend(self.groups[name])
+            else:
+                missing.append(target)
+        return found, missing
+
+    def resolve(self, targets: list[str]) -> list[RepoPackage]:
+        """
+        Transitive Hülle von ``targets`` (Namen, ``repo/name``, Provides oder
+        Gruppen), Abhängigkeiten vor ihren Nutzern. Nicht auflösbare
+        Abhängigkeiten werden gesammelt als ValueError gemeldet.
+        """
+        if not self.packages:
+            self.load()
+        roots, errors = self._targets(targets)
+        errors = [f"Ziel nicht gefunden: {target}" for target in errors]
+        selected: dict[str, RepoPackage] = {}
+        order: list[RepoPackage] = []
+
+        for root in roots:
+            if root.name in selected:
+                continue
+            selected[root.name] = root
+            stack = [(root, iter(root.depends))]
+            while stack:
+                pkg, deps = stack[-1]
+                dep = next(deps, None)
+                if dep is None:
+                    stack.pop()
+                    order.append(pkg)
+                    continue
+                satisfier = self.find_satisfier(dep, selected)
+                if satisfier is None:
+                    errors.append(f"{pkg.name}: Abhängigkeit nicht erfüllbar: {dep}")
+                elif satisfier.name not in selected:
+                    selected[satisfier.name] = satisfier
+                    stack.append((satisfier, iter(satisfier.depends)))
+
+        if errors:
+            raise ValueError("Abhängigkeiten nicht auflösbar:\n  " + "\n  ".join(errors))
+        return order
+
+
+# -------------------------------------------------------------
+# Mirror (lokales Verzeichnis oder HTTP)
+# -------------------------------------------------------------
+class RepoMirror:
+    """
+    pacman-Mirror als Quelle für Sync-Datenbanken und Pakete.
+
+    ``server`` ist eine URL oder ein lokales Verzeichnis, optional mit
+    ``$repo``/``$arch`` wie in pacmans mirrorlist; ohne Platzhalter wird
+    ``/$repo/os/$arch`` angehängt. Lokale Mirrors funktionieren offline
+    (Dateien werden per Reflink/Hardlink übernommen), HTTP läuft über
+    utils.download.
+    """
+
+    def __init__(self, server: str, repos: list[str] | tuple[str, ...] = DEFAULT_REPOS, arch: str = "x86_64"):
+        if "$repo" not in server:
+            server = server.rstrip("/") + "/$repo/os/$arch"
+        self.server = server
+        self.repos = list(repos)
+        self.arch = arch
+        scheme = urlsplit(server).scheme
+        self.remote = scheme in ("http", "https")
+        if scheme == "file":
+            self.server = urlsplit(server).path
+
+    def location(self, repo: str) -> str:
+        return self.server.replace("$repo", repo).replace("$arch", self.arch)
+
+    def _fetch(self, repo: str, filename: str, dest_dir: Path, sha256: str | None = None) -> Path:
+        if self.remote:
+            from utils.download import download_file
+            return download_file(f"{self.location(repo)}/{filename}", dest_dir, sha256=sha256)
+        source = Path(self.location(repo)) / filename
+        if not source.exists():
+            raise FileNotFoundError(f"Nicht im Mirror: {source}")
+        target = dest_dir / filename
+        if not target.exists() or target.stat().st_size != source.stat().st_size:
+            link_or_copy(source, target)
+        if sha256 and sha256_file(target) != sha256.lower():
+            target.unlink()
+            raise RuntimeError(f"Prüfsumme falsch für {filename} im Mirror {source.parent}")
+        return target
+
+    def sync_databases(self, dest_dir: Path | str, refresh: bool = False) -> list[tuple[str, Path]]:
+        """Legt ``<repo>.db`` aller Repos unter ``dest_dir`` ab (vorhandene nur mit ``refresh`` neu)."""
+        dest_dir = Path(dest_dir)
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        databases = []
+        for repo in self.repos:
+            target = dest_dir / f"{repo}.db"
+            if refresh or not target.exists():
+                # Erst vollständig laden, dann ersetzen – offline bleibt die alte DB
+                staging = dest_dir / ".sync"
+                shutil.rmtree(staging, ignore_errors=True)
+                staging.mkdir()
+                try:
+                    os.replace(self._fetch(repo, f"{repo}.db", staging), target)
+                except (OSError, RuntimeError) as e:
+                    if not target.exists():
+                        raise
+                    warning(f"{repo}.db nicht aktualisiert, nutze vorhandene: {e}")
+                finally:
+                    shutil.rmtree(staging, ignore_errors=True)
+            databases.append((repo, target))
+        return databases
+
+    @staticmethod
+    def _intact(pkg: RepoPackage, path: Path) -> bool:
+        """Prüft eine vorhandene Paketdatei gegen csize/sha256 aus dem Index; defekte werden gelöscht."""
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return False
+        if (pkg.csize and size != pkg.csize) or (pkg.sha256 and sha256_file(path) != pkg.sha256.lower()):
+            warning(f"{pkg.filename} im Cache ist unvollständig oder beschädigt, lade neu")
+            path.unlink()
+            return False
+        return True
+
+    def fetch_packages(self, packages: list[RepoPackage], dest_dir: Path | str, jobs: int = 4) -> list[Path]:
+        """Lädt bzw. verlinkt Paketdateien nach ``dest_dir``; vorhandene werden gegen den Index geprüft."""
+        dest_dir = Path(dest_dir)
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            intact = list(pool.map(lambda pkg: self._intact(pkg, dest_dir / pkg.filename), packages))
+        todo = [pkg for pkg, ok in zip(packages, intact) if not ok]
+        if todo and self.remote:
+            from utils.download import Artifact, download_many
+            download_many([Artifact(f"{self.location(pkg.repo)}/{pkg.filename}", dest_dir, pkg.sha256 or None)
+                           for pkg in todo], max_workers=jobs)
+        else:
+            for pkg in todo:
+                self._fetch(pkg.repo, pkg.filename, dest_dir, pkg.sha256 or None)
+        success(f"{len(packages)} Pakete bereit ({len(todo)} neu aus {self.server})")
+        return [dest_dir / pkg.filename for pkg in packages]
+
+
+def isolated_dbpath(dest_dir: Path | str, host: Path = HOST_DBPATH) -> Path:
+    """
+    pacman-Datenbankpfad mit leerer lokaler DB und den Sync-DBs des Hosts.
+
+    ``pacman -Sp``/``-Sw`` lösen gegen die lokale DB auf und lassen auf dem
+    Host installierte Abhängigkeiten (glibc, ...) weg; mit ``--dbpath`` auf
+    dieses Verzeichnis liefern sie die vollständige Hülle für ein leeres RootFS.
+    """
+    dest_dir = Path(dest_dir)
+    (dest_dir / "local").mkdir(parents=True, exist_ok=True)
+    sync = dest_dir / "sync"
+    if not sync.is_symlink():
+        shutil.rmtree(sync, ignore_errors=True)
+        sync.symlink_to(host / "sync")
+    return dest_dir
+
+
+def open_repo(server: str, db_dir: Path | str, repos=DEFAULT_REPOS, arch: str = "x86_64",
+              cache_dir: Path | str | None = None, refresh: bool = False) -> tuple[RepoIndex, RepoMirror]:
+    """Synchronisiert die Datenbanken eines Mirrors und lädt den Index."""
+    mirror = RepoMirror(server, repos, arch)
+    index = RepoIndex(mirror.sync_databases(db_dir, refresh), cache_dir=cache_dir).load()
+    info(f"Repo-Index: {len(index.packages)} Pakete aus {', '.join(mirror.repos)}")
+    return index, mirror
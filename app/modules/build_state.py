@@ -0,0 +1,237 @@
+# modules/build_state.py
+import hashlib
+import json
+import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+from utils.logger import debug, info, success, warning
+
+HASH_CHUNK = 1024 * 1024
+STATE_VERSION = 1
+
+
+def hash_inputs(*parts) -> str:
+    """Stabiler Hash über beliebige Eingaben; Path-Objekte werden per Inhalt gehasht."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, Path):
+            digest.update(part.name.encode())
+            if part.exists():
+                digest.update(part.read_bytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def hash_entry(path: str) -> str:
+    """Inhalts-Hash einer Datei bzw. des Ziels eines Symlinks."""
+    if os.path.islink(path):
+        return "link:" + hashlib.sha256(os.readlink(path).encode()).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot(root: Path) -> dict[str, tuple[int, int]]:
+    """Alle Nicht-Verzeichnis-Einträge unter ``root`` → (size, mtime_ns)."""
+    result: dict[str, tuple[int, int]] = {}
+    prefix = len(str(root)) + 1
+    stack = [str(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(current)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                result[entry.path[prefix:]] = (st.st_size, st.st_mtime_ns)
+    return result
+
+
+@dataclass
+class StageRecord:
+    inputs: str
+    # relativer Pfad → [size, mtime_ns, sha256]
+    outputs: dict[str, list] = field(default_factory=dict)
+    # Pfade, die ein späterer Stage überschrieben hat
+    shadowed: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+class BuildState:
+    """
+    Build-Manifest für inkrementelle RootFS-Builds.
+
+    Pro Stage werden der Eingabe-Hash und die erzeugten Dateien (mit Hash)
+    gespeichert. Beim nächsten Lauf werden nur Stages neu ausgeführt, deren
+    Eingaben sich geändert haben oder deren Ausgaben nicht mehr intakt sind.
+    Überschreibt ein neu gebauter Stage Dateien eines späteren Stages, wird
+    dieser ebenfalls neu ausgeführt, damit die Reihenfolge der Overrides
+    erhalten bleibt.
+    """
+
+    def __init__(self, state_file: Path | str, rootfs: Path | str, jobs: int | None = None):
+        self.state_file = Path(state_file)
+        self.rootfs = Path(rootfs)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.stages: dict[str, StageRecord] = {}
+        self.order: list[str] = []
+        self.dirty: set[str] = set()
+        self.load()
+
+    # -------------------------------------------------------------
+    # Persistenz
+    # -------------------------------------------------------------
+    def load(self):
+        if not self.state_file.exists():
+            return
+        try:
+            data = json.loads(self.state_file.read_text())
+        except (OSError, ValueError) as e:
+            warning(f"Build-Manifest unlesbar, baue komplett neu: {e}")
+            return
+        if data.get("version") != STATE_VERSION or data.get("rootfs") != str(self.rootfs):
+            return
+        self.stages = {name: StageRecord(**rec) for name, rec in data.get("stages", {}).items()}
+
+    def save(self):
+        data = {
+            "version": STATE_VERSION,
+            "rootfs": str(self.rootfs),
+            "stages": {name: rec.__dict__ for name, rec in self.stages.items()},
+        }
+        tmp = self.state_file.with_suffix(".tmp")
+        tmp.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(data, separators=(",", ":")))
+        os.replace(tmp, self.state_file)
+
+    # -------------------------------------------------------------
+    # Prüfung
+    # -------------------------------------------------------------
+    def outputs_intact(self, record: StageRecord) -> bool:
+        root = str(self.rootfs)
+        for rel, (size, mtime_ns, digest) in record.outputs.items():
+            path = os.path.join(root, rel)
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                debug("Ausgabe fehlt: %s", rel)
+                return False
+            if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                continue
+            if stat.S_ISDIR(st.st_mode) or hash_entry(path) != digest:
+                debug("Ausgabe verändert: %s", rel)
+                return False
+        return True
+
+    def is_fresh(self, name: str, inputs: str) -> bool:
+        record = self.stages.get(name)
+        return record is not None and record.inputs == inputs and self.outputs_intact(record)
+
+    # -------------------------------------------------------------
+    # Invalidierung & Aufzeichnung
+    # -------------------------------------------------------------
+    def invalidate(self, name: str) -> set[str]:
+        """Entfernt die Ausgaben eines Stages aus dem RootFS; liefert die gelöschten Pfade."""
+        record = self.stages.pop(name, None)
+        if record is None:
+            return set()
+        for rel in record.outputs:
+            try:
+                os.unlink(self.rootfs / rel)
+            except (FileNotFoundError, IsADirectoryError):
+                pass
+        return set(record.outputs)
+
+    def record(self, name: str, inputs: str, before: dict[str, tuple[int, int]], seconds: float) -> set[str]:
+        """Zeichnet neue/geänderte Dateien als Ausgaben eines Stages auf."""
+        after = snapshot(self.rootfs)
+        written = [rel for rel, meta in after.items() if before.get(rel) != meta]
+        root = str(self.rootfs)
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            digests = pool.map(lambda rel: hash_entry(os.path.join(root, rel)), written)
+            outputs = {rel: [*after[rel], digest] for rel, digest in zip(written, digests)}
+
+        # Überschriebene Pfade gehören ab jetzt diesem Stage
+        for other_name, other in self.stages.items():
+            if other_name == name:
+                continue
+            for rel in outputs.keys() & other.outputs.keys():
+                del other.outputs[rel]
+                other.shadowed.append(rel)
+
+        self.stages[name] = StageRecord(inputs, outputs, [], seconds)
+        return set(outputs)
+
+    # -------------------------------------------------------------
+    # Ausführung
+    # -------------------------------------------------------------
+    def plan(self, stages: list[tuple[str, str]]) -> set[str]:
+        """
+        Ermittelt für ``stages`` (Name, Eingabe-Hash) in Build-Reihenfolge,
+        was neu gebaut werden muss, und entfernt deren alte Ausgaben.
+        """
+        self.order = [name for name, _ in stages]
+        dirty = {name for name, inputs in stages if not self.is_fresh(name, inputs)}
+
+        # Rückwärts invalidieren: gelöschte Pfade, die ein früherer Stage
+        # überschattet hatte, müssen von diesem neu erzeugt werden
+        for idx in range(len(self.order) - 1, -1, -1):
+            if self.order[idx] not in dirty:
+                continue
+            removed = self.invalidate(self.order[idx])
+            for earlier in self.order[:idx]:
+                record = self.stages.get(earlier)
+                if record and removed.intersection(record.shadowed):
+                    dirty.add(earlier)
+        self.dirty = dirty
+        return dirty
+
+    def step(self, name: str, inputs: str, func: Callable[[], object]) -> bool:
+        """Baut einen geplanten Stage, falls nötig; liefert True, wenn gebaut wurde."""
+        if name not in self.dirty:
+            info(f"[incremental] Stage '{name}' ist aktuell, übersprungen")
+            return False
+
+        info(f"[incremental] Stage '{name}' wird gebaut ...")
+        self.invalidate(name)
+        before = snapshot(self.rootfs)
+        stage_start = time.perf_counter()
+        func()
+        written = self.record(name, inputs, before, time.perf_counter() - stage_start)
+
+        for later in self.order[self.order.index(name) + 1:]:
+            record = self.stages.get(later)
+            if later not in self.dirty and record and written.intersection(record.shadowed):
+                info(f"[incremental] Stage '{later}' überschreibt '{name}', wird neu gebaut")
+                self.dirty.add(later)
+        self.save()
+        return True
+
+    def run(self, stages: list[tuple[str, str, Callable[[], object]]]):
+        """
+        Führt ``stages`` (Name, Eingabe-Hash, Funktion) in Reihenfolge aus
+        und überspringt alles, was aktuell ist.
+        """
+        start = time.perf_counter()
+        self.plan([(name, inputs) for name, inputs, _ in stages])
+        for name, inputs, func in stages:
+            self.step(name, inputs, func)
+        self.summary(start)
+
+    def summary(self, start: float):
+        skipped = len(self.order) - len(self.dirty)
+        success(f"[incremental] {len(self.dirty)} Stages gebaut, {skipped} übersprungen "
+                f"({time.perf_counter() - start:.2f}s)")
@@ -1,60 +1,128 @@
 # modules/create_fhs_rootfs.py
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from utils.reproducible import ROOT_OWNER, normalize_tree
+from utils.fscopy import link_or_copy
 from utils.logger import create, success, debug, info
 
+# Ab dieser Anzahl Dateien lohnt sich der Thread-Pool
+PARALLEL_MIN_FILES = 32
+
+
 class FHSRootFSBuilder:
-    def __init__(self, rootfs_dir: str | Path, fhs_layout):
+    """
+    Materialisiert ein übersetztes FHS-Layout (siehe FHSLayout) im RootFS.
+
+    Das Layout liefert Verzeichnisse bereits dedupliziert, normalisiert und
+    Eltern zuerst; pro Verzeichnis genügt daher ein einziges ``mkdirat``
+    relativ zum RootFS-Deskriptor.
+    Dateien werden über einen Thread-Pool geschrieben. Quelldateien werden
+    binärsicher per Reflink bzw. copy_file_range übernommen (Modus und
+    Zeitstempel bleiben erhalten), mit ``method: hardlink`` auch als Hardlink.
+    """
+
+    def __init__(self, rootfs_dir: str | Path, fhs_layout, jobs: int | None = None, epoch: int | None = None):
         self.rootfs_dir = Path(rootfs_dir)
         self.layout = fhs_layout
+        self.jobs = jobs or min(32, (os.cpu_count() or 1) * 4)
+        # Reproduzierbarer Modus: mtimes ≤ SOURCE_DATE_EPOCH, Besitzer root
+        self.epoch = epoch
+
+    # -------------------------------------------------------------
+    # Planung
+    # -------------------------------------------------------------
+    def plan_directories(self) -> list[str]:
+        """Verzeichnisse des Layouts plus Pacman-DB, Eltern zuerst."""
+        dirs = list(self.layout.directories())
+        # Speziell für Pacman DB
+        known = set(dirs)
+        dirs += [d for d in ("var", "var/lib", "var/lib/pacman", "var/lib/pacman/sync") if d not in known]
+        return dirs
 
+    # -------------------------------------------------------------
+    # Materialisierung
+    # -------------------------------------------------------------
     def create_directories(self):
         create("[*] Erstelle Verzeichnisse...")
-        for d in self.layout.directories():
-            path = self.rootfs_dir / d.lstrip("/")
-            path.mkdir(parents=True, exist_ok=True)
-            debug(f"Verzeichnis erstellt: {path}")
+        self.rootfs_dir.mkdir(parents=True, exist_ok=True)
+        dirs = self.plan_directories()
+        root_fd = os.open(self.rootfs_dir, os.O_RDONLY | os.O_DIRECTORY)
+        created = 0
+        try:
+            for d in dirs:
+                try:
+                    os.mkdir(d, 0o755, dir_fd=root_fd)
+                    created += 1
+                except FileExistsError:
+                    pass
+        finally:
+            os.close(root_fd)
+        info(f"{len(dirs)} Verzeichnisse sichergestellt ({created} neu)")
 
-        # Speziell für Pacman DB
-        pacman_sync = self.rootfs_dir / "var/lib/pacman/sync"
-        pacman_sync.mkdir(parents=True, exist_ok=True)
-        info(f"Pacman DB-Verzeichnis sichergestellt: {pacman_sync}")
-
-    def create_files(self):
-        create("[*] Erstelle Dateien...")
-        for f in self.layout.files():
-            target = self.rootfs_dir / f["path"].lstrip("/")
+    def _write_file(self, entry: dict) -> str:
+        target = self.rootfs_dir / entry["path"]
+        if "content" in entry:
+            data = entry["content"].encode()
+            fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+            return "content"
 
-            target.parent.mkdir(parents=True, exist_ok=True)
+        if "source" in entry:
+            # Reflink, sonst Kernel-Kopie; Hardlink nur, wenn das Layout es verlangt
+            return link_or_copy(entry["source"], target, entry.get("method", "reflink"))
 
-            if "content" in f:
-                target.write_text(f["content"])
-                debug(f"Datei erstellt mit Inhalt: {target}")
+        os.close(os.open(target, os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC, 0o644))
+        return "empty"
 
-            elif "source" in f:
-                src = Path(f["source"])
-                target.write_text(src.read_text())
-                debug(f"Datei aus Quelle kopiert: {target} <- {src}")
+    def _write_batch(self, batch: list[dict]) -> list[str]:
+        return [self._write_file(entry) for entry in batch]
 
-            else:
-                target.touch()
-                debug(f"Leere Datei erstellt: {target}")
+    def create_files(self):
+        create("[*] Erstelle Dateien...")
+        files = self.layout.files()
+        if len(files) < PARALLEL_MIN_FILES or self.jobs <= 1:
+            kinds = self._write_batch(files)
+        else:
+            # Nach Verzeichnis sortierte Blöcke: Threads konkurrieren seltener
+            # um dieselbe Verzeichnis-Sperre, und es gibt nur wenige Futures
+            ordered = sorted(files, key=lambda f: os.path.dirname(f["path"]))
+            size = -(-len(ordered) // (self.jobs * 4))
+            batches = [ordered[i:i + size] for i in range(0, len(ordered), size)]
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                kinds = [kind for result in pool.map(self._write_batch, batches) for kind in result]
+        counts = {kind: kinds.count(kind) for kind in set(kinds)}
+        debug(f"Dateien erstellt: {counts}")
 
     def create_symlinks(self):
         create("[*] Erstelle Symlinks...")
         for s in self.layout.symlinks():
-            link_path = self.rootfs_dir / s["link"].lstrip("/")
+            link_path = self.rootfs_dir / s["link"]
             target = s["target"]
 
-            if link_path.exists():
+            try:
+                os.symlink(target, link_path)
+            except FileExistsError:
                 link_path.unlink()
+                os.symlink(target, link_path)
+            debug("Symlink erstellt: %s -> %s", link_path, target)
 
-            link_path.parent.mkdir(parents=True, exist_ok=True)
-            os.symlink(target, link_path)
-            debug(f"Symlink erstellt: {link_path} -> {target}")
+    def normalize(self):
+        """Normalisiert alle Einträge des Layouts (nur im reproduzierbaren Modus)."""
+        entries = [""] + self.plan_directories()
+        entries += [f["path"] for f in self.layout.files()]
+        entries += [s["link"] for s in self.layout.symlinks()]
+        normalize_tree(self.rootfs_dir, self.epoch, ROOT_OWNER, entries)
 
     def build(self):
         self.create_directories()
         self.create_files()
         self.create_symlinks()
+        if self.epoch is not None:
+            self.normalize()
         success("[✓] FHS RootFS erfolgreich aufgebaut!")
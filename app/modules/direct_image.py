@@ -0,0 +1,333 @@
+# modules/direct_image.py
+import os
+import posixpath
+import subprocess
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import replace
+from pathlib import Path
+from typing import Iterator
+
+from manager.extractor import PKG_METADATA, PackageExtractor
+from modules.create_fhs_rootfs import FHSRootFSBuilder
+from modules.image import ImageEntry, ImagePacker, walk_tree
+from utils.logger import debug, info, success, warning
+from utils.zstd import HAVE_ZSTD, open_zstd_reader
+
+MAX_SYMLINK_DEPTH = 40
+_TAR_KINDS = {
+    tarfile.REGTYPE: "file",
+    tarfile.AREGTYPE: "file",
+    tarfile.DIRTYPE: "dir",
+    tarfile.SYMTYPE: "symlink",
+    tarfile.LNKTYPE: "hardlink",
+    tarfile.CHRTYPE: "char",
+    tarfile.BLKTYPE: "block",
+    tarfile.FIFOTYPE: "fifo",
+}
+
+
+@contextmanager
+def open_package(pkg: Path) -> Iterator[tarfile.TarFile]:
+    """Tar-Strom eines .pkg.tar.zst (zstd im Prozess, sonst über das zstd-Binary)."""
+    if HAVE_ZSTD:
+        with open(pkg, "rb") as raw, open_zstd_reader(raw) as stream, \
+                tarfile.open(fileobj=stream, mode="r|", bufsize=1024 * 1024) as tar:
+            yield tar
+        return
+    proc = subprocess.Popen(["zstd", "-dcq", str(pkg)], stdout=subprocess.PIPE)
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|", bufsize=1024 * 1024) as tar:
+            yield tar
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+class MergedTree:
+    """
+    RootFS als Baum im Speicher mit denselben Regeln wie die Installation auf
+    Platte: spätere Schichten überschreiben frühere, Verzeichnisse übernehmen
+    die Metadaten der letzten Schicht, ein Nicht-Verzeichnis über einem
+    vorhandenen Verzeichnis wird übersprungen, Pfade werden durch Symlinks im
+    Baum aufgelöst und fehlende Eltern wie bei ``makedirs`` angelegt.
+    """
+
+    def __init__(self):
+        self.nodes: dict[str, ImageEntry] = {}
+        # Pfad → Herkunft (Schicht, Pfad in der Schicht)
+        self.owner: dict[str, tuple[str, str]] = {}
+        self.children: dict[str, set[str]] = {"": set()}
+
+    # -------------------------------------------------------------
+    # Pfadauflösung
+    # -------------------------------------------------------------
+    def resolve(self, path: str, follow_last: bool = True, depth: int = 0) -> str | None:
+        """Löst Symlinks im Baum auf; None, wenn ein Elternteil kein Verzeichnis ist."""
+        if depth > MAX_SYMLINK_DEPTH:
+            return None
+        parts = [p for p in path.split("/") if p and p != "."]
+        current = ""
+        for idx, part in enumerate(parts):
+            if part == "..":
+                current = posixpath.dirname(current)
+                continue
+            candidate = f"{current}/{part}" if current else part
+            node = self.nodes.get(candidate)
+            last = idx == len(parts) - 1
+            if node is None or (last and not follow_last):
+                current = candidate
+                continue
+            if node.kind == "symlink":
+                # absolut = relativ zur RootFS-Wurzel, sonst relativ zum Elternverzeichnis
+                base = "" if node.target.startswith("/") else current
+                resolved = self.resolve(posixpath.join(base, node.target.lstrip("/")), True, depth + 1)
+                if resolved is None:
+                    return None
+                current = resolved
+            elif node.kind != "dir" and not last:
+                return None
+            else:
+                current = candidate
+        return current
+
+    # -------------------------------------------------------------
+    # Änderungen
+    # -------------------------------------------------------------
+    def _remove(self, path: str):
+        for child in list(self.children.pop(path, ())):
+            self._remove(f"{path}/{child}" if path else child)
+        self.nodes.pop(path, None)
+        self.owner.pop(path, None)
+        self.children.get(posixpath.dirname(path), set()).discard(posixpath.basename(path))
+
+    def _insert(self, path: str, entry: ImageEntry, owner: tuple[str, str]):
+        self.nodes[path] = replace(entry, path=path)
+        self.owner[path] = owner
+        self.children.setdefault(posixpath.dirname(path), set()).add(posixpath.basename(path))
+        if entry.kind == "dir":
+            self.children.setdefault(path, set())
+
+    def _ensure_parents(self, path: str, owner: tuple[str, str]) -> bool:
+        parent = posixpath.dirname(path)
+        missing = []
+        while parent and parent not in self.nodes:
+            missing.append(parent)
+            parent = posixpath.dirname(parent)
+        if parent and self.nodes[parent].kind != "dir":
+            return False
+        for directory in reversed(missing):
+            self._insert(directory, ImageEntry(directory, "dir", 0o755), owner)
+        return True
+
+    def add(self, entry: ImageEntry, owner: tuple[str, str]) -> str | None:
+        """Fügt einen Eintrag hinzu; liefert den aufgelösten Pfad oder None, wenn übersprungen."""
+        if entry.kind == "dir":
+            target = self.resolve(entry.path, follow_last=True)
+            if target is None:
+                return None
+            node = self.nodes.get(target)
+            if node is not None and node.kind == "dir":
+                node.mode, node.uid, node.gid = entry.mode, entry.uid, entry.gid
+                return target
+            if node is not None:
+                self._remove(target)
+        else:
+            parent = self.resolve(posixpath.dirname(entry.path), follow_last=True)
+            if parent is None:
+                return None
+            name = posixpath.basename(entry.path)
+            target = f"{parent}/{name}" if parent else name
+            node = self.nodes.get(target)
+            if node is not None and node.kind == "dir":
+                warning(f"{owner[0]}: {entry.path} ist ein Verzeichnis im RootFS, übersprungen")
+                return None
+            if node is not None:
+                self._remove(target)
+
+        if not self._ensure_parents(target, owner):
+            return None
+        self._insert(target, entry, owner)
+        return target
+
+    def exists(self, path: str) -> bool:
+        resolved = self.resolve(path)
+        return resolved is not None and resolved in self.nodes
+
+    def walk(self, path: str = "") -> Iterator[ImageEntry]:
+        """Tiefensuche, nach Name sortiert, Eltern vor Kindern."""
+        for name in sorted(self.children.get(path, ()), key=lambda n: n.encode("utf-8", "surrogateescape")):
+            child = f"{path}/{name}" if path else name
+            yield self.nodes[child]
+            if self.nodes[child].kind == "dir":
+                yield from self.walk(child)
+
+
+class DirectImageBuilder:
+    """
+    Baut ein Image direkt aus FHS-Layout, BusyBox-Installation und
+    Paketarchiven, ohne ``work/rootfs`` anzulegen.
+
+    Reihenfolge wie in main(): FHS → BusyBox → pacman-Konfiguration → Pakete
+    (nach Dateiname). Pakete werden zweimal gestreamt: zuerst nur die Header
+    für den Baum, dann beim Schreiben die Inhalte der Dateien, die am Ende
+    tatsächlich im Image landen.
+    """
+
+    def __init__(self, packer: ImagePacker, jobs: int | None = None):
+        self.packer = packer
+        self.jobs = jobs or os.cpu_count() or 1
+        self.tree = MergedTree()
+        self.packages: list[Path] = []
+        # pro Paket: Member-Name → aufgelöster Pfad im Baum
+        self.claims: list[dict[str, str]] = []
+
+    # -------------------------------------------------------------
+    # Schichten
+    # -------------------------------------------------------------
+    def add_layout(self, layout):
+        owner = "fhs"
+        for directory in FHSRootFSBuilder(".", layout).plan_directories():
+            self.tree.add(ImageEntry(directory, "dir", 0o755), (owner, directory))
+        for f in layout.files():
+            if "content" in f:
+                data = f["content"].encode()
+                entry = ImageEntry(f["path"], "file", 0o644, size=len(data), data=data)
+            elif "source" in f:
+                st = os.stat(f["source"])
+                entry = ImageEntry(f["path"], "file", st.st_mode & 0o7777, size=st.st_size, source=f["source"])
+            else:
+                entry = ImageEntry(f["path"], "file", 0o644, data=b"")
+            self.tree.add(entry, (owner, f["path"]))
+        for s in layout.symlinks():
+            self.tree.add(ImageEntry(s["link"], "symlink", 0o777, target=s["target"]), (owner, s["link"]))
+
+    def add_tree(self, owner: str, root: Path | str, prefix: str = "", plain_files: bool = False):
+        """
+        Übernimmt einen Verzeichnisbaum als Schicht. ``plain_files``: Symlinks
+        auf Dateien als Kopie, Gerätedateien auslassen (wie safe_copytree).
+        """
+        root = Path(root)
+        if root.is_file():
+            st = root.stat()
+            entry = ImageEntry(prefix, "file", st.st_mode & 0o7777, st.st_uid, st.st_gid, st.st_size, source=str(root))
+            self.tree.add(entry, (owner, prefix))
+            return
+        for entry in walk_tree(root, prefix):
+            if plain_files:
+                if entry.kind == "symlink":
+                    source = root / entry.path[len(prefix):].lstrip("/")
+                    if not source.is_file():
+                        continue
+                    st = source.stat()
+                    entry = replace(entry, kind="file", mode=st.st_mode & 0o7777, size=st.st_size,
+                                    source=str(source), target="")
+                elif entry.kind == "hardlink":
+                    entry = replace(entry, kind="file", target="", nlink=1)
+                elif entry.kind not in ("file", "dir"):
+                    continue
+            self.tree.add(entry, (owner, entry.path))
+
+    def add_busybox(self, install_dir: Path | str):
+        self.add_tree("busybox", install_dir)
+        # wie BusyBoxBuilder.create_symlinks
+        if self.tree.exists("bin/busybox"):
+            if not self.tree.exists("sbin/init"):
+                self.tree.add(ImageEntry("sbin/init", "symlink", 0o777, target="../bin/busybox"), ("busybox", "sbin/init"))
+            if not self.tree.exists("bin/sh"):
+                self.tree.add(ImageEntry("bin/sh", "symlink", 0o777, target="busybox"), ("busybox", "bin/sh"))
+
+    @staticmethod
+    def _scan_package(pkg: Path) -> list[tarfile.TarInfo]:
+        members = []
+        with open_package(pkg) as tar:
+            for member in tar:
+                name = PackageExtractor._member_name(member.name)
+                if name is not None and name not in PKG_METADATA:
+                    member.name = name
+                    members.append(member)
+        return members
+
+    def add_packages(self, pkgs: list[Path]):
+        """Liest die Header aller Pakete (parallel) und legt sie in Paketreihenfolge in den Baum."""
+        self.packages = sorted(pkgs, key=lambda p: p.name)
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            scans = list(pool.map(self._scan_package, self.packages))
+        for pkg, members in zip(self.packages, scans):
+            owner = f"pkg:{pkg.name}"
+            claims: dict[str, str] = {}
+            links: dict[str, int] = {}
+            for member in members:
+                if member.islnk():
+                    target = PackageExtractor._member_name(member.linkname)
+                    links[target] = links.get(target, 1) + 1
+            for member in members:
+                kind = _TAR_KINDS.get(member.type)
+                if kind is None:
+                    continue
+                entry = ImageEntry(member.name, kind, member.mode & 0o7777, member.uid, member.gid,
+                                   size=member.size if kind == "file" else 0,
+                                   target=member.linkname if kind == "symlink" else "",
+                                   rdev=os.makedev(member.devmajor, member.devminor) if kind in ("char", "block") else 0,
+                                   nlink=links.get(member.name, 1))
+                if kind == "hardlink":
+                    # Im Baum als Datei des Pakets, geschrieben wird der Link
+                    entry = replace(entry, kind="file")
+                resolved = self.tree.add(entry, (owner, member.name))
+                if resolved is not None:
+                    claims[member.name] = resolved
+            self.claims.append(claims)
+            debug("[direct] %s: %d Einträge", pkg.name, len(members))
+
+    # -------------------------------------------------------------
+    # Ausgabe
+    # -------------------------------------------------------------
+    def _entries(self) -> Iterator[ImageEntry]:
+        tree = self.tree
+        emitted: set[str] = set()
+        # 1. Alles ohne Paket-Dateiinhalt in sortierter Reihenfolge
+        for node in tree.walk():
+            layer, origin = tree.owner[node.path]
+            if layer.startswith("pkg:") and node.kind == "file":
+                continue
+            if node.kind == "hardlink":
+                target = tree.resolve(node.target)
+                if target not in emitted or tree.owner.get(target) != (layer, node.target):
+                    # Original überschrieben oder noch nicht geschrieben: eigenständige Kopie
+                    node = replace(node, kind="file", target="", nlink=1)
+                else:
+                    node = replace(node, target=target)
+            emitted.add(node.path)
+            yield node
+
+        # 2. Paket-Dateien in Archivreihenfolge, nur was im Baum gewonnen hat
+        for idx, pkg in enumerate(self.packages):
+            owner = f"pkg:{pkg.name}"
+            claims = self.claims[idx]
+            with open_package(pkg) as tar:
+                for member in tar:
+                    name = PackageExtractor._member_name(member.name)
+                    path = claims.get(name)
+                    if path is None or tree.owner.get(path) != (owner, name):
+                        continue
+                    node = tree.nodes[path]
+                    if member.islnk():
+                        target = claims.get(PackageExtractor._member_name(member.linkname))
+                        if target not in emitted or tree.owner.get(target)[0] != owner:
+                            warning(f"{pkg.name}: Hardlink {name} zeigt auf überschriebene Datei, übersprungen")
+                            continue
+                        node = replace(node, kind="hardlink", target=target)
+                    elif member.isreg():
+                        node = replace(node, stream=tar.extractfile(member))
+                    else:
+                        continue
+                    emitted.add(path)
+                    yield node
+
+    def build(self, fmt: str) -> Path:
+        info(f"[direct] Baue {fmt} direkt aus {len(self.tree.nodes)} Einträgen "
+             f"({len(self.packages)} Pakete), ohne RootFS auf Platte")
+        output = self.packer.pack_entries(fmt, self._entries())
+        success(f"[direct] {output} erstellt")
+        return output
@@ -1,22 +1,255 @@
 # modules/fhs_layout.py
-import yaml
+import hashlib
+import marshal
+import os
+import sys
 from pathlib import Path
+from utils.logger import debug, warning
+
+CACHE_VERSION = 1
+FILE_KEYS = {"path", "content", "source", "method"}
+SYMLINK_KEYS = {"link", "target"}
+SOURCE_METHODS = ("auto", "reflink", "hardlink", "copy")
+
+
+def _norm(path: str) -> str:
+    """``/usr//bin/`` → ``usr/bin`` (relativ zum RootFS, interniert)."""
+    rel = os.path.normpath("/" + path).lstrip("/")
+    return sys.intern(rel)
+
+
+def _parents(rel: str):
+    rel = os.path.dirname(rel)
+    while rel:
+        yield rel
+        rel = os.path.dirname(rel)
+
+
+def compile_layout(fragments: list[tuple[str, dict]]) -> dict:
+    """
+    Übersetzt ``fhs``-Abschnitte (Quelle, Daten) in die kompakte Form:
+    normalisierte, relative Pfade, Verzeichnisse inkl. aller Eltern
+    (Eltern zuerst), doppelte Einträge zusammengefasst. Fehler und Konflikte
+    werden gesammelt und gemeinsam als ValueError gemeldet.
+    """
+    errors: list[str] = []
+    dirs: dict[str, str] = {}
+    files: dict[str, tuple[str, dict]] = {}
+    links: dict[str, tuple[str, dict]] = {}
+
+    for origin, fhs in fragments:
+        for d in fhs.get("directories") or []:
+            if not isinstance(d, str):
+                errors.append(f"{origin}: Verzeichnis ist kein String: {d!r}")
+                continue
+            dirs.setdefault(_norm(d), origin)
+
+        for f in fhs.get("files") or []:
+            if not isinstance(f, dict) or not isinstance(f.get("path"), str):
+                errors.append(f"{origin}: Datei-Eintrag ohne 'path': {f!r}")
+                continue
+            unknown = set(f) - FILE_KEYS
+            if unknown:
+                errors.append(f"{origin}: {f['path']}: unbekannte Schlüssel {sorted(unknown)}")
+            if "content" in f and "source" in f:
+                errors.append(f"{origin}: {f['path']}: 'content' und 'source' schließen sich aus")
+            if "content" in f and not isinstance(f["content"], str):
+                errors.append(f"{origin}: {f['path']}: 'content' muss ein String sein")
+            if f.get("method", "reflink") not in SOURCE_METHODS:
+                errors.append(f"{origin}: {f['path']}: unbekannte Methode '{f['method']}'")
+            entry = {**f, "path": _norm(f["path"])}
+            if "source" in entry:
+                entry["source"] = str(entry["source"])
+            previous = files.get(entry["path"])
+            if previous and previous[1] != entry:
+                errors.append(f"{origin}: Datei {entry['path']} widerspricht Definition in {previous[0]}")
+            files.setdefault(entry["path"], (origin, entry))
+
+        for s in fhs.get("symlinks") or []:
+            if not isinstance(s, dict) or set(s) != SYMLINK_KEYS:
+                errors.append(f"{origin}: Symlink braucht genau 'link' und 'target': {s!r}")
+                continue
+            entry = {"link": _norm(s["link"]), "target": sys.intern(str(s["target"]))}
+            previous = links.get(entry["link"])
+            if previous and previous[1] != entry:
+                errors.append(f"{origin}: Symlink {entry['link']} widerspricht Definition in {previous[0]}")
+            links.setdefault(entry["link"], (origin, entry))
+
+    # Ein Pfad darf nur eine Art von Eintrag sein
+    for rel, (origin, _) in files.items():
+        if rel in dirs:
+            errors.append(f"{origin}: {rel} ist Datei und Verzeichnis ({dirs[rel]})")
+        if rel in links:
+            errors.append(f"{origin}: {rel} ist Datei und Symlink ({links[rel][0]})")
+    for rel, (origin, _) in links.items():
+        if rel in dirs:
+            errors.append(f"{origin}: {rel} ist Symlink und Verzeichnis ({dirs[rel]})")
+    # Nichts darf unterhalb eines Symlinks oder einer Datei angelegt werden
+    for rel in [*dirs, *files, *links]:
+        for parent in _parents(rel):
+            if parent in links or parent in files:
+                errors.append(f"{rel} liegt unterhalb von {parent}, das kein Verzeichnis ist")
+                break
+
+    if errors:
+        raise ValueError("Ungültiges FHS-Layout:\n  " + "\n  ".join(errors))
+
+    closure = set(dirs)
+    for rel in [*dirs, *files, *links]:
+        closure.update(_parents(rel))
+    return {
+        "directories": sorted(closure, key=lambda d: (d.count("/"), d)),
+        "files": [entry for _, entry in files.values()],
+        "symlinks": [entry for _, entry in links.values()],
+    }
+
 
 class FHSLayout:
-    def __init__(self, yaml_file):
+    """
+    FHS-Layout aus einer YAML-Datei (mit ``include:``-Fragmenten).
+
+    Das Layout wird einmal übersetzt (compile_layout) und als marshal-Datei
+    unter ``cache_dir`` abgelegt. Solange sich Größe und mtime aller
+    beteiligten YAML-Dateien nicht ändern – oder ihr Inhalt gleich bleibt –,
+    wird die übersetzte Form direkt geladen, ohne YAML zu parsen.
+    """
+
+    def __init__(self, yaml_file, cache_dir: str | Path | None = None):
         self.yaml_file = Path(yaml_file)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
         self.layout = {}
+        self.sources: list[str] = []
+        # Beim Parsen gelesene Inhalte/Stempel, damit der Cache genau dazu passt
+        self._raw: dict[str, bytes] = {}
+        self._stamps: dict[str, tuple[int, int]] = {}
+
+    @classmethod
+    def from_data(cls, fhs: dict, origin: str = "<data>") -> "FHSLayout":
+        """Layout direkt aus einem ``fhs``-Dict (ohne YAML und Cache)."""
+        layout = cls(origin)
+        layout.layout = compile_layout([(origin, fhs)])
+        return layout
+
+    # -------------------------------------------------------------
+    # YAML & Includes
+    # -------------------------------------------------------------
+    def _read_fragments(self) -> list[tuple[str, dict]]:
+        import yaml
+
+        fragments: list[tuple[str, dict]] = []
+        sources: list[str] = []
+        stack: list[Path] = []
+
+        def visit(path: Path):
+            path = path.resolve()
+            if path in stack:
+                raise ValueError(f"Zyklischer include: {' -> '.join(map(str, stack + [path]))}")
+            if str(path) in sources:
+                return
+            if not path.exists():
+                raise FileNotFoundError(f"FHS YAML nicht gefunden: {path}")
+            sources.append(str(path))
+            self._stamps[str(path)] = self._stamp(str(path))
+            self._raw[str(path)] = path.read_bytes()
+            try:
+                data = yaml.safe_load(self._raw[str(path)]) or {}
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path}: ungültiges YAML: {e}") from e
+            if not isinstance(data, dict):
+                raise ValueError(f"{path}: YAML-Wurzel muss ein Mapping sein")
+            stack.append(path)
+            includes = data.get("include") or []
+            for inc in [includes] if isinstance(includes, str) else includes:
+                visit(path.parent / inc)
+            stack.pop()
+            if "fhs" in data:
+                fragments.append((str(path), data["fhs"] or {}))
+            elif not stack and not includes:
+                raise ValueError("FHS-Layout fehlt in YAML unter 'fhs'")
+
+        visit(self.yaml_file)
+        self.sources = sources
+        return fragments
 
+    # -------------------------------------------------------------
+    # Cache
+    # -------------------------------------------------------------
+    def _cache_file(self) -> Path:
+        key = hashlib.sha256(str(self.yaml_file.resolve()).encode()).hexdigest()[:16]
+        return self.cache_dir / f"fhs-{key}.marshal"
+
+    @staticmethod
+    def _stamp(path: str) -> tuple[int, int]:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def _digest(paths: list[str], contents: dict[str, bytes] | None = None) -> str:
+        digest = hashlib.sha256()
+        for path in paths:
+            data = contents[path] if contents else Path(path).read_bytes()
+            digest.update(path.encode() + b"\0" + data + b"\0")
+        return digest.hexdigest()
+
+    def _load_cached(self) -> dict | None:
+        cache_file = self._cache_file()
+        try:
+            with open(cache_file, "rb") as f:
+                cached = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION:
+            return None
+        try:
+            stamps = [self._stamp(path) for path in cached["sources"]]
+        except OSError:
+            return None
+        if stamps != [tuple(s) for s in cached["stamps"]]:
+            # mtime geändert (z.B. git checkout) – Inhalt entscheidet
+            if self._digest(cached["sources"]) != cached["digest"]:
+                return None
+            cached["stamps"] = stamps
+            self._write_cache(cached)
+        self.sources = cached["sources"]
+        return cached["layout"]
+
+    def _write_cache(self, cached: dict):
+        cache_file = self._cache_file()
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                marshal.dump(cached, f)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            warning(f"FHS-Layout-Cache nicht schreibbar: {e}")
+
+    # -------------------------------------------------------------
+    # Laden
+    # -------------------------------------------------------------
     def load(self):
         if not self.yaml_file.exists():
             raise FileNotFoundError(f"FHS YAML nicht gefunden: {self.yaml_file}")
 
-        data = yaml.safe_load(self.yaml_file.read_text())
-
-        if "fhs" not in data:
-            raise ValueError("FHS-Layout fehlt in YAML unter 'fhs'")
+        if self.cache_dir:
+            cached = self._load_cached()
+            if cached is not None:
+                debug(f"FHS-Layout aus Cache geladen: {self._cache_file()}")
+                self.layout = cached
+                return self.layout
 
-        self.layout = data["fhs"]
+        self.layout = compile_layout(self._read_fragments())
+        debug(f"FHS-Layout übersetzt: {len(self.sources)} YAML-Dateien, {len(self.layout['directories'])} "
+              f"Verzeichnisse, {len(self.layout['files'])} Dateien, {len(self.layout['symlinks'])} Symlinks")
+        if self.cache_dir:
+            self._write_cache({
+                "version": CACHE_VERSION,
+                "sources": self.sources,
+                "stamps": [self._stamps[path] for path in self.sources],
+                "digest": self._digest(self.sources, self._raw),
+                "layout": self.layout,
+            })
+        self._raw.clear()
         return self.layout
 
     def directories(self):
@@ -0,0 +1,385 @@
+# modules/image.py
+import io
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator
+from utils.execute import get_executor
+from utils.logger import debug, info, success
+from utils.zstd import open_zstd_writer
+
+COPY_BUFSIZE = 1024 * 1024
+IMAGE_FORMATS = {
+    "cpio.zst": ".cpio.zst",
+    "tar.zst": ".tar.zst",
+    "squashfs": ".squashfs",
+    "erofs": ".erofs",
+    "ext4": ".ext4",
+}
+
+
+def default_epoch() -> int:
+    """Zeitstempel für alle Einträge: SOURCE_DATE_EPOCH oder 0."""
+    return int(os.environ.get("SOURCE_DATE_EPOCH", "0"))
+
+
+@dataclass
+class ImageEntry:
+    """Ein Eintrag im Image; Dateiinhalt kommt aus ``stream``, ``data`` oder ``source`` (Datei)."""
+    path: str                   # relativ zum RootFS, ohne führenden '/'
+    kind: str                   # file | dir | symlink | hardlink | char | block | fifo
+    mode: int                   # Rechte inkl. suid/sgid/sticky
+    uid: int = 0
+    gid: int = 0
+    size: int = 0
+    target: str = ""            # Symlink-Ziel bzw. Pfad des Hardlink-Originals
+    rdev: int = 0
+    nlink: int = 1
+    source: str | None = None
+    data: bytes | None = None
+    # Einmal lesbarer Strom (z.B. ein Tar-Member), Vorrang vor source
+    stream: BinaryIO | None = None
+
+    def open(self) -> BinaryIO:
+        if self.stream is not None:
+            return self.stream
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return open(self.source, "rb")
+
+
+_KINDS = {
+    stat.S_IFREG: "file",
+    stat.S_IFDIR: "dir",
+    stat.S_IFLNK: "symlink",
+    stat.S_IFCHR: "char",
+    stat.S_IFBLK: "block",
+    stat.S_IFIFO: "fifo",
+}
+
+
+def _count_links(root: str) -> dict[tuple[int, int], int]:
+    """
+    (Gerät, Inode) → Anzahl der Namen *innerhalb* von ``root`` für mehrfach
+    verlinkte Dateien. st_nlink zählt auch Links außerhalb (Paket-Store,
+    Ebenen-Hardlinks) und hinge damit vom Cache-Zustand ab.
+    """
+    counts: dict[tuple[int, int], int] = {}
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    if st.st_nlink > 1:
+                        key = (st.st_dev, st.st_ino)
+                        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _walk(root: str, rel: str, prefix: str, seen: dict[tuple[int, int], str],
+          links: dict[tuple[int, int], int]) -> Iterator[ImageEntry]:
+    with os.scandir(os.path.join(root, rel) if rel else root) as it:
+        entries = sorted(it, key=lambda e: e.name.encode("utf-8", "surrogateescape"))
+    for entry in entries:
+        rel_path = f"{rel}/{entry.name}" if rel else entry.name
+        path = f"{prefix}/{rel_path}" if prefix else rel_path
+        st = entry.stat(follow_symlinks=False)
+        kind = _KINDS.get(stat.S_IFMT(st.st_mode))
+        if kind is None:
+            continue
+        item = ImageEntry(path, kind, stat.S_IMODE(st.st_mode), st.st_uid, st.st_gid)
+        if kind == "file":
+            key = (st.st_dev, st.st_ino)
+            item.size, item.source, item.nlink = st.st_size, entry.path, links.get(key, 1)
+            if item.nlink > 1 and key in seen:
+                item.kind, item.target = "hardlink", seen[key]
+            elif item.nlink > 1:
+                seen[key] = path
+        elif kind == "symlink":
+            item.target = os.readlink(entry.path)
+        elif kind in ("char", "block"):
+            item.rdev = st.st_rdev
+        yield item
+        if kind == "dir":
+            yield from _walk(root, rel_path, prefix, seen, links)
+
+
+def walk_tree(root: Path | str, prefix: str = "") -> Iterator[ImageEntry]:
+    """
+    Läuft einmal über ``root``: Tiefensuche, Einträge nach Name sortiert,
+    Eltern vor Kindern; Pfade optional unter ``prefix``. Mehrfach verlinkte
+    Dateien erscheinen ab dem zweiten Namen als ``hardlink`` (mit ``source``,
+    falls das Original nicht übernommen wird); ``nlink`` zählt nur Namen im
+    Baum, damit gleiche Inhalte gleiche Images ergeben. Sockets werden
+    übersprungen.
+    """
+    root = os.fspath(root)
+    return _walk(root, "", prefix.strip("/"), {}, _count_links(root))
+
+
+# -------------------------------------------------------------
+# Archiv-Writer
+# -------------------------------------------------------------
+class TarImageWriter:
+    """Schreibt Einträge als (PAX-)Tar-Stream mit festen Zeitstempeln, ohne Benutzernamen."""
+
+    _TYPES = {
+        "file": tarfile.REGTYPE,
+        "dir": tarfile.DIRTYPE,
+        "symlink": tarfile.SYMTYPE,
+        "hardlink": tarfile.LNKTYPE,
+        "char": tarfile.CHRTYPE,
+        "block": tarfile.BLKTYPE,
+        "fifo": tarfile.FIFOTYPE,
+    }
+
+    def __init__(self, out: BinaryIO, mtime: int):
+        self.tar = tarfile.open(fileobj=out, mode="w|", format=tarfile.PAX_FORMAT, bufsize=COPY_BUFSIZE)
+        self.mtime = mtime
+
+    def add(self, entry: ImageEntry):
+        ti = tarfile.TarInfo(entry.path)
+        ti.type = self._TYPES[entry.kind]
+        ti.mode = entry.mode
+        ti.uid, ti.gid = entry.uid, entry.gid
+        ti.uname = ti.gname = ""
+        ti.mtime = self.mtime
+        ti.linkname = entry.target
+        if entry.kind in ("char", "block"):
+            ti.devmajor, ti.devminor = os.major(entry.rdev), os.minor(entry.rdev)
+        if entry.kind == "file":
+            ti.size = entry.size
+            with entry.open() as f:
+                self.tar.addfile(ti, f)
+        else:
+            self.tar.addfile(ti)
+
+    def close(self):
+        self.tar.close()
+
+
+class CpioImageWriter:
+    """
+    ``newc``-cpio (Initramfs-Format). Inode-Nummern werden fortlaufend
+    vergeben; Hardlinks teilen die Inode des Originals. Die Daten stehen beim
+    ersten Namen – so erwarten es der Kernel-Entpacker und GNU cpio.
+    """
+
+    _TYPES = {
+        "file": stat.S_IFREG,
+        "dir": stat.S_IFDIR,
+        "symlink": stat.S_IFLNK,
+        "char": stat.S_IFCHR,
+        "block": stat.S_IFBLK,
+        "fifo": stat.S_IFIFO,
+    }
+
+    def __init__(self, out: BinaryIO, mtime: int):
+        self.out = out
+        self.mtime = mtime
+        self.ino = 0
+        # Pfad → (Inode, Modus, uid, gid, nlink) mehrfach verlinkter Dateien
+        self.links: dict[str, tuple[int, int, int, int, int]] = {}
+
+    def _pad(self, length: int):
+        if length % 4:
+            self.out.write(b"\0" * (4 - length % 4))
+
+    def _header(self, name: bytes, mode: int, uid: int, gid: int, nlink: int, size: int,
+                rdev: int = 0, ino: int | None = None) -> int:
+        if ino is None:
+            self.ino += 1
+            ino = self.ino
+        fields = (ino, mode, uid, gid, nlink, self.mtime, size, 0, 0,
+                  os.major(rdev), os.minor(rdev), len(name) + 1, 0)
+        header = b"070701" + b"".join(b"%08X" % value for value in fields)
+        self.out.write(header + name + b"\0")
+        self._pad(len(header) + len(name) + 1)
+        return ino
+
+    def add(self, entry: ImageEntry):
+        name = entry.path.encode("utf-8", "surrogateescape")
+        if entry.kind == "hardlink":
+            if entry.target not in self.links:
+                raise ValueError(f"{entry.path}: Hardlink-Ziel {entry.target} fehlt im Archiv")
+            ino, mode, uid, gid, nlink = self.links[entry.target]
+            self._header(name, mode, uid, gid, nlink, 0, ino=ino)
+            return
+        if entry.kind == "file" and entry.size >= 1 << 32:
+            raise ValueError(f"{entry.path}: zu groß für cpio (>= 4 GiB)")
+
+        mode = self._TYPES[entry.kind] | entry.mode
+        nlink = 2 if entry.kind == "dir" else entry.nlink
+        if entry.kind == "symlink":
+            target = entry.target.encode("utf-8", "surrogateescape")
+            self._header(name, mode, entry.uid, entry.gid, nlink, len(target))
+            self.out.write(target)
+            self._pad(len(target))
+        elif entry.kind == "file":
+            ino = self._header(name, mode, entry.uid, entry.gid, nlink, entry.size)
+            if nlink > 1:
+                self.links[entry.path] = (ino, mode, entry.uid, entry.gid, nlink)
+            with entry.open() as f:
+                written = 0
+                while chunk := f.read(COPY_BUFSIZE):
+                    self.out.write(chunk)
+                    written += len(chunk)
+            if written != entry.size:
+                raise RuntimeError(f"{entry.path}: Größe hat sich während des Packens geändert")
+            self._pad(entry.size)
+        else:
+            self._header(name, mode, entry.uid, entry.gid, nlink, 0, entry.rdev)
+
+    def close(self):
+        self._header(b"TRAILER!!!", 0, 0, 0, 1, 0, ino=0)
+
+
+# -------------------------------------------------------------
+# Image-Packer
+# -------------------------------------------------------------
+class ImagePacker:
+    """
+    Packt ein fertiges RootFS in einem Durchlauf in ein Image.
+
+    cpio.zst/tar.zst werden direkt gestreamt und über mehrere Threads mit zstd
+    komprimiert. squashfs und erofs bekommen denselben Tar-Stream über stdin
+    (``mksquashfs -tar`` bzw. ``mkfs.erofs --tar``) und komprimieren selbst
+    parallel. ext4 wird per ``mkfs.ext4 -d`` aus dem Verzeichnis gebaut.
+    Reihenfolge, Zeitstempel, Benutzernamen und UUIDs sind fest, damit gleiche
+    Eingaben bitgleiche Images ergeben.
+    """
+
+    def __init__(self, image_dir: Path | str, jobs: int | None = None, epoch: int | None = None,
+                 level: int = 10, name: str = "rootfs"):
+        self.image_dir = Path(image_dir)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.epoch = default_epoch() if epoch is None else epoch
+        self.level = level
+        self.name = name
+
+    def output_path(self, fmt: str) -> Path:
+        return self.image_dir / f"{self.name}{IMAGE_FORMATS[fmt]}"
+
+    # -------------------------------------------------------------
+    # Streams
+    # -------------------------------------------------------------
+    def _write_entries(self, writer, entries: Iterable[ImageEntry]) -> int:
+        count = 0
+        for entry in entries:
+            writer.add(entry)
+            count += 1
+        writer.close()
+        return count
+
+    def _pack_zst(self, fmt: str, entries: Iterable[ImageEntry], out: BinaryIO) -> int:
+        compressed = open_zstd_writer(out, level=self.level, threads=self.jobs)
+        try:
+            writer_cls = CpioImageWriter if fmt == "cpio.zst" else TarImageWriter
+            return self._write_entries(writer_cls(compressed, self.epoch), entries)
+        finally:
+            compressed.close()
+
+    def _tool_command(self, fmt: str, output: Path) -> list[str]:
+        if fmt == "squashfs":
+            if not shutil.which("mksquashfs"):
+                raise RuntimeError("mksquashfs nicht gefunden (squashfs-tools >= 4.6 benötigt)")
+            return ["mksquashfs", "-", str(output), "-tar", "-noappend", "-quiet",
+                    "-processors", str(self.jobs), "-comp", "zstd",
+                    "-mkfs-time", str(self.epoch), "-all-time", str(self.epoch)]
+        if fmt == "erofs":
+            if not shutil.which("mkfs.erofs"):
+                raise RuntimeError("mkfs.erofs nicht gefunden (erofs-utils >= 1.7 benötigt)")
+            cmd = ["mkfs.erofs", "--tar=f", "-zlz4hc", f"-T{self.epoch}", "--all-time",
+                   f"-U{uuid.uuid5(uuid.NAMESPACE_URL, self.name)}"]
+            help_text = get_executor().run(["mkfs.erofs", "--help"], desc="mkfs.erofs --help",
+                                           capture=True, log=False).stdout.decode(errors="replace")
+            if "--workers" in help_text:
+                cmd.append(f"--workers={self.jobs}")
+            return cmd + [str(output)]
+        raise ValueError(f"Kein Tar-Werkzeug für Format {fmt}")
+
+    def _pack_via_tool(self, fmt: str, entries: Iterable[ImageEntry], output: Path) -> int:
+        cmd = self._tool_command(fmt, output)
+        debug(f"Image-Werkzeug: {' '.join(cmd)}")
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        try:
+            count = self._write_entries(TarImageWriter(proc.stdin, self.epoch), entries)
+        finally:
+            proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"{cmd[0]} mit Exit-Code {proc.returncode} beendet")
+        return count
+
+    def _pack_ext4(self, rootfs: Path, output: Path) -> int:
+        entries = list(walk_tree(rootfs))
+        size = sum(e.size for e in entries)
+        # Daten + Inodes + Journal großzügig abschätzen, in MiB
+        size_mb = max(64, int((size * 1.3 + len(entries) * 4096) / 2**20) + 64)
+        fs_uuid = uuid.uuid5(uuid.NAMESPACE_URL, self.name)
+        env = {**os.environ, "E2FSPROGS_FAKE_TIME": str(self.epoch)}
+        cmd = ["mkfs.ext4", "-q", "-F", "-d", str(rootfs), "-L", self.name[:16], "-U", str(fs_uuid),
+               "-E", f"root_owner=0:0,hash_seed={fs_uuid}", "-T", "default",
+               str(output), f"{size_mb}M"]
+        output.unlink(missing_ok=True)
+        get_executor().run(cmd, desc="mkfs.ext4", env=env).check()
+        return len(entries)
+
+    # -------------------------------------------------------------
+    # Öffentliche API
+    # -------------------------------------------------------------
+    def pack_entries(self, fmt: str, entries: Iterable[ImageEntry]) -> Path:
+        """Schreibt einen (sortierten) Eintrag-Strom als Image im Format ``fmt``."""
+        if fmt not in IMAGE_FORMATS or fmt == "ext4":
+            raise ValueError(f"Format {fmt} kann nicht aus einem Eintrag-Strom gebaut werden")
+        output = self.output_path(fmt)
+        tmp = output.with_name(output.name + ".tmp")
+        self.image_dir.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        try:
+            if fmt in ("cpio.zst", "tar.zst"):
+                with open(tmp, "wb") as out:
+                    count = self._pack_zst(fmt, entries, out)
+            else:
+                tmp.unlink(missing_ok=True)
+                count = self._pack_via_tool(fmt, entries, tmp)
+            os.replace(tmp, output)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        self._report(output, count, start)
+        return output
+
+    def pack(self, rootfs: Path | str, fmt: str) -> Path:
+        """Packt das RootFS-Verzeichnis ``rootfs`` im Format ``fmt``."""
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError(f"Unbekanntes Image-Format: {fmt} (erlaubt: {', '.join(IMAGE_FORMATS)})")
+        info(f"Packe {rootfs} als {fmt} ...")
+        if fmt != "ext4":
+            return self.pack_entries(fmt, walk_tree(rootfs))
+
+        output = self.output_path(fmt)
+        tmp = output.with_name(output.name + ".tmp")
+        start = time.perf_counter()
+        try:
+            count = self._pack_ext4(Path(rootfs), tmp)
+            os.replace(tmp, output)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        self._report(output, count, start)
+        return output
+
+    @staticmethod
+    def _report(output: Path, count: int, start: float):
+        seconds = time.perf_counter() - start
+        size = output.stat().st_size
+        success(f"Image erstellt: {output} ({count} Einträge, {size / 2**20:.1f} MiB, {seconds:.2f}s)")
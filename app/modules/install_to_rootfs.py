@@ -1,6 +1,7 @@
 from pathlib import Path
 from modules.paths import Paths
 from manager.pactinst import Pacman
+from manager.pkgcache import PackageCache
 from utils.logger import create, install, added, copy, remove, patch, loading, build, flash, test, running, success, info, warning
 
 class PackageInstaller:
@@ -21,7 +22,8 @@ class PackageInstaller:
                          "pkgconf", "autoconf", "automake", "apk-tools"]
         dev_packages = ["gcc", "clang", "glibc", "git", "autoconf", "automake"]
 
-        pkg_manager = Pacman(rootfs_dir=self.rootfs_dir, pacman_cache=self.cache_dir, update_cache=True)
+        pkg_manager = Pacman(rootfs_dir=self.rootfs_dir, pacman_cache=self.cache_dir, update_cache=True,
+                             store=PackageCache(self.paths.package_store))
 
         # 1. Pakete in Cache herunterladen
         info("Installing packages into RootFS using cache variant...")
@@ -33,7 +35,7 @@ class PackageInstaller:
         rootfs=self.rootfs_dir
 )
         # 2. Pakete aus Cache ins RootFS extrahieren
-        pkg_manager.extract_packages_to_rootfs()
+        pkg_manager.extract_packages_to_rootfs(base_packages + dev_packages)
         success("All packages successfully extracted into RootFS!")
 
     def install_pkgsx(self):
@@ -54,7 +56,7 @@ class PackageInstaller:
             info("Installing packages into RootFS using cache variant...")
             create(f"🛠 Installing base packages into RootFS: {base_packages}")
             pkg_manager.download_packages(base_packages)
-            pkg_manager.extract_packages_to_rootfs()
+            pkg_manager.extract_packages_to_rootfs(base_packages)
         else:
             create(f"Installing base packages into RootFS: {base_packages}")
             pkg_manager.install_packages(base_packages)
@@ -0,0 +1,274 @@
+# modules/layers.py
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+from utils.execute import get_executor
+from utils.fscopy import link_or_copy
+from utils.logger import debug, info, success, warning
+
+LAYER_VERSION = 1
+COMPOSE_MODES = ("auto", "overlay", "hardlink")
+# lowerdir-Option von overlayfs ist auf eine Speicherseite begrenzt
+OVERLAY_OPTIONS_MAX = 4000
+
+
+def hash_tree(*paths: Path | str) -> str:
+    """Stabiler Hash über Dateien/Verzeichnisbäume (Pfad, Typ, Modus, Inhalt bzw. Linkziel)."""
+    digest = hashlib.sha256()
+    for base in map(Path, paths):
+        digest.update(str(base).encode() + b"\0")
+        if not base.exists():
+            continue
+        entries = [base] if not base.is_dir() else sorted(base.rglob("*"))
+        for path in entries:
+            st = path.lstat()
+            digest.update(f"{path.relative_to(base) if path != base else '.'}\0{st.st_mode:o}\0".encode())
+            if stat.S_ISLNK(st.st_mode):
+                digest.update(os.readlink(path).encode())
+            elif stat.S_ISREG(st.st_mode):
+                with open(path, "rb") as f:
+                    while chunk := f.read(1024 * 1024):
+                        digest.update(chunk)
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class Layer:
+    name: str
+    key: str
+    path: Path
+    files: int = 0
+    size: int = 0
+
+    @property
+    def tree(self) -> Path:
+        return self.path / "tree"
+
+
+class LayerStore:
+    """
+    Inhaltsadressierter Speicher für RootFS-Ebenen (FHS, BusyBox, Pakete, ...).
+
+    Jede Ebene wird isoliert in ein leeres Verzeichnis gebaut und unter dem
+    Hash ihrer Eingaben abgelegt (``objects/<key[:2]>/<key>/tree``). Gleiche
+    Eingaben – etwa dasselbe Paket in zehn Image-Varianten – ergeben dieselbe
+    Ebene, die nur einmal gebaut und gespeichert wird.
+
+    Zusammengesetzt wird per overlayfs (Root und Kernel-Unterstützung nötig)
+    oder als Hardlink-Farm. Die Farm folgt den Regeln der Extraktion auf
+    Platte: spätere Ebenen gewinnen, Nicht-Verzeichnisse ersetzen keine
+    Verzeichnisse, Symlinks auf Verzeichnisse werden durchlaufen. Dateien der
+    Farm teilen Inodes mit dem Speicher und dürfen nicht in-place verändert
+    werden.
+    """
+
+    def __init__(self, root: Path | str, jobs: int | None = None):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.tmp = self.root / "tmp"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.tmp.mkdir(parents=True, exist_ok=True)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.built: list[Layer] = []
+        self.reused: list[Layer] = []
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------------------
+    # Lookup
+    # -------------------------------------------------------------
+    @staticmethod
+    def layer_key(name: str, inputs: str) -> str:
+        return hashlib.sha256(f"{LAYER_VERSION}\0{name}\0{inputs}".encode()).hexdigest()
+
+    def _layer_dir(self, key: str) -> Path:
+        return self.objects / key[:2] / key
+
+    def get(self, name: str, inputs: str) -> Layer | None:
+        key = self.layer_key(name, inputs)
+        meta_file = self._layer_dir(key) / "layer.json"
+        try:
+            meta = json.loads(meta_file.read_text())
+        except (OSError, ValueError):
+            return None
+        return Layer(name, key, meta_file.parent, meta.get("files", 0), meta.get("size", 0))
+
+    # -------------------------------------------------------------
+    # Bauen
+    # -------------------------------------------------------------
+    @staticmethod
+    def _measure(tree: Path) -> tuple[int, int]:
+        files = size = 0
+        for root, dirs, names in os.walk(tree):
+            for name in names:
+                st = os.lstat(os.path.join(root, name))
+                files += 1
+                size += st.st_size if stat.S_ISREG(st.st_mode) else 0
+        return files, size
+
+    def build(self, name: str, inputs: str, func: Callable[[Path], object]) -> Layer:
+        """
+        Liefert die Ebene zu (name, inputs); fehlt sie, schreibt ``func(tree)``
+        sie in ein leeres Verzeichnis, das danach atomar übernommen wird.
+        """
+        layer = self.get(name, inputs)
+        if layer:
+            debug("[layer] %s wiederverwendet (%s)", name, layer.key[:12])
+            with self._lock:
+                self.reused.append(layer)
+            return layer
+
+        key = self.layer_key(name, inputs)
+        staging = self.tmp / f"{key}.{os.getpid()}.{threading.get_ident()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        (staging / "tree").mkdir(parents=True)
+        start = time.perf_counter()
+        try:
+            func(staging / "tree")
+            files, size = self._measure(staging / "tree")
+            (staging / "layer.json").write_text(json.dumps({
+                "version": LAYER_VERSION,
+                "name": name,
+                "inputs": inputs,
+                "files": files,
+                "size": size,
+                "created": time.time(),
+            }))
+            target = self._layer_dir(key)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.rename(staging, target)
+            except OSError:
+                # Parallel von einem anderen Lauf gebaut – dessen Ebene gilt
+                if not (target / "layer.json").exists():
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        layer = Layer(name, key, self._layer_dir(key), files, size)
+        info(f"[layer] {name} gebaut ({files} Dateien, {size / 2**20:.1f} MiB, "
+             f"{time.perf_counter() - start:.2f}s)")
+        with self._lock:
+            self.built.append(layer)
+        return layer
+
+    def build_many(self, specs: list[tuple[str, str, Callable[[Path], object]]]) -> list[Layer]:
+        """Baut unabhängige Ebenen (name, inputs, func) parallel; Reihenfolge bleibt erhalten."""
+        if self.jobs <= 1 or len(specs) <= 1:
+            return [self.build(*spec) for spec in specs]
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            return list(pool.map(lambda spec: self.build(*spec), specs))
+
+    # -------------------------------------------------------------
+    # Zusammensetzen
+    # -------------------------------------------------------------
+    @staticmethod
+    def overlay_supported() -> bool:
+        if os.geteuid() != 0:
+            return False
+        try:
+            return "overlay" in Path("/proc/filesystems").read_text().split()
+        except OSError:
+            return False
+
+    @staticmethod
+    def release(target: Path | str):
+        """Hängt ein zuvor gemountetes Overlay unter ``target`` aus."""
+        if os.path.ismount(target):
+            get_executor().run(["umount", str(target)], desc="umount").check()
+
+    def compose(self, layers: list[Layer], target: Path | str, mode: str = "auto",
+                upper: Path | str | None = None) -> str:
+        """
+        Setzt ``layers`` (unterste zuerst) unter ``target`` zusammen und
+        liefert den verwendeten Modus (overlay/hardlink).
+        """
+        if mode not in COMPOSE_MODES:
+            raise ValueError(f"Unbekannter Modus: {mode}")
+        target = Path(target)
+        start = time.perf_counter()
+        self.release(target)
+        shutil.rmtree(target, ignore_errors=True)
+        target.mkdir(parents=True)
+
+        if mode in ("auto", "overlay") and self.overlay_supported():
+            # Relativ zu objects/, damit möglichst viele Ebenen in die Option passen
+            lower = ":".join(str(layer.tree.relative_to(self.objects)) for layer in reversed(layers))
+            if len(lower) <= OVERLAY_OPTIONS_MAX:
+                self._mount_overlay(lower, target, Path(upper or self.root / "upper"))
+                success(f"[layer] RootFS aus {len(layers)} Ebenen per overlayfs ({time.perf_counter() - start:.2f}s)")
+                return "overlay"
+            info(f"[layer] {len(layers)} Ebenen passen nicht in eine Overlay-Option, nutze Hardlinks")
+        elif mode == "overlay":
+            raise RuntimeError("overlayfs nicht verfügbar (Root und Kernel-Unterstützung nötig)")
+
+        linked = 0
+        dir_meta: dict[str, os.stat_result] = {}
+        for layer in layers:
+            linked += self._link_layer(layer.tree, target, dir_meta)
+        # Verzeichnis-Metadaten zuletzt (oberste Ebene gewinnt), tiefste zuerst
+        root = os.geteuid() == 0
+        for dst in sorted(dir_meta, key=lambda d: d.count("/"), reverse=True):
+            st = dir_meta[dst]
+            if root:
+                os.chown(dst, st.st_uid, st.st_gid)
+            os.chmod(dst, stat.S_IMODE(st.st_mode))
+            os.utime(dst, ns=(st.st_mtime_ns, st.st_mtime_ns))
+        success(f"[layer] RootFS aus {len(layers)} Ebenen per Hardlink-Farm "
+                f"({linked} Einträge, {time.perf_counter() - start:.2f}s)")
+        return "hardlink"
+
+    def _mount_overlay(self, lower: str, target: Path, upper: Path):
+        shutil.rmtree(upper, ignore_errors=True)
+        (upper / "data").mkdir(parents=True)
+        (upper / "work").mkdir()
+        options = f"lowerdir={lower},upperdir={upper / 'data'},workdir={upper / 'work'}"
+        get_executor().run(["mount", "-t", "overlay", "overlay", "-o", options, str(target)],
+                           cwd=self.objects, desc="mount overlay").check()
+
+    @staticmethod
+    def _link_layer(tree: Path, target: Path, dir_meta: dict[str, os.stat_result]) -> int:
+        count = 0
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            with os.scandir(tree / rel) as entries:
+                for entry in entries:
+                    path = os.path.join(rel, entry.name)
+                    dst = os.path.join(target, path)
+                    st = entry.stat(follow_symlinks=False)
+                    if stat.S_ISDIR(st.st_mode):
+                        if not os.path.isdir(dst):
+                            if os.path.lexists(dst):
+                                os.unlink(dst)
+                            os.mkdir(dst)
+                        dir_meta[dst] = st
+                        stack.append(path)
+                        continue
+
+                    if os.path.isdir(dst) and not os.path.islink(dst):
+                        warning(f"[layer] {path} ist ein Verzeichnis im RootFS, übersprungen")
+                        continue
+                    if os.path.lexists(dst):
+                        os.unlink(dst)
+                    if stat.S_ISLNK(st.st_mode):
+                        os.symlink(os.readlink(entry.path), dst)
+                    else:
+                        # Hardlink; über Dateisystemgrenzen Reflink oder Kopie
+                        link_or_copy(entry.path, dst, "hardlink")
+                    count += 1
+        return count
+
+    def summary(self):
+        built = sum(layer.size for layer in self.built)
+        reused = sum(layer.size for layer in self.reused)
+        success(f"[layer] {len(self.built)} Ebenen gebaut ({built / 2**20:.1f} MiB), "
+                f"{len(self.reused)} wiederverwendet ({reused / 2**20:.1f} MiB)")
@@ -14,6 +14,8 @@ class Paths:
             self.download,
             self.cache,
             self.pacman_cache,
+            self.package_store,
+            self.layers,
             self.rootfs,
             self.images,
             self.logs,
@@ -60,4 +62,13 @@ class Paths:
     
     @property
     def pacman_cache(self) -> Path:
-        return self.rootfs / "var/cache/pacman"
\ No newline at end of file
+        # Außerhalb des RootFS, damit Downloads ein clean_rootfs überleben
+        return self.cache / "pacman"
+
+    @property
+    def package_store(self) -> Path:
+        return self.cache / "packages"
+
+    @property
+    def layers(self) -> Path:
+        return self.cache / "layers"
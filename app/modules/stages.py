@@ -0,0 +1,171 @@
+# modules/stages.py
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+from utils.logger import error, info, running, span, success
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[], object]
+    deps: list[str] = field(default_factory=list)
+    # Verzeichnisse, in die der Stage schreibt; überlappende Stages laufen nie gleichzeitig
+    outputs: list[Path] = field(default_factory=list)
+    start: float | None = None
+    end: float | None = None
+    state: str = "pending"  # pending | running | done | failed | skipped
+
+    @property
+    def seconds(self) -> float:
+        return (self.end - self.start) if self.start is not None and self.end is not None else 0.0
+
+
+def _overlaps(a: Path, b: Path) -> bool:
+    return a == b or a in b.parents or b in a.parents
+
+
+class StageGraph:
+    """
+    Deklarativer Stage-Graph: Stages mit Abhängigkeiten und Ausgaben.
+
+    Ein Stage startet, sobald alle Abhängigkeiten fertig sind und kein
+    laufender Stage in dieselben Ausgabeverzeichnisse schreibt. Unabhängige
+    Stages (z.B. BusyBox kompilieren und Pakete laden) laufen so parallel.
+    """
+
+    def __init__(self, jobs: int | None = None):
+        # None = so viele gleichzeitige Stages, wie der Graph zulässt
+        self.jobs = jobs
+        self.stages: dict[str, Stage] = {}
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    def add(self, name: str, func: Callable[[], object], deps: list[str] | None = None,
+            outputs: list[Path | str] | None = None) -> Stage:
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' doppelt definiert")
+        stage = Stage(name, func, list(deps or []), [Path(p) for p in outputs or []])
+        self.stages[name] = stage
+        return stage
+
+    def order(self) -> list[str]:
+        """Topologische Reihenfolge (Definitionsreihenfolge bleibt bei Gleichstand erhalten)."""
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' hängt von unbekanntem Stage '{dep}' ab")
+        result: list[str] = []
+        visiting: set[str] = set()
+
+        def visit(name: str):
+            if name in result:
+                return
+            if name in visiting:
+                raise ValueError(f"Zyklus im Stage-Graph bei '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            result.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return result
+
+    # -------------------------------------------------------------
+    # Ausführung
+    # -------------------------------------------------------------
+    def _ready(self, stage: Stage, active: list[Stage]) -> bool:
+        if any(self.stages[dep].state != "done" for dep in stage.deps):
+            return False
+        return not any(_overlaps(a, b) for other in active for a in stage.outputs for b in other.outputs)
+
+    def _execute(self, stage: Stage):
+        stage.start = time.perf_counter()
+        running(f"[stage] {stage.name} gestartet")
+        try:
+            with span(stage.name, "stage"):
+                stage.func()
+        finally:
+            stage.end = time.perf_counter()
+
+    def run(self):
+        """Führt alle Stages aus; der erste Fehler bricht ab, nachdem laufende Stages fertig sind."""
+        pending = self.order()
+        limit = self.jobs or max(len(pending), 1)
+        active: dict = {}
+        failure: BaseException | None = None
+        self.started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=limit, thread_name_prefix="stage") as pool:
+            while pending or active:
+                if failure is None:
+                    for name in list(pending):
+                        if len(active) >= limit:
+                            break
+                        stage = self.stages[name]
+                        if self._ready(stage, list(active.values())):
+                            pending.remove(name)
+                            stage.state = "running"
+                            active[pool.submit(self._execute, stage)] = stage
+                if not active:
+                    break
+                done, _ = wait(active, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = active.pop(future)
+                    exc = future.exception()
+                    if exc is None:
+                        stage.state = "done"
+                        success(f"[stage] {stage.name} fertig ({stage.seconds:.2f}s)")
+                    else:
+                        stage.state = "failed"
+                        error(f"[stage] {stage.name} fehlgeschlagen: {exc}")
+                        failure = failure or exc
+
+        self.finished = time.perf_counter()
+        for name in pending:
+            self.stages[name].state = "skipped"
+        self.report()
+        if failure is not None:
+            raise failure
+
+    # -------------------------------------------------------------
+    # Auswertung
+    # -------------------------------------------------------------
+    def critical_path(self) -> list[str]:
+        """Längste Kette (nach Laufzeit) über die Abhängigkeiten."""
+        finish: dict[str, float] = {}
+        via: dict[str, str | None] = {}
+        for name in self.order():
+            stage = self.stages[name]
+            best = max(stage.deps, key=lambda d: finish[d], default=None)
+            finish[name] = stage.seconds + (finish[best] if best else 0.0)
+            via[name] = best
+        if not finish:
+            return []
+        path = []
+        name: str | None = max(finish, key=finish.get)
+        while name:
+            path.append(name)
+            name = via[name]
+        return path[::-1]
+
+    def report(self):
+        if self.started is None:
+            return
+        wall = (self.finished or time.perf_counter()) - self.started
+        critical = self.critical_path()
+        info("[stage] Zeitplan (Start / Dauer, * = kritischer Pfad):")
+        for name in self.order():
+            stage = self.stages[name]
+            offset = f"{stage.start - self.started:7.2f}s" if stage.start is not None else "      - "
+            mark = "*" if name in critical else " "
+            info(f"  {mark} {name:<20} {offset}  {stage.seconds:7.2f}s  {stage.state}")
+        serial = sum(stage.seconds for stage in self.stages.values())
+        info(f"[stage] Kritischer Pfad: {' → '.join(critical)} "
+             f"({sum(self.stages[n].seconds for n in critical):.2f}s)")
+        info(f"[stage] Gesamt {wall:.2f}s, seriell wären es {serial:.2f}s "
+             f"(Faktor {serial / wall if wall else 1.0:.2f})")
@@ -0,0 +1,161 @@
+# modules/treehash.py
+import hashlib
+import marshal
+import os
+import stat
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from utils.logger import info
+
+CACHE_VERSION = 2
+
+
+class TreeHasher:
+    """
+    Paralleler Merkle-Hash über einen Verzeichnisbaum (z.B. Paths.rootfs).
+
+    Blätter hashen Typ/Modus, Besitzer, mtime (Sekunden) und Inhalt bzw.
+    Linkziel; ein Verzeichnis hasht seine Metadaten und die nach Namen
+    (bytes) sortierten Paare aus Name und Kind-Hash. Das Ergebnis hängt so
+    weder von der Verzeichnisreihenfolge des Dateisystems noch von Inodes ab.
+
+    Dateiinhalte werden in einem Thread-Pool gehasht und pro Pfad mit
+    (Gerät, Inode, mtime, ctime, Größe) gecacht; bei einem unveränderten Baum
+    fallen nur noch stat-Aufrufe an. Die ctime ist nötig, weil der
+    reproduzierbare Modus alle mtimes auf die Epoche klemmt und ein Neubau
+    Inodes wiederverwendet – utime kann die ctime nicht zurücksetzen.
+    Besitzer bzw. mtime lassen sich aus dem Hash herausnehmen (z.B. ohne
+    Rootrechte gebaute Bäume).
+    """
+
+    def __init__(self, cache_file: Path | str | None = None, jobs: int | None = None,
+                 owner: bool = True, mtime: bool = True):
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.jobs = jobs or os.cpu_count() or 1
+        self.owner = owner
+        self.mtime = mtime
+        self.hashed = 0
+        self.cached = 0
+        self.bytes_hashed = 0
+        # relativer Pfad (bytes) → Hex-Hash aller Knoten des letzten Laufs
+        self.nodes: dict[bytes, str] = {}
+
+    # -------------------------------------------------------------
+    # Cache
+    # -------------------------------------------------------------
+    def _load_cache(self, root: bytes) -> dict:
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, "rb") as f:
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION or data.get("root") != root:
+            return {}
+        return data.get("files", {})
+
+    def _save_cache(self, root: bytes, files: dict):
+        if not self.cache_file:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_file.with_name(f"{self.cache_file.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            marshal.dump({"version": CACHE_VERSION, "root": root, "files": files}, f)
+        os.replace(tmp, self.cache_file)
+
+    # -------------------------------------------------------------
+    # Hashing
+    # -------------------------------------------------------------
+    @staticmethod
+    def _scan(root: bytes) -> dict[bytes, list[tuple[bytes, bytes, os.stat_result]]]:
+        """Verzeichnis (relativ) → [(Name, relativer Pfad, lstat)] für den ganzen Baum."""
+        tree = {}
+        stack = [b""]
+        while stack:
+            rel = stack.pop()
+            children = []
+            with os.scandir(os.path.join(root, rel) if rel else root) as entries:
+                for entry in entries:
+                    st = entry.stat(follow_symlinks=False)
+                    child = os.path.join(rel, entry.name) if rel else entry.name
+                    children.append((entry.name, child, st))
+                    if stat.S_ISDIR(st.st_mode):
+                        stack.append(child)
+            children.sort(key=lambda item: item[0])
+            tree[rel] = children
+        return tree
+
+    def _content(self, path: bytes) -> bytes:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").digest()
+
+    def _node(self, st: os.stat_result, payload: bytes) -> bytes:
+        digest = hashlib.sha256(struct.pack("<I", st.st_mode))
+        if self.owner:
+            digest.update(struct.pack("<II", st.st_uid, st.st_gid))
+        if self.mtime:
+            digest.update(struct.pack("<q", st.st_mtime_ns // 10**9))
+        digest.update(payload)
+        return digest.digest()
+
+    def hash(self, root: Path | str, manifest: Path | str | None = None) -> str:
+        """Liefert den Wurzel-Hash (hex); optional mit Manifest aller Knoten-Hashes."""
+        start = time.perf_counter()
+        root_b = os.fsencode(root)
+        cache = self._load_cache(root_b)
+        tree = self._scan(root_b)
+
+        # Inhalte: Cache-Treffer übernehmen, den Rest parallel hashen
+        contents: dict[bytes, bytes] = {}
+        files: dict = {}
+        missing = []
+        for children in tree.values():
+            for _, rel, st in children:
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                stamp = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+                hit = cache.get(rel)
+                if hit and tuple(hit[:-1]) == stamp:
+                    contents[rel] = hit[-1]
+                    files[rel] = hit
+                else:
+                    missing.append((rel, stamp))
+        self.cached = len(contents)
+        self.hashed = len(missing)
+        self.bytes_hashed = sum(stamp[-1] for _, stamp in missing)
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            digests = pool.map(lambda item: self._content(os.path.join(root_b, item[0])), missing)
+            for (rel, stamp), digest in zip(missing, digests):
+                contents[rel] = digest
+                files[rel] = (*stamp, digest)
+
+        # Blätter und Verzeichnisse von unten nach oben
+        nodes: dict[bytes, bytes] = {}
+        for rel in sorted(tree, key=lambda d: d.count(b"/") + (d != b""), reverse=True):
+            listing = hashlib.sha256()
+            for name, child, st in tree[rel]:
+                if stat.S_ISDIR(st.st_mode):
+                    node = nodes[child]
+                elif stat.S_ISREG(st.st_mode):
+                    node = self._node(st, contents[child])
+                elif stat.S_ISLNK(st.st_mode):
+                    node = self._node(st, os.readlink(os.path.join(root_b, child)))
+                else:
+                    node = self._node(st, struct.pack("<Q", st.st_rdev))
+                nodes[child] = node
+                listing.update(name + b"\0" + node)
+            dir_st = os.lstat(os.path.join(root_b, rel) if rel else root_b)
+            nodes[rel] = self._node(dir_st, listing.digest())
+
+        self._save_cache(root_b, files)
+        self.nodes = {rel: node.hex() for rel, node in nodes.items()}
+        result = self.nodes[b""]
+        if manifest:
+            lines = (f"{self.nodes[rel]}  {os.fsdecode(rel) or '.'}" for rel in sorted(self.nodes))
+            Path(manifest).write_text("\n".join(lines) + "\n")
+        info(f"[hash] {result[:16]} über {len(nodes)} Einträge ({self.hashed} Dateien gehasht, "
+             f"{self.bytes_hashed / 2**20:.1f} MiB; {self.cached} aus Cache; {time.perf_counter() - start:.2f}s)")
+        return result
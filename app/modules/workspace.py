@@ -13,6 +13,8 @@ class Workspace:
             self.paths.download,
             self.paths.cache,
             self.paths.pacman_cache,
+            self.paths.package_store,
+            self.paths.layers,
             self.paths.rootfs,
             self.paths.images,
             self.paths.logs,
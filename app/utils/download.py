@@ -1,8 +1,17 @@
+import hashlib
+import json
+import os
 import requests
 import tarfile
+import threading
 import zipfile
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
 from pathlib import Path
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from rich.progress import (
     Progress,
     BarColumn,
@@ -13,85 +22,492 @@ from rich.progress import (
 )
 from rich.console import Console
 from utils.logger import *
+from utils.zstd import open_zstd_reader
 
 console = Console()
 
 
-def download_file(urls, dest_dir: Path, timeout: int = 60, max_retries: int = 3, backoff_factor: float = 2.0) -> Path:
+# Netzwerk-Tuning
+CHUNK_SIZE = 256 * 1024
+PROBE_BYTES = 256 * 1024
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+JOURNAL_INTERVAL = 1.0
+POOL_SIZE = 16
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """Eine gepoolte Session pro Host (Keep-Alive, Verbindungen werden wiederverwendet)."""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount(f"{parts.scheme}://", adapter)
+            _sessions[host] = session
+        return session
+
+
+class Throttle:
+    """Verbindungslimit pro Host und globales Bandbreitenlimit (Token-Bucket)."""
+
+    def __init__(self, per_host: int | None = None, bandwidth: float | None = None):
+        self.per_host = per_host
+        self.bandwidth = bandwidth
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        # Burst von max. 250 ms, damit das Limit auch kurzfristig greift
+        self._capacity = (bandwidth or 0.0) / 4
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+
+    @contextmanager
+    def connection(self, url: str):
+        if not self.per_host:
+            yield
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._slots.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with slot:
+            yield
+
+    def consume(self, nbytes: int):
+        if not self.bandwidth:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self.bandwidth)
+            self._last = now
+            self._tokens -= nbytes
+            delay = -self._tokens / self.bandwidth if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+_NO_THROTTLE = Throttle()
+
+
+def download_progress() -> Progress:
+    return Progress(
+        TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
+        BarColumn(bar_width=None),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TimeRemainingColumn(),
+        TextColumn("[green]{task.fields[path]}"),
+    )
+
+
+@dataclass
+class MirrorProbe:
+    url: str
+    throughput: float = 0.0
+    total: int = 0
+    ranges: bool = False
+    head: bytes = b""
+    error: Exception | None = None
+
+
+def _probe_mirror(url: str, timeout: float, throttle: Throttle = _NO_THROTTLE) -> MirrorProbe:
+    """Lädt die ersten Bytes und misst den Durchsatz; erkennt Größe und Range-Support."""
+    probe = MirrorProbe(url)
+    start = time.perf_counter()
+    try:
+        headers = {"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+        with throttle.connection(url), \
+                get_session(url).get(url, headers=headers, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            data = bytearray()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                data += chunk
+                if len(data) >= PROBE_BYTES:
+                    break
+            if response.status_code == 206:
+                probe.ranges = True
+                content_range = response.headers.get("content-range", "")
+                probe.total = int(content_range.rsplit("/", 1)[-1]) if "/" in content_range else 0
+                probe.head = bytes(data)
+            else:
+                probe.total = int(response.headers.get("content-length", 0))
+        probe.throughput = len(data) / max(time.perf_counter() - start, 1e-6)
+    except Exception as e:
+        probe.error = e
+    return probe
+
+
+def rank_mirrors(urls: list[str], timeout: float, throttle: Throttle = _NO_THROTTLE) -> list[MirrorProbe]:
+    """Probiert alle Mirrors parallel an und sortiert sie nach frühem Durchsatz."""
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        probes = list(pool.map(lambda u: _probe_mirror(u, timeout, throttle), urls))
+    for probe in probes:
+        if probe.error:
+            warning(f"Mirror nicht erreichbar: {probe.url} ({probe.error})")
+        else:
+            debug(f"Mirror {probe.url}: {probe.throughput / 2**20:.2f} MiB/s")
+    return sorted((p for p in probes if not p.error), key=lambda p: p.throughput, reverse=True)
+
+
+class _StreamHasher:
+    """
+    Hasht die Datei während des Downloads in Dateireihenfolge.
+
+    In Reihenfolge ankommende Daten werden direkt aus dem Speicher gehasht.
+    Segmente, die vor der Hash-Front fertig werden, liegen bereits in der
+    Datei und werden beim Aufholen einmal aus dem Page-Cache gelesen.
+    """
+
+    def __init__(self, fd: int, algorithm: str | None):
+        self.fd = fd
+        self.algorithm = algorithm
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.digest = hashlib.new(self.algorithm) if self.algorithm else None
+        self.front = 0
+        self.written: dict[int, int] = {}  # Segment → geschriebenes Ende
+
+    def feed(self, segment: int, offset: int, data: bytes):
+        with self.lock:
+            if self.digest is not None:
+                self._catch_up()
+            self.written[segment] = offset + len(data)
+            if self.digest is None:
+                return
+            if offset == self.front:
+                self.digest.update(data)
+                self.front += len(data)
+            self._catch_up()
+
+    def _catch_up(self):
+        for start in sorted(self.written):
+            end = self.written[start]
+            if start <= self.front < end:
+                while self.front < end:
+                    chunk = os.pread(self.fd, min(CHUNK_SIZE, end - self.front), self.front)
+                    self.digest.update(chunk)
+                    self.front += len(chunk)
+
+    def hexdigest(self) -> str | None:
+        with self.lock:
+            if self.digest is None:
+                return None
+            self._catch_up()
+            return self.digest.hexdigest()
+
+
+class _SegmentJournal:
+    """
+    Fortschritt eines segmentierten Downloads in ``<datei>.part.segments``.
+
+    Segmente werden per pwrite an ihre Endposition geschrieben, die
+    ``.part`` ist danach lückenhaft. Ohne Journal wäre ihre Größe kein
+    gültiger Fortsetzungspunkt; mit Journal setzt jedes Segment an seinem
+    eigenen geschriebenen Ende fort. Gespeichert wird höchstens alle
+    JOURNAL_INTERVAL Sekunden (und bei Fehlern) – die Stände liegen damit
+    immer hinter den tatsächlich geschriebenen Bytes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.saved = 0.0
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self, total: int | None) -> list[list[int]] | None:
+        """[[Start, Ende, geschrieben], ...] oder None, wenn unbrauchbar."""
+        try:
+            data = json.loads(self.path.read_text())
+            segments = [[int(a), int(b), int(w)] for a, b, w in data["segments"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if not total or data.get("total") != total or not segments:
+            return None
+        return segments
+
+    def save(self, total: int, bounds: list[tuple[int, int]], hasher: "_StreamHasher", force: bool = False):
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.saved < JOURNAL_INTERVAL:
+                return
+            self.saved = now
+            with hasher.lock:
+                written = dict(hasher.written)
+            segments = [[a, b, written.get(_segment_key(i, a), a)] for i, (a, b) in enumerate(bounds)]
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps({"total": total, "segments": segments}))
+            os.replace(tmp, self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+def _segment_key(index: int, start: int) -> int:
+    # Segment 0 setzt den zusammenhängenden Dateianfang fort und beginnt im Hasher bei 0
+    return 0 if index == 0 else start
+
+
+def _fetch_range(url: str, fd: int, start: int, end: int | None, hasher: _StreamHasher, segment: int,
+                 timeout: float, on_progress, throttle: Throttle = _NO_THROTTLE) -> int:
+    """Lädt [start, end) bzw. ab ``start`` bis Dateiende nach ``fd``; liefert die neue Position."""
+    headers = {"Range": f"bytes={start}-{'' if end is None else end - 1}"} if start or end else {}
+    position = start
+    with throttle.connection(url), \
+            get_session(url).get(url, headers=headers, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        if start and response.status_code != 206:
+            raise RuntimeError(f"{url} unterstützt keine Range-Requests")
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if end is not None:
+                chunk = chunk[: end - position]
+            throttle.consume(len(chunk))
+            os.pwrite(fd, chunk, position)
+            hasher.feed(segment, position, chunk)
+            position += len(chunk)
+            on_progress(len(chunk))
+            if end is not None and position >= end:
+                break
+    if end is not None and position < end:
+        raise RuntimeError(f"Verbindung vorzeitig beendet bei Byte {position}")
+    return position
+
+
+def download_file(urls, dest_dir: Path, timeout: int = 60, max_retries: int = 3, backoff_factor: float = 2.0,
+                  sha256: str | None = None, segments: int = 4,
+                  progress: Progress | None = None, throttle: Throttle | None = None) -> Path:
     """
     Lädt eine Datei via HTTP/HTTPS herunter.
-    Unterstützt mehrere Mirror-URLs als Fallback.
-    Zeigt modernes TUI mit ETA, Fortschritt, Dateigröße und Zielpfad.
-    Fügt automatische Wiederholungen und Backoff hinzu.
+    - gepoolte Session pro Host
+    - Fortsetzung per HTTP-Range aus ``<datei>.part``, Umbenennen erst bei Vollständigkeit
+      (segmentierte Läufe setzen pro Segment über ``<datei>.part.segments`` fort)
+    - große Dateien in parallelen Segmenten über mehrere Mirrors
+    - Mirror-Auswahl nach frühem Durchsatz
+    - Prüfsumme (sha256) wird während des Downloads berechnet
+    Zeigt modernes TUI mit ETA, Fortschritt, Dateigröße und Zielpfad
+    (oder nutzt ``progress`` einer gemeinsamen Ansicht, siehe download_many).
     """
+    throttle = throttle or _NO_THROTTLE
     dest_dir = Path(dest_dir)
     dest_dir.mkdir(parents=True, exist_ok=True)
 
     if isinstance(urls, str):
         urls = [urls]
 
-    last_error = None
-    for url in urls:
-        filename = url.split("/")[-1]
-        dest = dest_dir / filename
+    filename = urls[0].split("/")[-1]
+    dest = dest_dir / filename
+    part = dest_dir / f"{filename}.part"
+    journal = _SegmentJournal(dest_dir / f"{filename}.part.segments")
 
-        if dest.exists():
+    if dest.exists():
+        if not sha256:
             warning(f"{filename} bereits vorhanden, überspringe Download.")
             return dest
+        with open(dest, "rb") as f:
+            existing = hashlib.file_digest(f, "sha256").hexdigest()
+        if existing == sha256.lower():
+            warning(f"{filename} bereits vorhanden (Prüfsumme ok), überspringe Download.")
+            return dest
+        warning(f"{filename} vorhanden, aber Prüfsumme falsch – lade neu")
+        dest.unlink()
+
+    mirrors = rank_mirrors(urls, timeout, throttle)
+    if not mirrors:
+        raise RuntimeError(f"Download fehlgeschlagen: kein Mirror erreichbar für {filename}")
+    best = mirrors[0]
+    info(f"Lade {filename} von {best.url} ({best.throughput / 2**20:.2f} MiB/s im Test)")
+
+    total = best.total
+    ranged = [m for m in mirrors if m.ranges and m.total == total]
+    fd = os.open(part, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+    try:
+        resume_from = os.fstat(fd).st_size
+        resumed = None
+        if journal.exists():
+            # Lückenhafte .part eines segmentierten Laufs: nur mit passendem Journal
+            # und Range-fähigen Mirrors fortsetzbar, sonst von vorne
+            resumed = journal.load(total) if ranged else None
+            if resumed is None:
+                warning(f"Segment-Journal für {filename} unbrauchbar, beginne neu")
+                journal.remove()
+                os.ftruncate(fd, 0)
+                resume_from = 0
+        if total and resume_from > total:
+            os.ftruncate(fd, 0)
+            resume_from = 0
+
+        own_progress = progress is None
+        progress = progress or download_progress()
+        with progress if own_progress else nullcontext():
+            task = progress.add_task("download", filename=filename, path=str(dest_dir), total=total or None)
+            advance = lambda n: progress.update(task, advance=n)
+
+            hasher = _StreamHasher(fd, "sha256" if sha256 else None)
+            if resumed:
+                # Vorhandene Segmentteile werden beim Aufholen einmal nachgehasht
+                done = 0
+                for index, (seg_start, _, written) in enumerate(resumed):
+                    key = _segment_key(index, seg_start)
+                    hasher.written[key] = written
+                    done += written - key
+                info(f"Setze {len(resumed)} Segmente von {filename} bei {done / 2**20:.1f} MiB fort")
+                advance(done)
+                bounds = [(seg_start, seg_end) for seg_start, seg_end, _ in resumed]
+            else:
+                if resume_from:
+                    info(f"Setze {filename} bei {resume_from / 2**20:.1f} MiB fort")
+                    # Vorhandener Teil wird beim ersten neuen Chunk einmal nachgehasht
+                    hasher.written[0] = resume_from
+                    advance(resume_from)
+                elif best.head:
+                    # Testdaten des schnellsten Mirrors weiterverwenden
+                    os.pwrite(fd, best.head, 0)
+                    hasher.feed(0, 0, best.head)
+                    resume_from = len(best.head)
+                    advance(resume_from)
+                bounds = None
+                if total and ranged and segments > 1 and total - resume_from >= SEGMENT_MIN_SIZE:
+                    size = -(-(total - resume_from) // segments)
+                    bounds = [(s, min(s + size, total)) for s in range(resume_from, total, size)]
+
+            if total and resume_from >= total and not resumed:
+                # Probe bzw. vorhandene .part enthalten bereits die ganze Datei
+                debug(f"{filename} bereits vollständig ({resume_from} Bytes), kein weiterer Request")
+            elif bounds:
+                _download_segmented(ranged, fd, bounds, total, hasher, journal,
+                                    timeout, max_retries, backoff_factor, advance, throttle)
+            else:
+                _download_stream(mirrors, fd, resume_from, hasher, timeout, max_retries, backoff_factor,
+                                 advance, throttle)
+
+        digest = hasher.hexdigest()
+    finally:
+        os.close(fd)
+    journal.remove()
 
-        info(f"Versuche Download von {url} ...")
+    if sha256 and digest != sha256.lower():
+        part.unlink(missing_ok=True)
+        raise RuntimeError(f"Prüfsumme falsch für {filename}: {digest} != {sha256}")
+
+    os.replace(part, dest)
+    success(f"Download abgeschlossen: {dest}")
+    return dest
+
+
+def _download_stream(mirrors: list[MirrorProbe], fd: int, position: int, hasher: _StreamHasher,
+                     timeout: float, max_retries: int, backoff_factor: float, advance, throttle: Throttle):
+    """Ein Stream, Mirror für Mirror mit Wiederholungen; setzt nach Fehlern per Range fort."""
+    last_error = None
+    for mirror in mirrors:
         attempt = 0
         current_timeout = timeout
-
         while attempt < max_retries:
             try:
-                with requests.get(url, stream=True, timeout=current_timeout) as response:
-                    response.raise_for_status()
-                    total = int(response.headers.get("content-length", 0))
-
-                    progress = Progress(
-                        TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
-                        BarColumn(bar_width=None),
-                        DownloadColumn(),
-                        TransferSpeedColumn(),
-                        TimeRemainingColumn(),
-                        TextColumn("[green]{task.fields[path]}"),
-                    )
-
-                    with progress:
-                        task = progress.add_task(
-                            "download",
-                            filename=filename,
-                            path=str(dest_dir),
-                            total=total,
-                        )
-
-                        with open(dest, "wb") as f:
-                            for chunk in response.iter_content(chunk_size=1024 * 32):
-                                f.write(chunk)
-                                progress.update(task, advance=len(chunk))
-
-                success(f"Download abgeschlossen: {dest}")
-                return dest
-
+                if position and not mirror.ranges:
+                    # Kein Range-Support: von vorne beginnen
+                    os.ftruncate(fd, 0)
+                    hasher.reset()
+                    advance(-position)
+                    position = 0
+                _fetch_range(mirror.url, fd, position, None, hasher, 0, current_timeout, advance, throttle)
+                return
             except Exception as e:
                 attempt += 1
                 last_error = e
+                position = hasher.written.get(0, position)
                 wait_time = backoff_factor ** attempt
-                warning(f"⚠️ Fehler beim Download von {url} (Versuch {attempt}/{max_retries}): {e}")
+                warning(f"⚠️ Fehler beim Download von {mirror.url} (Versuch {attempt}/{max_retries}): {e}")
                 if attempt < max_retries:
                     info(f"Warte {wait_time:.1f}s vor erneutem Versuch ...")
                     time.sleep(wait_time)
                     current_timeout *= 1.5  # Timeout erhöhen für langsame Server
                 else:
                     info("Maximale Wiederholungen für diese URL erreicht, versuche nächsten Mirror ...")
-                    break
 
     raise RuntimeError(f"Download fehlgeschlagen. Letzter Fehler: {last_error}")
 
 
-# extract_archive und download_and_extract bleiben unverändert
-def extract_archive(archive_path: Path, extract_to: Path) -> Path:
+def _download_segmented(mirrors: list[MirrorProbe], fd: int, bounds: list[tuple[int, int]], total: int,
+                        hasher: _StreamHasher, journal: _SegmentJournal, timeout: float, max_retries: int,
+                        backoff_factor: float, advance, throttle: Throttle):
+    """
+    Lädt die Segmente ``bounds`` ([Start, Ende)) reihum von den Mirrors; ihr
+    Fortschritt wird laufend im Journal festgehalten.
+    """
+    # Segment 0 setzt den bereits vorhandenen Dateianfang fort
+    hasher.written.setdefault(0, bounds[0][0])
+    journal.save(total, bounds, hasher, force=True)
+
+    def on_progress(n: int):
+        advance(n)
+        journal.save(total, bounds, hasher)
+
+    def worker(index: int, seg_start: int, seg_end: int):
+        segment = _segment_key(index, seg_start)
+        position = hasher.written.get(segment, seg_start)
+        last_error = None
+        for attempt in range(max_retries * len(mirrors)):
+            if position >= seg_end:
+                return
+            mirror = mirrors[(index + attempt) % len(mirrors)]
+            try:
+                _fetch_range(mirror.url, fd, position, seg_end, hasher, segment, timeout, on_progress, throttle)
+                return
+            except Exception as e:
+                last_error = e
+                position = hasher.written.get(segment, seg_start)
+                warning(f"⚠️ Segment {index} von {mirror.url} fehlgeschlagen: {e}")
+                time.sleep(min(backoff_factor ** (attempt // len(mirrors) + 1), 30))
+        raise RuntimeError(f"Segment {index} fehlgeschlagen. Letzter Fehler: {last_error}")
+
+    info(f"Segmentierter Download: {len(bounds)} Segmente über {len(mirrors)} Mirror(s)")
+    try:
+        with ThreadPoolExecutor(max_workers=len(bounds)) as pool:
+            for future in [pool.submit(worker, i, a, b) for i, (a, b) in enumerate(bounds)]:
+                future.result()
+    finally:
+        journal.save(total, bounds, hasher, force=True)
+
+
+class _CountingReader:
+    """Dateiobjekt-Wrapper, der gelesene (komprimierte) Bytes zählt."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        n = self.raw.readinto(buffer)
+        self.bytes_read += n
+        return n
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+TAR_SUFFIXES = (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".tar.zst", ".tzst", ".tar")
+
+
+def extract_archive(archive_path: Path, extract_to: Path, progress: Progress | None = None) -> Path:
+    """
+    Entpackt tar.{gz,bz2,xz,zst} in einem einzigen Durchlauf (Stream-Modus,
+    konstanter Speicher) sowie zip. Der Fortschritt folgt den gelesenen
+    komprimierten Bytes; am Ende wird der Durchsatz ausgegeben.
+    """
     archive_path = Path(archive_path)
     extract_to = Path(extract_to)
     extract_to.mkdir(parents=True, exist_ok=True)
@@ -99,41 +515,61 @@ def extract_archive(archive_path: Path, extract_to: Path) -> Path:
     name = archive_path.name.lower()
     info(f"Entpacke {archive_path} nach {extract_to} ...")
 
-    progress = Progress(
+    own_progress = progress is None
+    progress = progress or Progress(
         TextColumn("[bold blue]{task.fields[filename]}"),
         BarColumn(bar_width=None),
-        TextColumn("[green]{task.completed}/{task.total} Dateien"),
+        DownloadColumn(),
+        TransferSpeedColumn(),
         TimeRemainingColumn(),
     )
+    fields = {"filename": archive_path.name} if own_progress else {"filename": f"⇲ {archive_path.name}", "path": str(extract_to)}
+    compressed = archive_path.stat().st_size
+    unpacked = 0
+    start = time.perf_counter()
+
+    with progress if own_progress else nullcontext():
+        task = progress.add_task("extract", total=compressed, **fields)
+
+        if name.endswith(TAR_SUFFIXES):
+            with open(archive_path, "rb") as raw:
+                counter = _CountingReader(raw)
 
-    with progress:
-        if name.endswith((".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar")):
-            mode = "r"
-            if name.endswith(".tar.gz") or name.endswith(".tgz"):
-                mode = "r:gz"
-            elif name.endswith(".tar.bz2"):
-                mode = "r:bz2"
-            elif name.endswith(".tar.xz"):
-                mode = "r:xz"
-
-            with tarfile.open(archive_path, mode) as tar:
-                members = tar.getmembers()
-                task = progress.add_task("extract", filename=archive_path.name, total=len(members))
-                for member in members:
-                    tar.extract(member, path=extract_to)
-                    progress.update(task, advance=1)
+                def members(tar):
+                    nonlocal unpacked
+                    for member in tar:
+                        unpacked += member.size
+                        progress.update(task, completed=counter.bytes_read)
+                        # Im Stream-Modus kann tarfile für vorhandene Hardlink-Ziele
+                        # nicht zurückspulen – altes Ziel vorher entfernen
+                        target = extract_to / member.name
+                        if member.islnk() and (target.is_symlink() or target.is_file()):
+                            target.unlink()
+                        yield member
+
+                if name.endswith((".tar.zst", ".tzst")):
+                    with open_zstd_reader(counter) as stream, tarfile.open(fileobj=stream, mode="r|") as tar:
+                        tar.extractall(extract_to, members=members(tar))
+                else:
+                    with tarfile.open(fileobj=counter, mode="r|*") as tar:
+                        tar.extractall(extract_to, members=members(tar))
 
         elif name.endswith(".zip"):
             with zipfile.ZipFile(archive_path, "r") as zip_ref:
-                members = zip_ref.namelist()
-                task = progress.add_task("extract", filename=archive_path.name, total=len(members))
-                for member in members:
+                done = 0
+                for member in zip_ref.infolist():
                     zip_ref.extract(member, path=extract_to)
-                    progress.update(task, advance=1)
+                    unpacked += member.file_size
+                    done += member.compress_size
+                    progress.update(task, completed=done)
         else:
             raise ValueError(f"Unsupported archive format: {archive_path}")
 
-    success(f"Entpackt: {archive_path.name} → {extract_to}")
+        progress.update(task, completed=compressed)
+
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    success(f"Entpackt: {archive_path.name} → {extract_to} "
+            f"({compressed / elapsed / 2**20:.1f} MiB/s komprimiert, {unpacked / elapsed / 2**20:.1f} MiB/s entpackt)")
 
     dirs = [d for d in extract_to.iterdir() if d.is_dir()]
     if len(dirs) == 1:
@@ -145,3 +581,54 @@ def download_and_extract(urls, dest_dir: Path, extract_to: Path) -> Path:
     downloaded_file = download_file(urls, dest_dir)
     extracted_path = extract_archive(downloaded_file, extract_to)
     return extracted_path
+
+
+@dataclass
+class Artifact:
+    """Ein Download-Auftrag für download_many."""
+    urls: list[str] | str
+    dest_dir: Path
+    sha256: str | None = None
+    extract_to: Path | None = None
+
+
+def download_many(artifacts: list[Artifact], max_workers: int = 4, per_host: int = 2,
+                  max_bandwidth: float | None = None, extract_workers: int = 2, **kwargs) -> list[Path]:
+    """
+    Lädt mehrere Artefakte parallel in einer gemeinsamen Fortschrittsansicht.
+
+    ``per_host`` begrenzt gleichzeitige Verbindungen pro Host, ``max_bandwidth``
+    (Bytes/s) die Summe aller Downloads. Artefakte mit ``extract_to`` werden
+    entpackt, sobald ihr Download fertig ist – parallel zu laufenden Downloads.
+    Liefert pro Artefakt den entpackten bzw. heruntergeladenen Pfad.
+    """
+    throttle = Throttle(per_host=per_host, bandwidth=max_bandwidth)
+    results: list[Path | None] = [None] * len(artifacts)
+    errors: list[str] = []
+    progress = download_progress()
+
+    with progress, ThreadPoolExecutor(max_workers=max_workers) as downloads, \
+            ThreadPoolExecutor(max_workers=extract_workers) as extractions:
+        pending = {
+            downloads.submit(download_file, a.urls, a.dest_dir, sha256=a.sha256,
+                             progress=progress, throttle=throttle, **kwargs): (idx, "download")
+            for idx, a in enumerate(artifacts)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx, kind = pending.pop(future)
+                artifact = artifacts[idx]
+                try:
+                    path = future.result()
+                except Exception as e:
+                    errors.append(f"{artifact.urls}: {e}")
+                    continue
+                results[idx] = path
+                if kind == "download" and artifact.extract_to is not None:
+                    pending[extractions.submit(extract_archive, path, artifact.extract_to, progress)] = (idx, "extract")
+
+    if errors:
+        raise RuntimeError(f"{len(errors)} von {len(artifacts)} Downloads fehlgeschlagen: " + "; ".join(errors))
+    success(f"{len(artifacts)} Artefakte heruntergeladen")
+    return results
@@ -1,12 +1,327 @@
+import asyncio
+import itertools
 import os
+import re
+import signal
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
 from pathlib import Path
 from utils.logger import *
 
+# Zeilen, die pro Stream im Speicher bleiben (Rest nur im Log)
+RING_LINES = 200
+READ_CHUNK = 64 * 1024
+# Wartezeit zwischen SIGTERM und SIGKILL bei Timeout/Abbruch
+KILL_GRACE = 5.0
 
-def run_command(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", check_root=False) -> bool:
+
+class RingBuffer:
+    """Behält nur die letzten ``maxlen`` Zeilen eines Byte-Streams."""
+
+    def __init__(self, maxlen: int = RING_LINES):
+        self.lines: deque[bytes] = deque(maxlen=maxlen)
+        self._partial = b""
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Nimmt einen Block auf und liefert die darin abgeschlossenen Zeilen."""
+        parts = (self._partial + data).split(b"\n")
+        self._partial = parts.pop()
+        self.lines.extend(parts)
+        return parts
+
+    def text(self) -> str:
+        lines = list(self.lines) + ([self._partial] if self._partial else [])
+        return b"\n".join(lines).decode("utf-8", "replace")
+
+
+@dataclass
+class CommandResult:
+    args: list[str]
+    desc: str = ""
+    returncode: int | None = None
+    duration: float = 0.0
+    user_time: float = 0.0
+    sys_time: float = 0.0
+    # Spitzen-RSS in Bytes und Block-I/O (rusage aus wait4); unter Linux ist die
+    # RSS des Elternprozesses beim fork die Untergrenze
+    max_rss: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    stdout_tail: str = ""
+    stderr_tail: str = ""
+    # Vollständiges stdout, nur mit capture=True
+    stdout: bytes | None = None
+    log_file: Path | None = None
+    timed_out: bool = False
+    cancelled: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+    def check(self) -> "CommandResult":
+        """Wirft wie subprocess.run(check=True), wenn der Befehl nicht erfolgreich war."""
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.args, self.duration, output=self.stdout_tail, stderr=self.stderr_tail)
+        if not self.ok:
+            raise subprocess.CalledProcessError(self.returncode if self.returncode is not None else -1, self.args,
+                                                output=self.stdout_tail, stderr=self.stderr_tail)
+        return self
+
+
+class CommandExecutor:
+    """
+    Gemeinsamer Executor für externe Befehle (make, pacman, bsdtar, ...).
+
+    Alle Befehle laufen auf einer eigenen asyncio-Schleife in einem
+    Hintergrund-Thread und teilen sich ein Limit von ``jobs`` gleichzeitigen
+    Prozessen – egal aus wie vielen Threads/Stages sie kommen. stdout/stderr
+    landen blockweise in einer Logdatei pro Befehl (unter ``log_dir``) und
+    in Ringpuffern der letzten Zeilen statt unbegrenzt im Speicher.
+    Timeouts und Abbrüche beenden die ganze Prozessgruppe; das Ergebnis
+    enthält Exit-Code, Dauer, CPU-Zeit und Spitzen-RSS (rusage via wait4).
     """
-    Führt einen Befehl aus und zeigt stdout/stderr nach Ausführung.
+
+    def __init__(self, jobs: int | None = None, log_dir: Path | str | None = None, tail_lines: int = RING_LINES):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.log_dir = Path(log_dir) if log_dir else None
+        self.tail_lines = tail_lines
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    # -------------------------------------------------------------
+    # Event-Loop
+    # -------------------------------------------------------------
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.jobs)
+                self._thread = threading.Thread(target=self._loop.run_forever, name="command-executor", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = self._thread = self._semaphore = None
+
+    # -------------------------------------------------------------
+    # Öffentliche API
+    # -------------------------------------------------------------
+    def submit(self, args: list, **kwargs) -> Future:
+        """Startet einen Befehl und liefert ein concurrent.futures.Future mit dem CommandResult."""
+        # Span landet auf der Zeitleiste des aufrufenden Threads (unter dessen Stage)
+        coro = self._execute(list(map(str, args)), tid=threading.get_native_id(), **kwargs)
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, args: list, **kwargs) -> CommandResult:
+        """Blockierend; ein KeyboardInterrupt bricht den Befehl ab."""
+        future = self.submit(args, **kwargs)
+        try:
+            return future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            raise
+
+    async def run_async(self, args: list, **kwargs) -> CommandResult:
+        """Für Aufrufer mit eigener Event-Loop; Abbruch wird an den Prozess weitergegeben."""
+        return await asyncio.wrap_future(self.submit(args, **kwargs))
+
+    def run_many(self, commands: list[list], **kwargs) -> list[CommandResult]:
+        """Führt mehrere Befehle parallel (im Rahmen von ``jobs``) aus; Reihenfolge bleibt erhalten."""
+        futures = [self.submit(args, **kwargs) for args in commands]
+        try:
+            return [future.result() for future in futures]
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            raise
+
+    # -------------------------------------------------------------
+    # Ausführung
+    # -------------------------------------------------------------
+    def _log_path(self, desc: str, args: list[str]) -> Path | None:
+        if self.log_dir is None:
+            return None
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "-", desc or os.path.basename(args[0])).strip("-")[:60]
+        return self.log_dir / f"{next(self._seq):04d}-{slug or 'cmd'}.log"
+
+    async def _pump(self, pipe, ring: RingBuffer, log, echo: bool, capture: list[bytes] | None):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=READ_CHUNK)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        try:
+            while chunk := await reader.read(READ_CHUNK):
+                lines = ring.feed(chunk)
+                if log:
+                    log.write(chunk)
+                if capture is not None:
+                    capture.append(chunk)
+                if echo:
+                    for line in lines:
+                        print(line.decode("utf-8", "replace").rstrip())
+        finally:
+            transport.close()
+
+    @staticmethod
+    async def _reap(pid: int):
+        """Wartet auf das Prozessende (pidfd, sonst Thread) und liefert (status, rusage)."""
+        loop = asyncio.get_running_loop()
+        try:
+            fd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            fd = None
+        if fd is None:
+            _, status, rusage = await loop.run_in_executor(None, os.wait4, pid, 0)
+            return status, rusage
+        exited = loop.create_future()
+        loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(fd)
+            os.close(fd)
+        _, status, rusage = os.wait4(pid, 0)
+        return status, rusage
+
+    @staticmethod
+    async def _terminate(proc: subprocess.Popen, reaper: asyncio.Future, group: bool):
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                if group:
+                    os.killpg(proc.pid, sig)
+                else:
+                    os.kill(proc.pid, sig)
+            except ProcessLookupError:
+                return
+            try:
+                await asyncio.wait_for(asyncio.shield(reaper), KILL_GRACE)
+                return
+            except asyncio.TimeoutError:
+                continue
+
+    async def _execute(self, args: list[str], cwd: Path | str | None = None, env: dict | None = None,
+                       desc: str = "", timeout: float | None = None, echo: bool = False,
+                       capture: bool = False, interactive: bool = False, log: bool = True,
+                       tid: int = 0) -> CommandResult:
+        # interactive: stdin und Terminal bleiben erhalten (z.B. für sudo-Passwortabfragen),
+        # dafür keine eigene Prozessgruppe – beim Abbruch wird nur der Prozess selbst beendet.
+        # log=False: keine Logdatei (z.B. für viele kurze bsdtar-Aufrufe)
+
+        async with self._semaphore:
+            result = CommandResult(args, desc, log_file=self._log_path(desc, args) if log else None)
+            out, err = RingBuffer(self.tail_lines), RingBuffer(self.tail_lines)
+            captured: list[bytes] | None = [] if capture else None
+            log = None
+            if result.log_file:
+                result.log_file.parent.mkdir(parents=True, exist_ok=True)
+                log = open(result.log_file, "wb")
+                log.write(f"$ {' '.join(args)}\n".encode())
+
+            start = time.perf_counter()
+            try:
+                try:
+                    proc = subprocess.Popen(args, cwd=str(cwd) if cwd else None, env=env,
+                                            stdin=None if interactive else subprocess.DEVNULL,
+                                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                            start_new_session=not interactive)
+                except OSError as e:
+                    # Wie die Shell: 127 für "nicht gefunden"
+                    result.returncode = 127 if isinstance(e, FileNotFoundError) else 126
+                    result.stderr_tail = str(e)
+                    return result
+
+                reaper = asyncio.ensure_future(self._reap(proc.pid))
+                pumps = asyncio.gather(self._pump(proc.stdout, out, log, echo, captured),
+                                       self._pump(proc.stderr, err, log, echo, None))
+                try:
+                    await asyncio.wait_for(asyncio.shield(reaper), timeout)
+                except asyncio.TimeoutError:
+                    result.timed_out = True
+                    await self._terminate(proc, reaper, not interactive)
+                except asyncio.CancelledError:
+                    result.cancelled = True
+                    await self._terminate(proc, reaper, not interactive)
+                    raise
+                finally:
+                    status, rusage = await reaper
+                    proc.returncode = result.returncode = os.waitstatus_to_exitcode(status)
+                    await pumps
+                    result.duration = time.perf_counter() - start
+                    result.user_time, result.sys_time = rusage.ru_utime, rusage.ru_stime
+                    result.max_rss = rusage.ru_maxrss * 1024
+                    result.read_bytes, result.write_bytes = rusage.ru_inblock * 512, rusage.ru_oublock * 512
+                    result.stdout_tail, result.stderr_tail = out.text(), err.text()
+                    if captured is not None:
+                        result.stdout = b"".join(captured)
+                    tracer.record(Span(desc or os.path.basename(args[0]), "command", start, result.duration,
+                                       result.user_time + result.sys_time, result.read_bytes,
+                                       result.write_bytes, result.max_rss, tid,
+                                       {"cmd": " ".join(args)[:200], "returncode": result.returncode}))
+                return result
+            finally:
+                if log:
+                    log.close()
+
+
+_executor: CommandExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> CommandExecutor:
+    """Der gemeinsame Executor (wird bei Bedarf mit Standardwerten angelegt)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = CommandExecutor()
+        return _executor
+
+
+def configure_executor(jobs: int | None = None, log_dir: Path | str | None = None,
+                       tail_lines: int = RING_LINES) -> CommandExecutor:
+    """Ersetzt den gemeinsamen Executor (z.B. mit ``--jobs`` und Paths.logs)."""
+    global _executor
+    with _executor_lock:
+        old, _executor = _executor, CommandExecutor(jobs, log_dir, tail_lines)
+    if old:
+        old.close()
+    return _executor
+
+
+def _report(commands: list[str], result: CommandResult) -> bool:
+    cmdline = " ".join(map(str, commands))
+    if result.ok:
+        success(f"✔ '{cmdline}' erfolgreich abgeschlossen ({result.duration:.2f}s, "
+                f"max. {result.max_rss / 2**20:.0f} MiB).")
+        return True
+    if result.returncode == 127 and result.duration == 0:
+        error(f"❌ Fehler: Befehl '{commands[0]}' nicht gefunden.")
+    elif result.timed_out:
+        error(f"❌ Zeitüberschreitung bei '{cmdline}' nach {result.duration:.0f}s")
+    else:
+        error(f"❌ Fehler: '{cmdline}' mit Exit-Code {result.returncode}")
+    if result.log_file:
+        error(f"   Vollständige Ausgabe: {result.log_file}")
+    return False
+
+
+def run_command(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", check_root=False,
+                timeout: float | None = None) -> bool:
+    """
+    Führt einen Befehl über den gemeinsamen Executor aus und zeigt danach
+    die letzten Zeilen von stdout/stderr (vollständig in der Logdatei).
     Gibt True zurück, wenn erfolgreich, sonst False.
     """
     if check_root and os.geteuid() != 0:
@@ -14,26 +329,12 @@ def run_command(commands: list[str], cwd: Path | None = None, env: dict | None =
         return False
 
     print(f"\n--- {desc} ---")
-    cwd_str = str(cwd) if cwd else None
-
-    try:
-        result = subprocess.run(commands, cwd=cwd_str, env=env, capture_output=True, text=True)
-        if result.stdout:
-            print(result.stdout.strip())
-        if result.stderr:
-            print(result.stderr.strip())
-        if result.returncode == 0:
-            success(f"✔ '{' '.join(commands)}' erfolgreich abgeschlossen.")
-            return True
-        else:
-            error(f"❌ Fehler bei '{' '.join(commands)}': Exit Code {result.returncode}")
-            return False
-    except FileNotFoundError:
-        error(f"❌ Fehler: Befehl '{commands[0]}' nicht gefunden.")
-        return False
-    except Exception as e:
-        error(f"❌ Unbekannter Fehler bei '{' '.join(commands)}': {e}")
-        return False
+    result = get_executor().run(commands, cwd=cwd, env=env, desc=desc, timeout=timeout)
+    if result.stdout_tail:
+        print(result.stdout_tail.strip())
+    if result.stderr_tail:
+        print(result.stderr_tail.strip())
+    return _report(commands, result)
 
 
 def run(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", check_root=False) -> bool:
@@ -41,45 +342,17 @@ def run(commands: list[str], cwd: Path | None = None, env: dict | None = None, d
     return run_command(commands, cwd, env, desc, check_root)
 
 
-def run_command_live(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", check_root=False) -> bool:
+def run_command_live(commands: list[str], cwd: Path | None = None, env: dict | None = None, desc="Befehl ausführen", check_root=False,
+                     timeout: float | None = None) -> bool:
     """
-    Führt einen Befehl aus, zeigt stdout/stderr live.
-    Gibt True zurück bei Erfolg, False bei Fehler.
+    Führt einen Befehl über den gemeinsamen Executor aus und zeigt
+    stdout/stderr live. Gibt True zurück bei Erfolg, False bei Fehler.
     """
     if check_root and os.geteuid() != 0:
         error(f"Fehler: '{' '.join(commands)}' erfordert Rootrechte.")
         return False
 
     print(f"\n--- {desc} ---")
-    cwd_str = str(cwd) if cwd else None
-    env = env or os.environ.copy()
-
-    try:
-        process = subprocess.Popen(
-            commands,
-            cwd=cwd_str,
-            env=env,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
-        )
-
-        assert process.stdout is not None
-        for line in process.stdout:
-            print(line.rstrip())
-
-        retcode = process.wait()
-        if retcode == 0:
-            success(f"✔ '{' '.join(commands)}' erfolgreich abgeschlossen.")
-            return True
-        else:
-            error(f"❌ Fehler: '{' '.join(commands)}' mit Exit-Code {retcode}")
-            return False
-
-    except FileNotFoundError:
-        error(f"❌ Fehler: Befehl '{commands[0]}' nicht gefunden.")
-        return False
-    except Exception as e:
-        error(f"❌ Unbekannter Fehler bei '{' '.join(commands)}': {e}")
-        return False
+    result = get_executor().run(commands, cwd=cwd, env=env or os.environ.copy(), desc=desc,
+                                timeout=timeout, echo=True)
+    return _report(commands, result)
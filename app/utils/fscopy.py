@@ -0,0 +1,118 @@
+# utils/fscopy.py
+"""Datei-Kopien ohne Umweg über den Python-Speicher: Reflink, Hardlink, Kopie."""
+import errno
+import fcntl
+import os
+import shutil
+from pathlib import Path
+
+# ioctl FICLONE aus linux/fs.h
+FICLONE = 0x40049409
+
+# Fehler, bei denen auf die nächste Methode ausgewichen wird
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EMLINK}
+
+
+def reflink(src: Path | str, dst: Path | str) -> bool:
+    """Copy-on-Write-Klon (btrfs, xfs, bcachefs). False, wenn das Dateisystem es nicht kann."""
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o644)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except OSError as e:
+            os.close(fd)
+            os.unlink(dst)
+            if e.errno in _FALLBACK_ERRNOS:
+                return False
+            raise
+        os.close(fd)
+    shutil.copystat(src, dst)
+    return True
+
+
+def copy_file_data(src_fd: int, dst_fd: int, size: int) -> int:
+    """
+    Kopiert ``size`` Bytes im Kernel (copy_file_range, sonst sendfile),
+    ohne die Daten in den Python-Speicher zu holen. Liefert die kopierten Bytes.
+    """
+    copied = 0
+    use_range = hasattr(os, "copy_file_range")
+    while copied < size:
+        count = min(size - copied, 1 << 30)
+        if use_range:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, count)
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS | {errno.ENOSYS}:
+                    raise
+                use_range = False
+                continue
+        else:
+            n = os.sendfile(dst_fd, src_fd, None, count)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def copy_file(src: Path | str, dst: Path | str) -> int:
+    """
+    Binärsichere Kopie per copy_file_range/sendfile in Blöcken, ohne die Datei
+    in den Speicher zu laden; Modus und Zeitstempel werden übernommen.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        copied = copy_file_data(fsrc.fileno(), fdst.fileno(), os.fstat(fsrc.fileno()).st_size)
+    shutil.copystat(src, dst)
+    return copied
+
+
+def link_or_copy(src: Path | str, dst: Path | str, method: str = "auto") -> str:
+    """
+    Legt ``dst`` als Reflink, Hardlink oder Kopie von ``src`` an.
+    ``method``: auto | reflink | hardlink | copy. Gibt die verwendete Methode zurück.
+    Ein vorhandenes ``dst`` wird ersetzt.
+    """
+    src, dst = Path(src), Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.is_symlink() or dst.exists():
+        dst.unlink()
+
+    if method in ("auto", "reflink"):
+        if reflink(src, dst):
+            return "reflink"
+    if method in ("auto", "hardlink"):
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+    copy_file(src, dst)
+    return "copy"
+
+
+def copy_tree(src: Path | str, dst: Path | str, method: str = "auto") -> int:
+    """
+    Übernimmt einen Verzeichnisbaum nach ``dst`` (vorhandene Einträge werden ersetzt).
+    Symlinks bleiben Symlinks, Dateien laufen über link_or_copy(method).
+    Liefert die Anzahl übernommener Einträge.
+    """
+    src, dst = Path(src), Path(dst)
+    count = 0
+    for root, dirs, files in os.walk(src):
+        rel = Path(root).relative_to(src)
+        target_dir = dst / rel
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for name in dirs + files:
+            source = Path(root) / name
+            target = target_dir / name
+            if source.is_symlink():
+                if target.is_symlink() or target.is_file():
+                    target.unlink()
+                os.symlink(os.readlink(source), target)
+            elif source.is_file():
+                link_or_copy(source, target, method)
+            else:
+                continue
+            count += 1
+    return count
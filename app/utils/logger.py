@@ -1,6 +1,16 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import resource
 import sys
 import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
 
 # ANSI Reset
 RESET = "\033[0m"
@@ -54,19 +64,167 @@ class IconFormatter(logging.Formatter):
         color = NEON_COLORS.get(level, NEON_COLORS["INFO"])
         return f"{color}{icon} [{level.lower()}]{RESET} | {record.getMessage()}"
 
+# ---------------------------------------------------------------
+# Backend: Queue statt synchroner Handler
+# ---------------------------------------------------------------
+LOG_FILE = "nexuzcore-build.log"
+LOG_MAX_BYTES = 10 * 2**20
+LOG_BACKUPS = 5
+# Debug-Zeilen pro Meldungsart, bevor nur noch gezählt wird
+FLOOD_BURST = 50
+FLUSH_INTERVAL = 1.0
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Reicht Datensätze unformatiert weiter; Farben, Icons und %-Argumente erst im Listener."""
+
+    def prepare(self, record):
+        return record
+
+
+class FloodFilter(logging.Filter):
+    """
+    Lässt pro Meldungsart (``[tag]`` bzw. Text vor dem ersten ``:`` der
+    Vorlage) nur die ersten ``burst`` Debug-Zeilen durch und zählt den Rest.
+    """
+
+    def __init__(self, burst: int = FLOOD_BURST):
+        super().__init__()
+        self.burst = burst
+        self.counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(record: logging.LogRecord) -> str:
+        msg = str(record.msg)
+        if msg.startswith("[") and "]" in msg[:40]:
+            return msg[:msg.index("]") + 1]
+        return msg.split(":", 1)[0][:40]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = self.key(record)
+        with self._lock:
+            count = self.counts[key] = self.counts.get(key, 0) + 1
+        return count <= self.burst
+
+    def drain(self) -> dict[str, int]:
+        """Unterdrückte Zeilen pro Meldungsart seit dem letzten Aufruf."""
+        with self._lock:
+            suppressed = {key: count - self.burst for key, count in self.counts.items() if count > self.burst}
+            self.counts.clear()
+        return suppressed
+
+
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Sammelt formatierte Zeilen und schreibt sie blockweise (Warnungen sofort) mit Rotation."""
+
+    def __init__(self, filename: Path | str, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS,
+                 batch: int = 256):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        self.batch = batch
+        self._pending: list[str] = []
+
+    def emit(self, record):
+        try:
+            self._pending.append(self.format(record) + self.terminator)
+            if len(self._pending) >= self.batch or record.levelno >= logging.WARNING:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if not self._pending:
+                return
+            data = "".join(self._pending)
+            self._pending.clear()
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes and self.stream.seek(0, 2) + len(data) >= self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(data)
+            self.stream.flush()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """Leert die Puffer der Handler, sobald die Queue kurz still ist."""
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+
 # Logger Setup
 logger = logging.getLogger("nexuzcore")
 logger.setLevel(logging.DEBUG)
 
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setFormatter(IconFormatter())
+file_handler: BatchedRotatingFileHandler | None = None
 
-file_handler = logging.FileHandler(os.path.join(os.getcwd(), "nexuzcore-build.log"), encoding='utf-8')
-file_handler.setFormatter(logging.Formatter("[%(levelname)s] | %(message)s"))
+flood_filter = FloodFilter()
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+queue_handler = LazyQueueHandler(_queue)
+queue_handler.addFilter(flood_filter)
+_listener = FlushingQueueListener(_queue, console_handler, respect_handler_level=True)
+_listener.start()
 
-logger.handlers = [console_handler, file_handler]
+logger.handlers = [queue_handler]
 logger.propagate = False
 
+
+def configure_logging(log_dir: Path | str | None = None, level: str | int = logging.DEBUG,
+                      max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS):
+    """
+    Setzt das Level (niedrigere Meldungen kosten dann nichts) und schreibt
+    das Dateilog rotierend nach ``log_dir`` (z.B. Paths.logs).
+    """
+    global _listener, file_handler
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    if log_dir is None:
+        return
+    Path(log_dir).mkdir(parents=True, exist_ok=True)
+    handler = BatchedRotatingFileHandler(Path(log_dir) / LOG_FILE, max_bytes, backups)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(threadName)s | %(message)s"))
+    # Listener neu starten, damit der Handler-Wechsel keine Zeilen verliert
+    if _listener._thread is not None:
+        _listener.stop()
+    if file_handler:
+        file_handler.close()
+    file_handler = handler
+    _listener = FlushingQueueListener(_queue, console_handler, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def log_floods():
+    """Meldet zusammengefasste Debug-Fluten als Zähler."""
+    for key, count in sorted(flood_filter.drain().items(), key=lambda item: -item[1]):
+        logger.info(f"[log] {count} weitere Debug-Zeilen '{key}' zusammengefasst (erste {flood_filter.burst} angezeigt)")
+
+
+def shutdown_logging():
+    """Leert die Queue und alle Puffer (auch per atexit)."""
+    log_floods()
+    if _listener._thread is not None:
+        _listener.stop()
+    if file_handler:
+        file_handler.flush()
+
+
+atexit.register(shutdown_logging)
+
 # Eigene Levels
 SUCCESS_LEVEL = 25
 CREATE_LEVEL = 26
@@ -97,3 +255,133 @@ def test(msg, *args, **kwargs): logger.log(SUCCESS_LEVEL, f"🧪 {msg}", *args,
 
 # Direkter Zugriff
 log = logger
+
+
+# ---------------------------------------------------------------
+# Spans: Laufzeit-Profil als Chrome-Trace (chrome://tracing, Perfetto)
+# ---------------------------------------------------------------
+def _process_usage() -> tuple[float, int, int]:
+    """
+    CPU-Sekunden sowie gelesene/geschriebene Bytes des ganzen Prozesses – alle
+    Threads (Worker-Pools der Stages) und bereits beendete Unterprozesse.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    try:
+        with open("/proc/self/io") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+        return cpu, int(values["read_bytes"]), int(values["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return cpu, 0, 0
+
+
+@dataclass
+class Span:
+    name: str
+    cat: str
+    start: float
+    wall: float = 0.0
+    cpu: float = 0.0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    # Spitzen-RSS in Bytes (bei Stages: des ganzen Prozesses)
+    max_rss: int = 0
+    # Stage lief zeitgleich mit anderen; CPU/I/O enthalten dann auch deren Anteil
+    concurrent: bool = False
+    tid: int = 0
+    args: dict = field(default_factory=dict)
+
+
+class Tracer:
+    """
+    Sammelt Spans mit Wall- und CPU-Zeit, I/O-Bytes und Spitzen-RSS für
+    Stages (``span``) und Unterprozesse (``record`` aus deren rusage) und
+    schreibt sie als Chrome-Trace-JSON.
+
+    Stages arbeiten in Thread-Pools und starten Befehle, daher zählen bei
+    ihnen CPU und I/O des ganzen Prozesses. Überlappen sich Stages, lassen
+    sich die Werte nicht trennen – solche Spans sind als ``concurrent``
+    markiert.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: list[Span] = []
+        self._active: list[Span] = []
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "stage", **args):
+        item = Span(name, cat, time.perf_counter(), tid=threading.get_native_id(), args=args)
+        with self._lock:
+            for other in self._active:
+                other.concurrent = item.concurrent = True
+            self._active.append(item)
+        cpu, read, written = _process_usage()
+        try:
+            yield item
+        finally:
+            item.wall = time.perf_counter() - item.start
+            cpu_end, read_end, written_end = _process_usage()
+            item.cpu = cpu_end - cpu
+            item.read_bytes, item.write_bytes = read_end - read, written_end - written
+            item.max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            with self._lock:
+                self._active.remove(item)
+            self.record(item)
+
+    def write(self, path: Path | str) -> Path:
+        path = Path(path)
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "nexuzcore-build"}}]
+        for item in spans:
+            events.append({
+                "name": item.name,
+                "cat": item.cat,
+                "ph": "X",
+                "ts": round((item.start - self.origin) * 1e6),
+                "dur": round(item.wall * 1e6),
+                "pid": pid,
+                "tid": item.tid,
+                "args": {
+                    **item.args,
+                    "cpu_ms": round(item.cpu * 1000, 1),
+                    "read_bytes": item.read_bytes,
+                    "write_bytes": item.write_bytes,
+                    "max_rss_mib": round(item.max_rss / 2**20, 1),
+                    **({"concurrent": True} if item.concurrent else {}),
+                },
+            })
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+        return path
+
+    def summary(self, limit: int = 15):
+        """Tabelle der langsamsten Spans."""
+        with self._lock:
+            slowest = sorted(self.spans, key=lambda item: item.wall, reverse=True)[:limit]
+        if not slowest:
+            return
+        info(f"[trace] Langsamste {len(slowest)} Spans:")
+        info(f"  {'Span':<32} {'Art':<8} {'Wall':>8} {'CPU':>8} {'Gelesen':>9} {'Geschr.':>9} {'Max RSS':>9}")
+        for item in slowest:
+            name = item.name[:31] + "*" if item.concurrent else item.name[:32]
+            info(f"  {name:<32} {item.cat:<8} {item.wall:7.2f}s {item.cpu:7.2f}s "
+                 f"{item.read_bytes / 2**20:7.1f}MB {item.write_bytes / 2**20:7.1f}MB {item.max_rss / 2**20:7.0f}MB")
+        if any(item.concurrent for item in slowest):
+            info("  * lief parallel zu anderen Stages – CPU/I/O enthalten deren Anteil")
+
+
+tracer = Tracer()
+
+
+def span(name: str, cat: str = "stage", **args):
+    """Kontextmanager: misst einen Abschnitt als Span im globalen Tracer."""
+    return tracer.span(name, cat, **args)
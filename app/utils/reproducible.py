@@ -0,0 +1,55 @@
+# utils/reproducible.py
+import os
+import stat
+from pathlib import Path
+from typing import Iterable
+from utils.logger import debug
+
+# Besitzer für vom Builder selbst angelegte Einträge (FHS, BusyBox)
+ROOT_OWNER = (0, 0)
+
+
+def normalize_tree(root: Path | str, epoch: int, owner: tuple[int, int] | None = None,
+                   paths: Iterable[str] | None = None) -> int:
+    """
+    Begrenzt mtimes unter ``root`` auf ``epoch`` (SOURCE_DATE_EPOCH, wie
+    ``--clamp-mtime``) und setzt optional den Besitzer (nur mit Rootrechten).
+    Mit ``paths`` werden nur diese relativen Einträge angefasst, sonst der
+    ganze Baum. Ältere Zeitstempel (z.B. aus Paketen) bleiben erhalten.
+    Liefert die Anzahl geänderter Einträge.
+    """
+    root = os.fspath(root)
+    limit = epoch * 10**9
+    chown = owner is not None and os.geteuid() == 0
+    changed = 0
+
+    def fix(path: str, st: os.stat_result):
+        nonlocal changed
+        touched = False
+        if chown and (st.st_uid, st.st_gid) != owner:
+            os.lchown(path, *owner)
+            touched = True
+        if st.st_mtime_ns > limit:
+            os.utime(path, ns=(limit, limit), follow_symlinks=False)
+            touched = True
+        changed += touched
+
+    if paths is not None:
+        for rel in paths:
+            path = os.path.join(root, rel.lstrip("/"))
+            try:
+                fix(path, os.lstat(path))
+            except FileNotFoundError:
+                continue
+    else:
+        fix(root, os.lstat(root))
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    st = entry.stat(follow_symlinks=False)
+                    fix(entry.path, st)
+                    if stat.S_ISDIR(st.st_mode):
+                        stack.append(entry.path)
+    debug("[repro] %d Einträge unter %s normalisiert (Epoch %d)", changed, root, epoch)
+    return changed
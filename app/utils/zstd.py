@@ -0,0 +1,74 @@
+# utils/zstd.py
+"""
+Schmale Abstraktion über die verfügbare zstd-Bibliothek.
+
+Bevorzugt wird das Stdlib-Modul ``compression.zstd`` (Python >= 3.14),
+danach das Paket ``zstandard``. Ist keins vorhanden, ist ``HAVE_ZSTD`` False
+und Aufrufer müssen auf externe Tools (bsdtar/zstd) ausweichen; der Writer
+nutzt dann selbst das ``zstd``-Binary.
+"""
+import os
+import shutil
+import subprocess
+from typing import BinaryIO
+
+try:
+    from compression import zstd as _stdlib_zstd
+except ImportError:
+    _stdlib_zstd = None
+
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+
+HAVE_ZSTD = _stdlib_zstd is not None or _zstandard is not None
+
+# Lesepuffer für den Dekompressor – große Blöcke sparen Python-Aufrufe
+READ_SIZE = 1024 * 1024
+
+
+def open_zstd_reader(fileobj: BinaryIO, read_size: int = READ_SIZE) -> BinaryIO:
+    """Liefert einen streamenden, dekomprimierenden Reader über ``fileobj``."""
+    if _stdlib_zstd is not None:
+        return _stdlib_zstd.ZstdFile(fileobj, mode="rb")
+    if _zstandard is not None:
+        return _zstandard.ZstdDecompressor().stream_reader(fileobj, read_size=read_size, closefd=False)
+    raise RuntimeError("Kein zstd-Modul verfügbar (compression.zstd oder zstandard installieren)")
+
+
+class _ZstdProcessWriter:
+    """Komprimiert über ein ``zstd``-Kindprozess (wenn kein Python-Modul da ist)."""
+
+    def __init__(self, fileobj: BinaryIO, level: int, threads: int):
+        binary = shutil.which("zstd")
+        if binary is None:
+            raise RuntimeError("Kein zstd verfügbar (compression.zstd, zstandard oder zstd-Binary)")
+        fileobj.flush()
+        self._proc = subprocess.Popen([binary, "-q", "-c", f"-{level}", f"-T{threads}"],
+                                      stdin=subprocess.PIPE, stdout=fileobj)
+
+    def write(self, data) -> int:
+        self._proc.stdin.write(data)
+        return len(data)
+
+    def close(self):
+        self._proc.stdin.close()
+        if self._proc.wait() != 0:
+            raise RuntimeError(f"zstd mit Exit-Code {self._proc.returncode} beendet")
+
+
+def open_zstd_writer(fileobj: BinaryIO, level: int = 10, threads: int | None = None) -> BinaryIO:
+    """
+    Streamender, komprimierender Writer über ``fileobj`` (wird nicht geschlossen).
+    Komprimiert mit ``threads`` Worker-Threads; die Ausgabe ist für jede
+    Thread-Anzahl >= 1 identisch und damit reproduzierbar.
+    """
+    threads = max(1, threads or os.cpu_count() or 1)
+    if _stdlib_zstd is not None:
+        options = {_stdlib_zstd.CompressionParameter.compression_level: level,
+                   _stdlib_zstd.CompressionParameter.nb_workers: threads}
+        return _stdlib_zstd.ZstdFile(fileobj, mode="wb", options=options)
+    if _zstandard is not None:
+        return _zstandard.ZstdCompressor(level=level, threads=threads).stream_writer(fileobj, closefd=False)
+    return _ZstdProcessWriter(fileobj, level, threads)